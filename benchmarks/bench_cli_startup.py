@@ -0,0 +1,84 @@
+"""
+Check the startup time of the CLI against a budget.
+
+``namekoplus --help`` and ``namekoplus init`` run in fresh interpreters, and the fastest
+of several runs is compared to the one of an interpreter doing nothing, so the budgets
+only cover what namekoplus adds. Both commands must also leave the dependencies of the
+other commands unimported, which catches a module level import sneaking back in even
+where it is fast. Exits with 1 when a budget is exceeded, to be run as a CI step.
+
+Usage: python benchmarks/bench_cli_startup.py [runs]
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+# Seconds an invocation may take on top of a bare interpreter
+BUDGETS = {
+    '--help': 0.25,
+    'init': 0.3,
+}
+
+# Modules only the commands managing containers, rendering templates or talking to brokers need
+HEAVY_MODULES = ('python_on_whales', 'mako', 'shortuuid', 'nameko', 'kombu', 'eventlet', 'http.client')
+
+# Runs a command in-process to report the modules it loaded
+CHECK_IMPORTS = '''
+import sys
+from namekoplus.command import cli
+try:
+    cli.main(sys.argv[1:], prog_name='namekoplus')
+except SystemExit:
+    pass
+print('heavy:' + ','.join(name for name in {heavy!r} if name in sys.modules))
+'''.format(heavy=HEAVY_MODULES)
+
+
+def fastest(args, runs, setup=None):
+    best = None
+    for _ in range(runs):
+        extra = setup() if setup else []
+        started_at = time.perf_counter()
+        subprocess.run([sys.executable] + args + extra, stdout=subprocess.DEVNULL, check=True)
+        elapsed = time.perf_counter() - started_at
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    workdir = tempfile.mkdtemp()
+    counter = iter(range(runs * 2))
+
+    def new_directory():
+        return ['-d', os.path.join(workdir, 'service{}'.format(next(counter)))]
+
+    commands = {
+        '--help': (['--help'], None),
+        'init': (['init', '-t', 'all'], new_directory),
+    }
+
+    baseline = fastest(['-c', 'pass'], runs)
+    print(f'{"command":<10} {"total":>9} {"added":>9} {"budget":>9}  heavy imports')
+    failed = False
+    for name, (args, setup) in commands.items():
+        total = fastest(['-m', 'namekoplus.command'] + args, runs, setup)
+        added = total - baseline
+
+        imports_args = args + (setup() if setup else [])
+        output = subprocess.run([sys.executable, '-c', CHECK_IMPORTS] + imports_args, capture_output=True,
+                                text=True, check=True).stdout
+        heavy = output.rsplit('heavy:', 1)[-1].strip()
+
+        over = added > BUDGETS[name] or heavy
+        failed = failed or over
+        print(f'{name:<10} {total * 1000:>7.1f}ms {added * 1000:>7.1f}ms {BUDGETS[name] * 1000:>7.1f}ms  '
+              f'{heavy or "-"}{"  OVER BUDGET" if over else ""}')
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
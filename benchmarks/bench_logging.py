@@ -0,0 +1,95 @@
+"""
+Compare entrypoint latency with the synchronous and the queued init_logger.
+
+Greenthreads stand in for entrypoints: each call logs a few JSON lines around a short
+green sleep. Records go to a stream whose writes block like a busy stdout pipe.
+
+Usage: python benchmarks/bench_logging.py [seconds] [write_delay_ms]
+"""
+
+import eventlet
+eventlet.monkey_patch()  # noqa: E402
+
+import logging
+import sys
+import time
+
+from eventlet import patcher
+
+from namekoplus import init_logger
+
+blocking_sleep = patcher.original('time').sleep
+
+CONCURRENCY = 50
+LINES_PER_CALL = 5
+
+
+class SlowStream:
+    """
+    A stream whose writes block the calling OS thread, as a full pipe does.
+    """
+
+    def __init__(self, write_delay):
+        self.write_delay = write_delay
+        self.writes = 0
+
+    def write(self, data):
+        self.writes += 1
+        blocking_sleep(self.write_delay)
+
+    def flush(self):
+        pass
+
+
+def run(name, duration, write_delay, **logger_options):
+    stream = SlowStream(write_delay)
+    root = init_logger(stream=stream, **logger_options)
+    root.setLevel(logging.INFO)
+    handler = root.handlers[-1]
+    log = logging.getLogger('bench.entrypoint')
+    latencies = []
+
+    def entrypoint(idx):
+        log.info('handling call %d', idx, extra={'call': idx})
+        eventlet.sleep(0.001)
+        for line in range(LINES_PER_CALL - 1):
+            log.info('step %d of call %d', line, idx)
+
+    def worker():
+        deadline = time.perf_counter() + duration
+        idx = 0
+        while time.perf_counter() < deadline:
+            started_at = time.perf_counter()
+            entrypoint(idx)
+            latencies.append(time.perf_counter() - started_at)
+            idx += 1
+
+    pool = eventlet.GreenPool(CONCURRENCY)
+    for _ in range(CONCURRENCY):
+        pool.spawn(worker)
+    pool.waitall()
+    handler.flush()
+    root.removeHandler(handler)
+    handler.close()
+
+    latencies.sort()
+
+    def ms(quantile):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * quantile))] * 1000
+
+    dropped = getattr(handler, 'dropped', 0)
+    print(f'{name:<20} {len(latencies) / duration:>9,.0f} calls/s  p50 {ms(0.5):7.2f}ms  p99 {ms(0.99):7.2f}ms  '
+          f'{stream.writes:>7} writes  {dropped:>7} dropped')
+
+
+def main():
+    duration = float(sys.argv[1]) if len(sys.argv) > 1 else 3
+    write_delay = (float(sys.argv[2]) if len(sys.argv) > 2 else 0.2) / 1000
+    run('sync', duration, write_delay)
+    run('queued', duration, write_delay, queued=True)
+    run('queued, block', duration, write_delay, queued=True, policy='block', max_queue=1000)
+    run('queued, sampled', duration, write_delay, queued=True, sampling={'bench': 0.1})
+
+
+if __name__ == '__main__':
+    main()
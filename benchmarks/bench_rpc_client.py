@@ -0,0 +1,112 @@
+"""
+Compare the per-call cost of RPC clients for callers outside nameko.
+
+- per-request: a standalone ClusterRpcClient started for every call, as a web app
+  creating one per request does
+- shared: one standalone ClusterRpcClient reused by a single caller
+- pool: the RpcClientPool of init_rpc_pool
+
+Each client calls an echo service sequentially, then from concurrent callers.
+Reported are the latency percentiles per call and the throughput.
+
+Usage: python benchmarks/bench_rpc_client.py [calls] [amqp_uri] [callers]
+
+Without a broker, pass memory:// to run everything in process. It has no network round
+trips, so it understates what the pool saves against a remote RabbitMQ.
+"""
+
+import eventlet
+eventlet.monkey_patch()  # noqa: E402
+
+import sys
+import threading
+import time
+
+from nameko import config
+from nameko.rpc import rpc
+from nameko.runners import ServiceRunner
+from nameko.standalone.rpc import ClusterRpcClient
+
+from namekoplus import init_rpc_pool, register_memory_transport
+
+
+class EchoService:
+    name = 'bench_echo'
+
+    @rpc
+    def echo(self, value):
+        return value
+
+
+def per_request(payload):
+    with ClusterRpcClient() as client:
+        return client.bench_echo.echo(payload)
+
+
+def percentile(samples, pct):
+    return samples[min(len(samples) - 1, int(len(samples) * pct))]
+
+
+def sequential(call, calls, payload):
+    call(payload)  # warm up
+    samples = []
+    for _ in range(calls):
+        started_at = time.perf_counter()
+        call(payload)
+        samples.append(time.perf_counter() - started_at)
+    samples.sort()
+    return sum(samples) / len(samples), percentile(samples, 0.5), percentile(samples, 0.99)
+
+
+def concurrent(call, calls, payload, callers):
+    def caller():
+        for _ in range(calls // callers):
+            call(payload)
+
+    threads = [threading.Thread(target=caller) for _ in range(callers)]
+    started_at = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return (calls // callers * callers) / (time.perf_counter() - started_at)
+
+
+def main():
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    uri = sys.argv[2] if len(sys.argv) > 2 else 'memory://'
+    callers = int(sys.argv[3]) if len(sys.argv) > 3 else 10
+    payload = {'id': 42, 'name': 'namekoplus'}
+    if uri.startswith('memory://'):
+        register_memory_transport()
+
+    with config.patch({'AMQP_URI': uri}):
+        runner = ServiceRunner()
+        runner.add_service(EchoService)
+        runner.start()
+        try:
+            shared = ClusterRpcClient()
+            shared_client = shared.start()
+            pool = init_rpc_pool(size=callers)
+
+            print(f'{"client":<14} {"mean":>10} {"p50":>10} {"p99":>10} {"calls/s":>10}')
+            cases = [
+                ('per-request', per_request, True),
+                # Not thread-safe, so only called sequentially
+                ('shared', shared_client.bench_echo.echo, False),
+                ('pool', pool.bench_echo.echo, True),
+            ]
+            for name, call, thread_safe in cases:
+                mean, p50, p99 = sequential(call, calls, payload)
+                rate = f'{concurrent(call, calls, payload, callers):>10.0f}' if thread_safe else f'{"-":>10}'
+                print(f'{name:<14} {mean * 1e3:>8.2f}ms {p50 * 1e3:>8.2f}ms {p99 * 1e3:>8.2f}ms {rate}')
+            print(f'pool after the run: {pool.stats()}')
+
+            shared.stop()
+            pool.close()
+        finally:
+            runner.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Compare the json, orjson and msgpack serializers, with and without zlib compression.
+
+Payloads stand in for typical messages: the arguments of a small RPC call, a page of
+records with dates and decimals, a large export of such records and one of records
+with plain JSON types only. Dates and decimals travel in kombu's type envelopes, whose
+decoding costs the same with every serializer. Reported are the encode and decode
+times per message and the message size on the wire.
+
+Usage: python benchmarks/bench_serializers.py [seconds_per_case]
+"""
+
+import random
+import sys
+import time
+import zlib
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from kombu.utils.json import dumps as json_dumps, loads as json_loads
+
+from namekoplus.chassis.serialization import msgpack_dumps, msgpack_loads, orjson_dumps, orjson_loads
+
+SERIALIZERS = {
+    'json': (json_dumps, json_loads),
+    'orjson': (orjson_dumps, orjson_loads),
+    'msgpack': (msgpack_dumps, msgpack_loads),
+}
+
+
+def plain_record(idx):
+    item = record(idx)
+    return dict(item, price=float(item['price']), created_at=item['created_at'].isoformat())
+
+
+def record(idx):
+    return {
+        'id': idx,
+        'sku': 'SKU-{:08d}'.format(idx),
+        'title': 'Item number {} with a reasonably long title'.format(idx),
+        'price': Decimal('{}.{:02d}'.format(random.randint(1, 999), random.randint(0, 99))),
+        'quantity': random.randint(0, 100),
+        'created_at': datetime(2023, 1, 1) + timedelta(minutes=idx),
+        'tags': random.sample(['new', 'sale', 'clearance', 'popular', 'limited'], 2),
+        'active': bool(idx % 2),
+        'rating': round(random.random() * 5, 2),
+    }
+
+
+def payloads():
+    random.seed(0)
+    return {
+        'small rpc args': {'args': ['user-42', 3], 'kwargs': {'include_details': True, 'locale': 'en_US'}},
+        'page of 100 records': {'result': [record(idx) for idx in range(100)], 'error': None},
+        'export of 10k records': {'result': [record(idx) for idx in range(10000)], 'error': None},
+        'export of 10k plain': {'result': [plain_record(idx) for idx in range(10000)], 'error': None},
+    }
+
+
+def timed(func, arg, duration):
+    calls = 0
+    started_at = time.perf_counter()
+    deadline = started_at + duration
+    while time.perf_counter() < deadline:
+        func(arg)
+        calls += 1
+    return (time.perf_counter() - started_at) / calls
+
+
+def main():
+    duration = float(sys.argv[1]) if len(sys.argv) > 1 else 1
+    print(f'{"payload":<22} {"serializer":<16} {"encode":>10} {"decode":>10} {"bytes":>10}')
+    for payload_name, payload in payloads().items():
+        for name, (dumps, loads) in SERIALIZERS.items():
+            body = dumps(payload)
+            if isinstance(body, str):
+                body = body.encode('utf-8')
+            assert loads(body) == loads(dumps(payload))
+
+            encode = timed(dumps, payload, duration)
+            decode = timed(loads, body, duration)
+            print(f'{payload_name:<22} {name:<16} {encode * 1e6:>8.1f}us {decode * 1e6:>8.1f}us {len(body):>10,}')
+
+            compressed = zlib.compress(body)
+            encode += timed(zlib.compress, body, duration)
+            decode += timed(zlib.decompress, compressed, duration)
+            print(f'{"":<22} {name + " + zlib":<16} {encode * 1e6:>8.1f}us {decode * 1e6:>8.1f}us '
+                  f'{len(compressed):>10,}')
+
+
+if __name__ == '__main__':
+    main()
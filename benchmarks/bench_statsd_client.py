@@ -0,0 +1,62 @@
+"""
+Compare the plain statsd client with the aggregating one returned by init_batched_statsd.
+
+Usage: python benchmarks/bench_statsd_client.py [calls]
+"""
+
+import socket
+import sys
+import threading
+import time
+
+from namekoplus import init_statsd, init_batched_statsd
+
+
+def udp_sink():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(('127.0.0.1', 0))
+    sock.settimeout(0.5)
+    counts = {'datagrams': 0, 'metrics': 0}
+
+    def receive():
+        while True:
+            try:
+                data = sock.recv(65535)
+            except socket.timeout:
+                return
+            counts['datagrams'] += 1
+            counts['metrics'] += data.count(b'\n') + 1
+
+    thread = threading.Thread(target=receive, daemon=True)
+    thread.start()
+    return sock.getsockname()[1], thread, counts
+
+
+def run(name, factory, calls):
+    port, receiver, counts = udp_sink()
+    statsd = factory(port)
+
+    @statsd.timer('bench')
+    def entrypoint():
+        statsd.incr('bench.calls')
+
+    start = time.perf_counter()
+    for _ in range(calls):
+        entrypoint()
+    if hasattr(statsd, 'stop'):
+        statsd.stop()
+    elapsed = time.perf_counter() - start
+    receiver.join()
+
+    print(f'{name:<12} {calls / elapsed:>12,.0f} calls/s  {elapsed * 1e6 / calls:>8.2f} us/call  '
+          f'{counts["datagrams"]:>8} datagrams  {counts["metrics"]:>8} metrics received')
+
+
+def main():
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    run('plain', lambda port: init_statsd('bench', '127.0.0.1', port), calls)
+    run('batched', lambda port: init_batched_statsd('bench', '127.0.0.1', port), calls)
+
+
+if __name__ == '__main__':
+    main()
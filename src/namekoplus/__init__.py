@@ -1 +1 @@
-from .chassis.chassis import *
\ No newline at end of file
+from .chassis.chassis import *
@@ -1,3 +1,4 @@
+<%! import json %>\
 {
   "annotations": {
     "list": [
@@ -23,112 +24,17 @@
   },
   "editable": true,
   "fiscalYearStartMonth": 0,
-  "graphTooltip": 0,
-  "id": 20,
+  "graphTooltip": 1,
+  "id": null,
   "links": [],
   "liveNow": false,
-  "panels": [
-% for grafana_dict in grafana_list:
-    {
-      "aliasColors": {},
-      "bars": false,
-      "dashLength": 10,
-      "dashes": false,
-      "datasource": {
-        "type": "statsd"
-      },
-      "fill": 1,
-      "fillGradient": 0,
-      "gridPos": {
-        "h": 12,
-        "w": 12,
-        "x": 0,
-        "y": 0
-      },
-      "hiddenSeries": false,
-      "id": ${loop.index},
-      "legend": {
-        "alignAsTable": true,
-        "avg": true,
-        "current": true,
-        "hideEmpty": false,
-        "hideZero": false,
-        "max": true,
-        "min": true,
-        "rightSide": false,
-        "show": true,
-        "total": false,
-        "values": true
-      },
-      "lines": true,
-      "linewidth": 1,
-      "links": [],
-      "nullPointMode": "null",
-      "options": {
-        "alertThreshold": true
-      },
-      "percentage": false,
-      "pluginVersion": "8.5.5",
-      "pointradius": 5,
-      "points": false,
-      "renderer": "flot",
-      "seriesOverrides": [],
-      "spaceLength": 10,
-      "stack": false,
-      "steppedLine": false,
-      "targets": [
-        {
-          "expr": "${grafana_dict['stat_name']}",
-          "format": "time_series",
-          "hide": false,
-          "intervalFactor": 2,
-          "legendFormat": "${grafana_dict['stat_name']} {{quantile}}",
-          "refId": "A"
-        }
-      ],
-      "thresholds": [],
-      "timeRegions": [],
-      "title": "${service_name} | ${grafana_dict['stat_name']}",
-      "tooltip": {
-        "shared": true,
-        "sort": ${loop.index},
-        "value_type": "individual"
-      },
-      "type": "graph",
-      "xaxis": {
-        "mode": "time",
-        "show": true,
-        "values": []
-      },
-      "yaxes": [
-        {
-          "format": "short",
-          "logBase": 1,
-          "show": true
-        },
-        {
-          "format": "short",
-          "logBase": 1,
-          "show": true
-        }
-      ],
-      "yaxis": {
-        "align": false
-      }
-
-  % if grafana_dict['is_last'] == 1:
-    }
-  % else:
-    },
-  % endif
-% endfor
-  ],
+  "panels": ${json.dumps(panels, indent=2).replace(chr(10), chr(10) + '  ')},
   "refresh": "3s",
   "schemaVersion": 36,
   "style": "dark",
-  "tags": [],
+  "tags": ["namekoplus"],
   "templating": {
-    "list": []
+    "list": ${json.dumps(variables, indent=2).replace(chr(10), chr(10) + '    ')}
   },
   "time": {
     "from": "now-12h",
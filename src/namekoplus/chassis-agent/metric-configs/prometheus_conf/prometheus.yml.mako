@@ -0,0 +1,61 @@
+#
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+global:
+  scrape_interval: 3s     # By default, scrape targets every 15 seconds.
+
+  # Attach these labels to any time series or alerts when communicating with
+  # external systems (federation, remote storage, Alertmanager).
+  external_labels:
+    stack: "statsd"
+
+
+# A scrape configuration containing exactly one endpoint to scrape:
+# Here it's Prometheus itself.
+scrape_configs:
+  # The job name is added as a label `job=<job_name>` to any timeseries scraped from this config.
+  - job_name: "prometheus"
+    # Override the global default and scrape targets from this job every 5 seconds.
+    scrape_interval: 3s
+    static_configs:
+      - targets: ["localhost:9090"]
+
+% if include_statsd_exporter:
+  - job_name: 'statsd_exporter'
+    scrape_interval: 3s
+    static_configs:
+      - targets: ['statsd-exporter:9102']
+        labels:
+          exporter: 'statsd'
+% endif
+
+  # Per-queue metrics of RabbitMQ's prometheus plugin, for the queue depth and consumer lag panels
+  - job_name: 'rabbitmq'
+    scrape_interval: 15s
+    metrics_path: /metrics/detailed
+    params:
+      family: ['queue_coarse_metrics', 'queue_consumer_count']
+    static_configs:
+      - targets: ['host.docker.internal:15692']
+
+  # Services exposing their own /metrics endpoint through namekoplus.init_prometheus_metrics
+  - job_name: 'namekoplus_services'
+    scrape_interval: 3s
+    static_configs:
+      - targets: [${', '.join("'{}'".format(target) for target in targets)}]
+        labels:
+          exporter: 'namekoplus'
\ No newline at end of file
@@ -1,12 +1,21 @@
 mappings:
 % for config_dict in config_list:
 - match: "${config_dict['statsd_prefix']}.${config_dict['stat_name']}"
-  observer_type: summary
-  name: "${config_dict['stat_name']}"
+  % if config_dict.get('metric_type', 'timer') == 'timer':
+  observer_type: ${config_dict.get('observer_type', 'summary')}
+  % endif
+  name: "${config_dict.get('metric_name', config_dict['stat_name'])}"
   labels:
     provider: "$2"
     outcome: "$3"
     job: "${config_dict['statsd_prefix']}"
+  % for label, value in config_dict.get('labels', {}).items():
+    ${label}: "${value}"
+  % endfor
+  % if config_dict.get('metric_type', 'timer') == 'timer' and config_dict.get('observer_type') == 'histogram':
+  histogram_options:
+    buckets: [${', '.join('{:g}'.format(bucket) for bucket in config_dict['buckets'])}]
+  % elif config_dict.get('metric_type', 'timer') == 'timer':
   summary_options:
     quantiles:
       - quantile: 0.99
@@ -20,4 +29,5 @@ mappings:
     max_summary_age: 30s
     summary_age_buckets: 3
     stream_buffer_size: 1000
+  % endif
 % endfor
\ No newline at end of file
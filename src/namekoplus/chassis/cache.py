@@ -0,0 +1,298 @@
+"""
+In-process response caching for RPC entrypoints and ServiceRpc calls.
+
+Entries live in a size bounded LRU cache, optionally with a TTL. Concurrent misses
+for one key are coalesced: the first caller computes the value and the others wait
+for it, so a burst of identical requests results in a single call.
+
+Callers get a deep copy of the cached response, so one that mutates it does not
+change what the others get. Responses often depend on the context data of the
+call, e.g. its language or user, so the values of ``context_keys`` are part of
+the cache key. ``cached_rpc`` reads them from a ``CallContextData`` dependency of
+the service.
+"""
+
+import copy
+import inspect
+import json
+import threading
+from functools import wraps
+
+from cachetools import LRUCache, TTLCache
+from nameko.constants import AUTH_TOKEN_CONTEXT_KEY, LANGUAGE_CONTEXT_KEY, USER_ID_CONTEXT_KEY
+from nameko.extensions import DependencyProvider
+from nameko.rpc import ServiceRpc
+
+DEFAULT_CONTEXT_KEYS = (LANGUAGE_CONTEXT_KEY, USER_ID_CONTEXT_KEY, AUTH_TOKEN_CONTEXT_KEY)
+
+
+class _EvictionCounting:
+
+    def __init__(self, *args, on_evict=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.on_evict = on_evict
+
+    def popitem(self):
+        # Cache only calls popitem to make room for a new entry
+        item = super().popitem()
+        if self.on_evict is not None:
+            self.on_evict()
+        return item
+
+    def clear(self):
+        # MutableMapping.clear() goes through popitem, which is not an eviction
+        for key in list(self.keys()):
+            self.pop(key, None)
+
+
+class _LRUCache(_EvictionCounting, LRUCache):
+    pass
+
+
+class _TTLCache(_EvictionCounting, TTLCache):
+    pass
+
+
+_MISSING = object()
+
+
+class _InFlight:
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+def make_key(*parts):
+    """
+    Build a hashable cache key from JSON-like arguments, as received over AMQP.
+    """
+    return json.dumps(parts, sort_keys=True, default=repr)
+
+
+class CallContextData(DependencyProvider):
+    """
+    Inject the context data of the call, which ``cached_rpc`` methods key their responses on.
+    """
+
+    def get_dependency(self, worker_ctx):
+        return worker_ctx.context_data
+
+
+def context_data_attr(service_cls):
+    """
+    The name of the ``CallContextData`` dependency declared on ``service_cls``.
+    """
+    for name, value in inspect.getmembers(service_cls):
+        if isinstance(value, CallContextData):
+            return name
+    raise TypeError('{} has no CallContextData dependency, declare one, e.g. '
+                    '`context_data = init_call_context_data()`'.format(service_cls.__name__))
+
+
+def context_values(context_data, context_keys):
+    return [context_data.get(key) for key in context_keys]
+
+
+class ResponseCache:
+    """
+    A thread-safe LRU cache with optional TTL and request coalescing.
+
+    Hits, misses and evictions are counted as ``<name>.hit``, ``<name>.miss`` and
+    ``<name>.eviction`` on the given statsd client.
+
+    :Parameters:
+        name : str
+            Prefix of the stats sent to statsd
+        maxsize : int
+            Maximum number of cached responses
+        ttl : float
+            Seconds a response stays valid, ``None`` to keep it until it is evicted
+        statsd : statsd.StatsClient
+            Client the counters are sent to, optional
+        copy : bool
+            Whether callers get a deep copy of the cached response; only turn it off
+            for responses nobody mutates, e.g. strings and numbers
+    """
+
+    def __init__(self, name, maxsize=1024, ttl=60, statsd=None, copy=True):
+        self.name = name
+        self.statsd = statsd
+        self.copy = copy
+        self.hits = self.misses = self.evictions = 0
+        if ttl is None:
+            self._cache = _LRUCache(maxsize, on_evict=self._evicted)
+        else:
+            self._cache = _TTLCache(maxsize, ttl, on_evict=self._evicted)
+        self._lock = threading.Lock()
+        self._in_flight = {}
+
+    def _count(self, stat):
+        if self.statsd is not None:
+            self.statsd.incr('{}.{}'.format(self.name, stat))
+
+    def _evicted(self):
+        self.evictions += 1
+        self._count('eviction')
+
+    def _copy(self, value):
+        return copy.deepcopy(value) if self.copy else value
+
+    def get_or_call(self, key, fn, *args, **kwargs):
+        """
+        Return the cached response for ``key``, or compute it with ``fn(*args, **kwargs)``.
+
+        Errors are not cached, they are raised to the caller and every caller waiting on it.
+        """
+        with self._lock:
+            value = self._cache.get(key, _MISSING)
+            if value is not _MISSING:
+                self.hits += 1
+                in_flight = None
+            else:
+                in_flight = self._in_flight.get(key)
+                leader = in_flight is None
+                if leader:
+                    in_flight = self._in_flight[key] = _InFlight()
+                    self.misses += 1
+                else:
+                    # Served by the call already in flight
+                    self.hits += 1
+
+        if in_flight is None:
+            self._count('hit')
+            return self._copy(value)
+
+        if not leader:
+            in_flight.done.wait()
+            if in_flight.error is not None:
+                raise in_flight.error
+            self._count('hit')
+            return self._copy(in_flight.value)
+
+        self._count('miss')
+        try:
+            value = fn(*args, **kwargs)
+        except Exception as exc:
+            in_flight.error = exc
+            raise
+        else:
+            # The leader's caller gets the response itself, the cache keeps a copy
+            in_flight.value = self._copy(value)
+            with self._lock:
+                self._cache[key] = in_flight.value
+            return value
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+            in_flight.done.set()
+
+    def invalidate(self, key=None):
+        """
+        Drop the response cached for ``key``, or every response without a key.
+        """
+        with self._lock:
+            if key is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(key, None)
+
+    def __len__(self):
+        return len(self._cache)
+
+
+def cached_rpc(ttl=60, maxsize=1024, statsd=None, name=None, context_keys=DEFAULT_CONTEXT_KEYS, copy=True):
+    """
+    Serve repeated calls of an ``@rpc`` method with the same arguments from an in-process cache.
+
+    Every worker of the service in this process shares the cache, so only use it for
+    methods whose response depends on their arguments and the ``context_keys`` of the
+    context data alone. The context data is read from the ``CallContextData`` dependency
+    of the service, so it is right in greenthreads the worker spawns too::
+
+        context_data = init_call_context_data()
+
+        @rpc
+        @cached_rpc(ttl=30, statsd=statsd)
+        def get_book(self, book_id):
+            ...
+
+    The cache is reachable as ``<method>.cache``, e.g. to ``invalidate()`` it.
+    """
+    def decorator(fn):
+        cache = ResponseCache(name or 'cache.{}'.format(fn.__name__), maxsize=maxsize, ttl=ttl, statsd=statsd,
+                              copy=copy)
+        attrs = {}
+
+        @wraps(fn)
+        def wrapper(service, *args, **kwargs):
+            context = []
+            if context_keys:
+                service_cls = type(service)
+                attr = attrs.get(service_cls)
+                if attr is None:
+                    attr = attrs[service_cls] = context_data_attr(service_cls)
+                context = context_values(getattr(service, attr), context_keys)
+            return cache.get_or_call(make_key(args, kwargs, context), fn, service, *args, **kwargs)
+
+        wrapper.cache = cache
+        return wrapper
+    return decorator
+
+
+class CachedClient:
+    """
+    A ServiceRpc client answering the cached methods from the cache, without an AMQP round trip.
+    """
+
+    def __init__(self, client, cache, methods, context=()):
+        self._client = client
+        self._cache = cache
+        self._methods = methods
+        self._context = list(context)
+
+    def __getattr__(self, name):
+        method = getattr(self._client, name)
+        if self._methods is not None and name not in self._methods:
+            return method
+
+        def call(*args, **kwargs):
+            return self._cache.get_or_call(make_key(name, args, kwargs, self._context), method, *args, **kwargs)
+        call.call_async = method.call_async
+        return call
+
+
+class CachedServiceRpc(ServiceRpc):
+    """
+    ServiceRpc caching the responses of the target service in process.
+
+    :Parameters:
+        target_service : str
+            Target service name
+        methods : list
+            Methods whose responses are cached, ``None`` caches all of them
+        ttl : float
+            Seconds a response stays valid, ``None`` to keep it until it is evicted
+        maxsize : int
+            Maximum number of cached responses
+        statsd : statsd.StatsClient
+            Client the hit/miss/eviction counters are sent to, optional
+        context_keys : list
+            Keys of the context data sent along with the calls whose values the responses depend on
+        copy : bool
+            Whether callers get a deep copy of the cached response
+    """
+
+    def __init__(self, target_service, methods=None, ttl=60, maxsize=1024, statsd=None,
+                 context_keys=DEFAULT_CONTEXT_KEYS, copy=True, **kwargs):
+        self.methods = set(methods) if methods is not None else None
+        self.context_keys = tuple(context_keys)
+        self.cache = ResponseCache('cache.rpc.{}'.format(target_service), maxsize=maxsize, ttl=ttl, statsd=statsd,
+                                   copy=copy)
+        super().__init__(target_service, **kwargs)
+
+    def get_dependency(self, worker_ctx):
+        client = super().get_dependency(worker_ctx)
+        context = context_values(worker_ctx.context_data, self.context_keys)
+        return CachedClient(client, self.cache, self.methods, context)
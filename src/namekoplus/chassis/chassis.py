@@ -4,17 +4,141 @@ def init_statsd(prefix=None, host=None, port=8125):
     return statsd
 
 
-def init_logger():
+def init_batched_statsd(prefix=None, host=None, port=8125, flush_interval=1.0, max_samples=200, max_pending=5000,
+                        tags=None):
+    import os
+    from .metrics import AggregatingStatsClient
+    from ..supervisor import WORKER_ID_ENV
+    # The processes of `namekoplus run` send the same stats, the worker tag keeps them apart
+    worker_id = os.environ.get(WORKER_ID_ENV)
+    if worker_id is not None:
+        tags = dict(tags or {}, worker=worker_id)
+    statsd = AggregatingStatsClient(host, port, prefix=prefix, flush_interval=flush_interval,
+                                    max_samples=max_samples, max_pending=max_pending, tags=tags)
+    return statsd
+
+
+def init_statsd_flusher(statsd):
+    from .metrics import StatsdFlusher
+    return StatsdFlusher(statsd)
+
+
+def init_prometheus_metrics(buckets=None, address=None):
+    from .prometheus import PrometheusMetrics, DEFAULT_BUCKETS
+    return PrometheusMetrics(buckets=buckets or DEFAULT_BUCKETS, address=address)
+
+
+def init_instrumentation(statsd, interval=1.0, payload_sizes=False):
+    from .instrumentation import EntrypointInstrumentation
+    return EntrypointInstrumentation(statsd, interval=interval, payload_sizes=payload_sizes)
+
+
+def init_fanout_rpc(target_service, concurrency=10, timeout=None, **kwargs):
+    from .fanout import FanoutRpc
+    return FanoutRpc(target_service, concurrency=concurrency, timeout=timeout, **kwargs)
+
+
+def init_cached_rpc(target_service, methods=None, ttl=60, maxsize=1024, statsd=None, context_keys=None, copy=True,
+                    **kwargs):
+    from .cache import CachedServiceRpc, DEFAULT_CONTEXT_KEYS
+    return CachedServiceRpc(target_service, methods=methods, ttl=ttl, maxsize=maxsize, statsd=statsd,
+                            context_keys=DEFAULT_CONTEXT_KEYS if context_keys is None else context_keys, copy=copy,
+                            **kwargs)
+
+
+def init_call_context_data():
+    from .cache import CallContextData
+    return CallContextData()
+
+
+def cached_rpc(ttl=60, maxsize=1024, statsd=None, name=None, context_keys=None, copy=True):
+    from .cache import cached_rpc, DEFAULT_CONTEXT_KEYS
+    return cached_rpc(ttl=ttl, maxsize=maxsize, statsd=statsd, name=name,
+                      context_keys=DEFAULT_CONTEXT_KEYS if context_keys is None else context_keys, copy=copy)
+
+
+def init_adaptive_concurrency(target_latency=None, min_limit=1, max_limit=None, statsd=None):
+    from .resilience import AdaptiveConcurrency
+    return AdaptiveConcurrency(target_latency=target_latency, min_limit=min_limit, max_limit=max_limit, statsd=statsd)
+
+
+def init_resilient_rpc(target_service, timeout=None, attempts=3, retry_on=('Overloaded',), failure_threshold=5,
+                       recovery_timeout=30, retry_ratio=0.1, **kwargs):
+    from .resilience import ResilientServiceRpc
+    return ResilientServiceRpc(target_service, timeout=timeout, attempts=attempts, retry_on=retry_on,
+                               failure_threshold=failure_threshold, recovery_timeout=recovery_timeout,
+                               retry_ratio=retry_ratio, **kwargs)
+
+
+def register_memory_transport():
+    from .transport import register_memory_transport
+    register_memory_transport()
+
+
+def register_compression(module_name=None):
+    from .serialization import register_compression
+    register_compression(module_name)
+
+
+def init_rpc_pool(size=10, timeout=None, acquire_timeout=None, context_data=None, statsd=None, name='default',
+                  **client_options):
+    from .client import RpcClientPool
+    register_memory_transport()
+    register_compression('nameko.standalone.rpc')
+    return RpcClientPool(size=size, timeout=timeout, acquire_timeout=acquire_timeout, context_data=context_data,
+                         statsd=statsd, name=name, **client_options)
+
+
+def init_batching_dispatcher(max_batch=500, flush_interval=0.05, confirms=True, pack=False, **kwargs):
+    from .events import BatchingEventDispatcher
+    return BatchingEventDispatcher(max_batch=max_batch, flush_interval=flush_interval, confirms=confirms, pack=pack,
+                                   **kwargs)
+
+
+def batch_event_handler(source_service, event_type, max_batch=100, max_wait=0.1, partial_failure='split', **kwargs):
+    from .events import batch_event_handler
+    return batch_event_handler(source_service, event_type, max_batch=max_batch, max_wait=max_wait,
+                               partial_failure=partial_failure, **kwargs)
+
+
+def init_workload_tuner(min_workers=2, max_workers=200, interval=5.0, prefetch_ratio=1.0, statsd=None):
+    from .tuning import WorkloadTuner
+    return WorkloadTuner(min_workers=min_workers, max_workers=max_workers, interval=interval,
+                         prefetch_ratio=prefetch_ratio, statsd=statsd)
+
+
+def init_logger(queued=False, max_queue=10000, policy='drop', batch_size=256, flush_interval=0.1,
+                sampling=None, rate_limits=None, stream=None, statsd=None):
     import logging
     from logstash_formatter import LogstashFormatterV1
     logger = logging.getLogger()
-    handler = logging.StreamHandler()
+    if queued:
+        from .logs import QueueingHandler
+        handler = QueueingHandler(stream, max_queue=max_queue, policy=policy, batch_size=batch_size,
+                                  flush_interval=flush_interval, statsd=statsd)
+    else:
+        handler = logging.StreamHandler(stream)
+    if sampling:
+        from .logs import SamplingFilter
+        handler.addFilter(SamplingFilter(sampling))
+    if rate_limits:
+        from .logs import RateLimitFilter
+        handler.addFilter(RateLimitFilter(rate_limits))
     formatter = LogstashFormatterV1()
     handler.setFormatter(formatter)
     logger.addHandler(handler)
     return logger
 
 
-def init_sentry():
-    from nameko_sentry import SentryReporter
-    return SentryReporter()
+def init_tracer(sample_rate=None, slow_threshold=None, ring_size=None, include_args=None, dump_signal=None):
+    from .tracing import SampledTracer
+    return SampledTracer(sample_rate=sample_rate, slow_threshold=slow_threshold, ring_size=ring_size,
+                         include_args=include_args, dump_signal=dump_signal)
+
+
+def init_sentry(deduplicate=False, window=60.0, max_reports=1, max_queue=100, statsd=None):
+    if not deduplicate:
+        from nameko_sentry import SentryReporter
+        return SentryReporter()
+    from .reporting import DeduplicatingSentryReporter
+    return DeduplicatingSentryReporter(window=window, max_reports=max_reports, max_queue=max_queue, statsd=statsd)
@@ -0,0 +1,326 @@
+"""
+A pooled RPC client for calling nameko services from outside nameko, e.g. from a
+Flask or Django app or from scripts.
+
+A standalone ``ClusterRpcClient`` per request declares a reply queue and opens a
+consumer connection, and nameko's reply listener even opens a new consumer
+connection for every reply it waits for. That costs more broker round trips than
+the call itself. ``RpcClientPool`` keeps up to ``size`` clients, each with its reply
+queue and a consumer connection that stays open, and lends one out per call.
+Publishing goes through kombu's connection pool, like every nameko publisher.
+"""
+
+import socket
+import threading
+import time
+from functools import partial
+from queue import Empty, LifoQueue
+
+from amqp.exceptions import AMQPError
+from kombu import Consumer
+from kombu.exceptions import OperationalError
+from nameko.exceptions import ReplyQueueExpiredWithPendingReplies, RpcTimeout
+from nameko.standalone.rpc import ClusterRpcClient, ReplyListener
+
+# A client that raised one of these is dropped instead of returning to the pool
+CONNECTION_ERRORS = (OSError, AMQPError, OperationalError, ReplyQueueExpiredWithPendingReplies)
+
+
+class PoolExhausted(Exception):
+    pass
+
+
+class PersistentReplyListener(ReplyListener):
+    """
+    A reply listener keeping its consumer connection open between replies.
+
+    The timeout applies to each reply, with sub-second precision. A connection lost
+    while waiting is opened again; replies wait in the reply queue meanwhile.
+    """
+
+    def __init__(self, queue, timeout=None, uri=None, ssl=None, **kwargs):
+        super().__init__(queue, timeout=timeout, uri=uri, ssl=ssl, **kwargs)
+        self.connection = None
+
+    def start(self):
+        super().start()
+        self._connect()
+
+    def _connect(self):
+        self._disconnect()
+        self.connection = self.consumer.connection
+        self.connection.ensure_connection(max_retries=1)
+        channel = self.connection.channel()
+        for consumer in self.consumer.get_consumers(partial(Consumer, channel), channel):
+            consumer.consume()
+
+    def _disconnect(self):
+        if self.connection is not None:
+            try:
+                self.connection.release()
+            except CONNECTION_ERRORS:
+                pass
+            self.connection = None
+
+    def stop(self):
+        super().stop()
+        self._disconnect()
+
+    def heartbeat(self):
+        """
+        Send a heartbeat when one is due, reconnecting if the broker dropped the connection.
+
+        Nothing reads from an idle connection, so it is checked before it is used again.
+        """
+        try:
+            self.connection.heartbeat_check()
+        except CONNECTION_ERRORS:
+            self._connect()
+
+    def consume_reply(self, correlation_id):
+        if self.consumer.should_stop:
+            raise RuntimeError("Stopped and can no longer be used")
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        while not self.pending.get(correlation_id):
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                # A late reply is acked and ignored by handle_message
+                self.pending.pop(correlation_id, None)
+                raise RpcTimeout()
+            try:
+                self.connection.drain_events(timeout=1 if remaining is None else min(remaining, 1))
+            except socket.timeout:
+                self.connection.heartbeat_check()
+            except CONNECTION_ERRORS:
+                if self.consumer.should_stop:
+                    raise
+                self._connect()
+        return self.pending.pop(correlation_id)
+
+
+class PooledRpcClient(ClusterRpcClient):
+    """
+    A ``ClusterRpcClient`` waiting for replies with a ``PersistentReplyListener``.
+    """
+
+    def __init__(self, context_data=None, timeout=None, **publisher_options):
+        super().__init__(context_data=context_data, timeout=timeout, **publisher_options)
+        self.reply_listener = PersistentReplyListener(
+            self.reply_listener.queue, timeout=timeout, uri=self.amqp_uri, ssl=self.ssl
+        )
+        self.client.register_for_reply = self.reply_listener.register_for_reply
+
+
+class _ServiceProxy:
+
+    def __init__(self, pool, service_name):
+        self._pool = pool
+        self._service_name = service_name
+
+    def __getattr__(self, method_name):
+        return partial(_call_method, self._pool, self._service_name, method_name)
+
+
+def _call_method(pool, service_name, method_name, *args, **kwargs):
+    return pool.call(service_name, method_name, args, kwargs)
+
+
+class RpcClientPool:
+    """
+    A bounded pool of RPC clients, safe to share between threads and asyncio tasks.
+
+    Every call borrows a client for its duration, so at most ``size`` calls are in
+    flight and further ones wait up to ``acquire_timeout`` for a free client.
+    Clients are started on first use, so a pool can be created before a web server
+    forks its workers.
+
+    Calls go through ``call``, ``acall`` in coroutines, or attribute access::
+
+        pool = init_rpc_pool(size=10, timeout=5)
+        pool.greeting_service.hello('Jane')
+        pool.call('greeting_service', 'hello', args=('Jane',), timeout=1)
+        await pool.acall('greeting_service', 'hello', args=('Jane',))
+
+    ``stats()`` reports the pool utilization. With a statsd client, the time spent
+    waiting for a client is sent as ``rpc_pool.<name>.wait``, the clients in use and
+    the utilization as ``rpc_pool.<name>.in_use`` and ``.utilization`` gauges, and
+    timed out calls and dropped clients as ``.timeouts`` and ``.discarded`` counters.
+
+    :Parameters:
+        size : int
+            Most clients, i.e. connections and reply queues, of the pool
+        timeout : float
+            Seconds a call waits for its reply, unless the call sets its own
+        acquire_timeout : float
+            Seconds a call waits for a free client before ``PoolExhausted`` is
+            raised, ``None`` waits as long as it takes
+        context_data : dict
+            Sent with every call, e.g. a ``language`` or ``user_agent``
+        statsd : statsd.StatsClient
+            Client the pool stats are sent with, optional
+        name : str
+            Name of the pool in the stat names
+        client_options :
+            Passed on to ``ClusterRpcClient``, e.g. ``uri`` or ``serializer``
+    """
+
+    def __init__(self, size=10, timeout=None, acquire_timeout=None, context_data=None, statsd=None,
+                 name='default', **client_options):
+        self.size = size
+        self.timeout = timeout
+        self.acquire_timeout = acquire_timeout
+        self.context_data = context_data
+        self.statsd = statsd
+        self.name = name
+        self.client_options = client_options
+        # The most recently used clients are lent first, so idle ones are rarely needed
+        self._idle = LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._in_use = 0
+        self._waiting = 0
+        self._closed = False
+        self._executor = None
+
+    def __getattr__(self, service_name):
+        if service_name.startswith('_'):
+            raise AttributeError(service_name)
+        return _ServiceProxy(self, service_name)
+
+    def __getitem__(self, service_name):
+        return _ServiceProxy(self, service_name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _stat(self, kind):
+        return 'rpc_pool.{}.{}'.format(self.name, kind)
+
+    def _report_usage(self, in_use):
+        if self.statsd is not None:
+            self.statsd.gauge(self._stat('in_use'), in_use)
+            self.statsd.gauge(self._stat('utilization'), round(in_use / float(self.size), 3))
+
+    def _acquire(self):
+        started_at = time.perf_counter()
+        with self._lock:
+            self._waiting += 1
+        try:
+            acquired = self._slots.acquire(timeout=self.acquire_timeout)
+        finally:
+            with self._lock:
+                self._waiting -= 1
+        if not acquired:
+            raise PoolExhausted('No RPC client was free within {}s'.format(self.acquire_timeout))
+        if self._closed:
+            self._slots.release()
+            raise RuntimeError('The RPC client pool is closed')
+
+        try:
+            try:
+                client = self._idle.get_nowait()
+            except Empty:
+                client = PooledRpcClient(context_data=self.context_data, timeout=self.timeout, **self.client_options)
+                client.start()
+            else:
+                client.reply_listener.heartbeat()
+        except BaseException:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self._in_use += 1
+            in_use = self._in_use
+        if self.statsd is not None:
+            self.statsd.timing(self._stat('wait'), (time.perf_counter() - started_at) * 1000)
+        self._report_usage(in_use)
+        return client
+
+    def _release(self, client, discard=False):
+        if discard or self._closed:
+            _stop(client)
+            if discard and self.statsd is not None:
+                self.statsd.incr(self._stat('discarded'))
+        else:
+            self._idle.put(client)
+        with self._lock:
+            self._in_use -= 1
+            in_use = self._in_use
+        self._slots.release()
+        self._report_usage(in_use)
+
+    def call(self, service_name, method_name, args=(), kwargs=None, timeout=None):
+        """
+        Call ``service_name.method_name(*args, **kwargs)`` and return its result.
+
+        Raises ``RpcTimeout`` when no reply arrived within ``timeout`` seconds, by default
+        the ``timeout`` of the pool, and the exceptions nameko raises for failed calls.
+        """
+        client = self._acquire()
+        discard = False
+        listener = client.reply_listener
+        listener.timeout = self.timeout if timeout is None else timeout
+        try:
+            return client.client[service_name][method_name](*args, **(kwargs or {}))
+        except RpcTimeout:
+            if self.statsd is not None:
+                self.statsd.incr(self._stat('timeouts'))
+            raise
+        except CONNECTION_ERRORS:
+            discard = True
+            raise
+        finally:
+            listener.timeout = self.timeout
+            self._release(client, discard=discard)
+
+    async def acall(self, service_name, method_name, args=(), kwargs=None, timeout=None):
+        """
+        ``call`` for coroutines, run in a thread of the pool so the event loop is not blocked.
+        """
+        import asyncio
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._get_executor(),
+                                          partial(self.call, service_name, method_name, args, kwargs, timeout))
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                from concurrent.futures import ThreadPoolExecutor
+                self._executor = ThreadPoolExecutor(max_workers=self.size, thread_name_prefix='namekoplus-rpc')
+            return self._executor
+
+    def stats(self):
+        """
+        Clients of the pool by state, and the share of the pool in use.
+        """
+        with self._lock:
+            return {
+                'size': self.size,
+                'in_use': self._in_use,
+                'idle': self._idle.qsize(),
+                'waiting': self._waiting,
+                'utilization': round(self._in_use / float(self.size), 3),
+            }
+
+    def close(self):
+        """
+        Stop the idle clients; the ones in use are stopped when their call returns.
+        """
+        self._closed = True
+        while True:
+            try:
+                _stop(self._idle.get_nowait())
+            except Empty:
+                break
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+
+def _stop(client):
+    try:
+        client.stop()
+    except CONNECTION_ERRORS:
+        pass
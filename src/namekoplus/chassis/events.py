@@ -0,0 +1,479 @@
+"""
+High volume event publishing and consuming.
+
+``BatchingEventDispatcher`` is a drop-in replacement for ``EventDispatcher`` that
+buffers dispatched events and publishes them in bursts over one dedicated channel,
+waiting for the publisher confirms of a whole burst at once instead of one round
+trip per event.
+
+``batch_event_handler`` is an ``event_handler`` that accumulates events and calls
+the handler once with the list of their payloads.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from functools import partial
+from logging import getLogger
+from weakref import WeakSet
+
+from kombu import Connection
+from kombu.messaging import Producer
+from nameko import config
+from nameko.amqp.publish import DEFAULT_TRANSPORT_OPTIONS
+from nameko.constants import DEFAULT_PREFETCH_COUNT, PREFETCH_COUNT_CONFIG_KEY
+from nameko.events import EventDispatcher, EventHandler
+from nameko.exceptions import ContainerBeingKilled
+from nameko.messaging import decode_from_headers, encode_to_headers
+
+BATCH_SIZE_HEADER = 'x-namekoplus-batch-size'
+
+_log = getLogger(__name__)
+
+
+class ConfirmTimeout(Exception):
+    pass
+
+
+class _Confirms:
+    """
+    Tracks the publisher confirms of a channel in confirm mode.
+    """
+
+    def __init__(self, channel):
+        self.next_tag = 1
+        self.outstanding = {}
+        self.nacked = []
+        channel.confirm_select()
+        channel.events['basic_ack'].add(self.on_ack)
+        channel.events['basic_nack'].add(self.on_nack)
+
+    def published(self, message):
+        self.outstanding[self.next_tag] = message
+        self.next_tag += 1
+
+    def _settle(self, delivery_tag, multiple):
+        tags = [tag for tag in self.outstanding if tag <= delivery_tag] if multiple else [delivery_tag]
+        return [self.outstanding.pop(tag) for tag in tags if tag in self.outstanding]
+
+    def on_ack(self, delivery_tag, multiple):
+        self._settle(delivery_tag, multiple)
+
+    def on_nack(self, delivery_tag, multiple):
+        self.nacked.extend(self._settle(delivery_tag, multiple))
+
+
+class BatchingEventDispatcher(EventDispatcher):
+    """
+    Dispatch events in batches.
+
+    Events are buffered per event type and flushed when ``max_batch`` events are
+    buffered, when the oldest one has waited ``flush_interval`` seconds, and at the
+    latest on teardown of every worker that dispatched one, so a worker never
+    finishes before its events were handed to the broker.
+
+    With ``confirms`` (the default, on transports that support them) a flush waits
+    once for the broker to confirm every event of the burst; events the broker
+    rejects are published again with the next flush. When a flush fails, e.g. with
+    ``ConfirmTimeout``, the events it did not deliver go back to the front of the
+    buffer before the error is raised, so they may be published twice but are not lost.
+
+    With ``pack`` all buffered events of one type are sent as a single message
+    whose payload is the list of event payloads. Handlers then receive lists, and
+    the context headers (call id stack, etc.) of the first event of the batch.
+
+    :Parameters:
+        max_batch : int
+            Buffered events that trigger a flush
+        flush_interval : float
+            Seconds an event may wait in the buffer
+        confirms : bool
+            Wait for publisher confirms once per flush
+        confirm_timeout : float
+            Seconds to wait for the confirms of a flush
+        pack : bool
+            Send one message per event type and flush
+    """
+
+    def __init__(self, max_batch=500, flush_interval=0.05, confirms=True, confirm_timeout=10, pack=False,
+                 **kwargs):
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.confirms = confirms
+        self.confirm_timeout = confirm_timeout
+        self.pack = pack
+        super().__init__(**kwargs)
+
+        self.buffer = OrderedDict()
+        self.buffered = 0
+        self.oldest = None
+        self.dispatched_by = WeakSet()
+        self.connection = None
+        self.producer = None
+        self._confirms = None
+        self._undelivered = []
+        self._buffer_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def start(self):
+        self._stopped.clear()
+        self.container.spawn_managed_thread(self._run_flusher, identifier='BatchingEventDispatcher.flusher')
+
+    def stop(self):
+        self._stopped.set()
+        self.flush()
+        self._close()
+
+    def kill(self):
+        self._stopped.set()
+        self._close()
+
+    def _connect(self):
+        transport_options = DEFAULT_TRANSPORT_OPTIONS.copy()
+        transport_options['confirm_publish'] = False
+        self.connection = Connection(self.amqp_uri, ssl=self.publisher.ssl, login_method=self.publisher.login_method,
+                                     transport_options=transport_options)
+        channel = self.connection.channel()
+        self.producer = Producer(channel, exchange=self.exchange, serializer=self.publisher.serializer,
+                                 compression=self.publisher.compression)
+        # Only AMQP brokers implement publisher confirms
+        if self.confirms and self.connection.transport.driver_type == 'amqp':
+            self._confirms = _Confirms(channel)
+        else:
+            self._confirms = None
+
+    def _close(self):
+        if self.connection is not None:
+            self.connection.release()
+            self.connection = self.producer = self._confirms = None
+
+    def _run_flusher(self):
+        while not self._stopped.wait(self.flush_interval / 2):
+            oldest = self.oldest
+            if oldest is not None and time.monotonic() - oldest >= self.flush_interval:
+                self.flush()
+
+    def get_dependency(self, worker_ctx):
+
+        def dispatch(event_type, event_data):
+            headers = encode_to_headers(worker_ctx.context_data)
+            self.dispatched_by.add(worker_ctx)
+            with self._buffer_lock:
+                self.buffer.setdefault(event_type, []).append((event_data, headers))
+                self.buffered += 1
+                if self.oldest is None:
+                    self.oldest = time.monotonic()
+                full = self.buffered >= self.max_batch
+            if full:
+                self.flush()
+
+        return dispatch
+
+    def worker_teardown(self, worker_ctx):
+        if worker_ctx in self.dispatched_by:
+            self.dispatched_by.discard(worker_ctx)
+            self.flush()
+
+    def _take(self):
+        with self._buffer_lock:
+            buffer, self.buffer = self.buffer, OrderedDict()
+            self.buffered = 0
+            self.oldest = None
+        if self.pack:
+            return [(event_type, [data for data, _ in events], dict(events[0][1], **{BATCH_SIZE_HEADER: len(events)}))
+                    for event_type, events in buffer.items()]
+        return [(event_type, data, headers) for event_type, events in buffer.items() for data, headers in events]
+
+    def _put_back(self, messages, front=False):
+        """
+        Buffer the events of ``messages`` again, before the events buffered since with ``front``.
+        """
+        events_by_type = OrderedDict()
+        for event_type, payload, headers in messages:
+            if self.pack:
+                headers = {key: value for key, value in headers.items() if key != BATCH_SIZE_HEADER}
+            events_by_type.setdefault(event_type, []).extend((data, headers) for data in (
+                payload if self.pack else [payload]))
+
+        with self._buffer_lock:
+            if front:
+                for event_type, events in self.buffer.items():
+                    events_by_type.setdefault(event_type, []).extend(events)
+                buffered = sum(len(events) for events in events_by_type.values())
+                self.buffer = events_by_type
+            else:
+                buffered = self.buffered
+                for event_type, events in events_by_type.items():
+                    self.buffer.setdefault(event_type, []).extend(events)
+                    buffered += len(events)
+            self.buffered = buffered
+            if self.oldest is None:
+                self.oldest = time.monotonic()
+
+    def flush(self):
+        """
+        Publish every buffered event.
+        """
+        with self._flush_lock:
+            messages = self._take()
+            if not messages:
+                return
+            try:
+                try:
+                    self._publish(messages)
+                except self.connection_errors() as exc:
+                    _log.warning('Publishing %d events failed (%s), reconnecting', len(messages), exc)
+                    self._close()
+                    self._publish(messages)
+            except Exception:
+                undelivered, self._undelivered = self._undelivered, []
+                self._put_back(undelivered, front=True)
+                raise
+
+    def connection_errors(self):
+        if self.connection is None:
+            return ()
+        return self.connection.connection_errors + self.connection.channel_errors
+
+    def _publish(self, messages):
+        sent = 0
+        try:
+            if self.connection is None:
+                self._connect()
+            publisher = self.publisher
+            for message in messages:
+                event_type, payload, headers = message
+                self.producer.publish(
+                    payload,
+                    routing_key=event_type,
+                    headers=headers,
+                    delivery_mode=publisher.delivery_mode,
+                    priority=publisher.priority,
+                    expiration=publisher.expiration,
+                    retry=False,
+                )
+                sent += 1
+                if self._confirms is not None:
+                    self._confirms.published(message)
+
+            if self._confirms is None:
+                return
+            deadline = time.monotonic() + self.confirm_timeout
+            while self._confirms.outstanding:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise ConfirmTimeout('{} events were not confirmed'.format(len(self._confirms.outstanding)))
+                self.connection.drain_events(timeout=remaining)
+        except Exception as exc:
+            # Events sent but not confirmed may have reached the broker, or not
+            unconfirmed = list(self._confirms.outstanding.values()) if self._confirms is not None else []
+            self._undelivered = unconfirmed + messages[sent:]
+            if isinstance(exc, ConfirmTimeout):
+                self._close()
+            raise
+
+        if self._confirms.nacked:
+            nacked, self._confirms.nacked = self._confirms.nacked, []
+            _log.warning('%d events were rejected by the broker, publishing them again', len(nacked))
+            self._put_back(nacked)
+
+
+class BatchFailure(Exception):
+    """
+    Raised by a ``batch_event_handler`` to fail only some payloads of its batch.
+
+    ``failed`` are the indexes of the failed payloads in the list the handler received.
+    """
+
+    def __init__(self, failed, message=''):
+        self.failed = set(failed)
+        super().__init__(message or '{} payloads of the batch failed'.format(len(self.failed)))
+
+
+class _Unsettled:
+    """
+    A message whose payloads are not all handled yet.
+    """
+
+    def __init__(self, remaining):
+        self.remaining = remaining
+        self.in_flight = 0
+        self.failed = False
+        self.requeue = False
+
+
+class BatchEventHandler(EventHandler):
+    """
+    Handle events in batches.
+
+    Payloads are accumulated until ``max_batch`` of them arrived or the oldest one
+    waited ``max_wait`` seconds, then the handler is called once with the list.
+    Events published packed by ``BatchingEventDispatcher`` are unpacked into the list
+    and every payload counts towards ``max_batch``; the payloads of a packed message
+    that do not fit in a batch start the next one.
+
+    A message is acked once the handler returned for every batch its payloads are in.
+    When it raises, the message is requeued if ``requeue_on_error`` is set and acked otherwise. With
+    ``partial_failure='split'`` the handler can raise ``BatchFailure`` to have only
+    the messages of the failed payloads requeued, and the others acked; with
+    ``partial_failure='batch'`` any failure is a failure of the whole batch.
+
+    The prefetch count of the consumer is raised to ``max_batch`` if it is lower,
+    otherwise a batch could never fill up.
+
+    Example::
+
+        @batch_event_handler('orders', 'order_created', max_batch=200, max_wait=0.5)
+        def store(self, orders):
+            self.db.bulk_insert(orders)
+    """
+
+    def __init__(self, source_service, event_type, max_batch=100, max_wait=0.1, partial_failure='split',
+                 **kwargs):
+        if partial_failure not in ('split', 'batch'):
+            raise ValueError("partial_failure must be 'split' or 'batch'")
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.partial_failure = partial_failure
+        self.pending = []
+        self.pending_payloads = 0
+        self.pending_since = None
+        self.unsettled = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        super().__init__(source_service, event_type, **kwargs)
+
+    def setup(self):
+        prefetch_count = self.consumer_options.get(
+            'prefetch_count', config.get(PREFETCH_COUNT_CONFIG_KEY, DEFAULT_PREFETCH_COUNT)
+        )
+        self.consumer_options['prefetch_count'] = max(prefetch_count, self.max_batch)
+        super().setup()
+
+    def start(self):
+        self._stopped.clear()
+        super().start()
+        ident = '{}.flusher[{}.{}]'.format(type(self).__name__, self.container.service_name, self.method_name)
+        self.container.spawn_managed_thread(self._run_flusher, identifier=ident)
+
+    def stop(self):
+        self._stopped.set()
+        # Messages not handed to a worker yet go back to the queue, partly handed ones once their workers end
+        requeue = []
+        with self._lock:
+            pending, self.pending = self.pending, []
+            self.pending_payloads = 0
+            for items, message in pending:
+                unsettled = self.unsettled[message]
+                unsettled.remaining -= len(items)
+                unsettled.requeue = True
+                if not unsettled.in_flight:
+                    del self.unsettled[message]
+                    requeue.append(message)
+        for message in requeue:
+            self.consumer.requeue_message(message)
+        super().stop()
+
+    def _run_flusher(self):
+        while not self._stopped.wait(self.max_wait / 4):
+            since = self.pending_since
+            if since is not None and time.monotonic() - since >= self.max_wait:
+                self._dispatch()
+
+    def handle_message(self, body, message):
+        packed = BATCH_SIZE_HEADER in message.headers and isinstance(body, list)
+        items = body if packed else [body]
+        if not items:
+            self.consumer.ack_message(message)
+            return
+        with self._lock:
+            self.pending.append((items, message))
+            self.pending_payloads += len(items)
+            self.unsettled[message] = _Unsettled(len(items))
+            if self.pending_since is None:
+                self.pending_since = time.monotonic()
+            full = self.pending_payloads >= self.max_batch
+        if full:
+            self._dispatch()
+
+    def _take(self):
+        batch = []
+        room = self.max_batch
+        while self.pending and room:
+            items, message = self.pending[0]
+            if len(items) <= room:
+                self.pending.pop(0)
+            else:
+                items, self.pending[0] = items[:room], (items[room:], message)
+            unsettled = self.unsettled[message]
+            unsettled.in_flight += 1
+            unsettled.remaining -= len(items)
+            batch.append((items, message))
+            room -= len(items)
+        self.pending_payloads -= self.max_batch - room
+        return batch
+
+    def _dispatch(self):
+        with self._lock:
+            batch = self._take()
+            self.pending_since = time.monotonic() if self.pending else None
+        if not batch:
+            return
+
+        payloads = []
+        spans = []
+        for items, message in batch:
+            spans.append((message, range(len(payloads), len(payloads) + len(items))))
+            payloads.extend(items)
+
+        context_data = decode_from_headers(batch[0][1].headers)
+        handle_result = partial(self.handle_batch_result, spans)
+
+        def spawn_worker():
+            try:
+                self.container.spawn_worker(
+                    self, (payloads,), {}, context_data=context_data, handle_result=handle_result
+                )
+            except ContainerBeingKilled:
+                with self._lock:
+                    for message, _ in spans:
+                        self.unsettled[message].requeue = True
+                self.handle_batch_result(spans, None)
+
+        ident = '{}.wait_for_worker_pool[{}.{}]'.format(
+            type(self).__name__, self.container.service_name, self.method_name
+        )
+        self.container.spawn_managed_thread(spawn_worker, identifier=ident)
+
+    def handle_batch_result(self, spans, worker_ctx, result=None, exc_info=None):
+        failed = None
+        if exc_info is not None and isinstance(exc_info[1], BatchFailure) and self.partial_failure == 'split':
+            failed = exc_info[1].failed
+
+        settled = []
+        with self._lock:
+            for message, indexes in spans:
+                if exc_info is None:
+                    message_failed = False
+                elif failed is None:
+                    message_failed = True
+                else:
+                    message_failed = any(idx in failed for idx in indexes)
+
+                unsettled = self.unsettled[message]
+                unsettled.in_flight -= 1
+                unsettled.failed = unsettled.failed or message_failed
+                if not unsettled.in_flight and not unsettled.remaining:
+                    del self.unsettled[message]
+                    settled.append((message, unsettled.requeue or (unsettled.failed and self.requeue_on_error)))
+
+        for message, requeue in settled:
+            if requeue:
+                self.consumer.requeue_message(message)
+            else:
+                self.consumer.ack_message(message)
+        return result, exc_info
+
+
+batch_event_handler = BatchEventHandler.decorator
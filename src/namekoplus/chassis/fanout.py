@@ -0,0 +1,185 @@
+from time import monotonic
+
+import eventlet
+from nameko.exceptions import deserialize, serialize
+from nameko.rpc import ServiceRpc, rpc
+
+BATCH_SUFFIX = '__batch'
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+class GatherResult:
+    """
+    Results of a fan-out, in the order the calls were given.
+
+    ``results[i]`` is ``None`` for calls that failed, the exception of every
+    failed call is in ``errors[i]``.
+    """
+
+    def __init__(self, size):
+        self.results = [None] * size
+        self.errors = {}
+
+    @property
+    def ok(self):
+        return not self.errors
+
+    def __len__(self):
+        return len(self.results)
+
+    def __iter__(self):
+        return iter(self.results)
+
+    def raise_for_errors(self):
+        """
+        Raise the error of the first failed call, if any.
+        """
+        if self.errors:
+            raise self.errors[min(self.errors)]
+
+    def __repr__(self):
+        return '<GatherResult {} calls, {} failed>'.format(len(self.results), len(self.errors))
+
+
+class FanoutClient:
+    """
+    A ServiceRpc client that can issue many calls concurrently over the worker's reply queue.
+
+    Plain calls such as ``self.remote.hello(name)`` keep working as with ``ServiceRpc``.
+    """
+
+    def __init__(self, client, reply_listener, concurrency, timeout):
+        self._client = client
+        self._reply_listener = reply_listener
+        self.concurrency = concurrency
+        self.timeout = timeout
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    def __getitem__(self, name):
+        return self._client[name]
+
+    def _call(self, method_name, args, kwargs, deadline):
+        if deadline is not None and monotonic() >= deadline:
+            raise DeadlineExceeded('Deadline exceeded before {} was sent'.format(method_name))
+
+        rpc_call = getattr(self._client, method_name).call_async(*args, **kwargs)
+        if deadline is None:
+            return rpc_call.result()
+        try:
+            with eventlet.Timeout(max(deadline - monotonic(), 0), DeadlineExceeded):
+                return rpc_call.result()
+        except DeadlineExceeded:
+            # Stop waiting for a reply that will arrive after nobody cares about it
+            self._reply_listener.pending.pop(rpc_call.correlation_id, None)
+            raise DeadlineExceeded('Deadline exceeded waiting for {}'.format(method_name))
+
+    def gather(self, calls, concurrency=None, timeout=None):
+        """
+        Run ``calls``, a sequence of ``(method_name, args, kwargs)``, with at most
+        ``concurrency`` of them in flight and a deadline of ``timeout`` seconds shared by all.
+        """
+        calls = list(calls)
+        timeout = timeout if timeout is not None else self.timeout
+        deadline = monotonic() + timeout if timeout is not None else None
+        result = GatherResult(len(calls))
+
+        def run(idx, method_name, args, kwargs):
+            try:
+                result.results[idx] = self._call(method_name, args, kwargs or {}, deadline)
+            except Exception as exc:
+                result.errors[idx] = exc
+
+        pool = eventlet.GreenPool(concurrency or self.concurrency)
+        for idx, (method_name, args, kwargs) in enumerate(calls):
+            pool.spawn_n(run, idx, method_name, args, kwargs)
+        pool.waitall()
+        return result
+
+    def map(self, method_name, items, concurrency=None, timeout=None, batch_size=None):
+        """
+        Call ``method_name(item)`` for every item, like the builtin ``map``.
+
+        With ``batch_size`` the items are sent in groups to the ``<method_name>__batch``
+        entrypoint that ``@batch_rpc`` adds, so N small calls travel as one message each way.
+        """
+        items = list(items)
+        if not batch_size:
+            return self.gather([(method_name, (item,), {}) for item in items], concurrency, timeout)
+
+        chunks = [items[idx:idx + batch_size] for idx in range(0, len(items), batch_size)]
+        batches = self.gather(
+            [(method_name + BATCH_SUFFIX, ([[[item], {}] for item in chunk],), {}) for chunk in chunks],
+            concurrency, timeout
+        )
+
+        result = GatherResult(len(items))
+        for chunk_idx, chunk in enumerate(chunks):
+            offset = chunk_idx * batch_size
+            if chunk_idx in batches.errors:
+                for idx in range(len(chunk)):
+                    result.errors[offset + idx] = batches.errors[chunk_idx]
+                continue
+            for idx, response in enumerate(batches.results[chunk_idx]):
+                if response['error'] is not None:
+                    result.errors[offset + idx] = deserialize(response['error'])
+                else:
+                    result.results[offset + idx] = response['result']
+        return result
+
+
+class FanoutRpc(ServiceRpc):
+    """
+    ServiceRpc with ``map``/``gather`` for concurrent fan-out to the target service.
+
+    :Parameters:
+        target_service : str
+            Target service name
+        concurrency : int
+            Default maximum number of calls in flight per ``map``/``gather``
+        timeout : float
+            Default deadline in seconds shared by all calls of one ``map``/``gather``
+    """
+
+    def __init__(self, target_service, concurrency=10, timeout=None, **kwargs):
+        self.concurrency = concurrency
+        self.timeout = timeout
+        super().__init__(target_service, **kwargs)
+
+    def get_dependency(self, worker_ctx):
+        client = super().get_dependency(worker_ctx)
+        return FanoutClient(client, self.reply_listener, self.concurrency, self.timeout)
+
+
+class batch_rpc:
+    """
+    Decorate an ``@rpc`` method to also expose ``<name>__batch``.
+
+    The batch entrypoint takes a list of ``[args, kwargs]`` pairs, runs the method for each
+    one inside a single worker and returns a list of ``{'result': ..., 'error': ...}``, so
+    one failing item does not fail the whole batch.
+    """
+
+    def __init__(self, fn):
+        self.fn = fn
+
+    def __set_name__(self, owner, name):
+        fn = self.fn
+
+        def batch(service, calls):
+            responses = []
+            for args, kwargs in calls:
+                try:
+                    responses.append({'result': fn(service, *args, **kwargs), 'error': None})
+                except Exception as exc:
+                    responses.append({'result': None, 'error': serialize(exc)})
+            return responses
+
+        batch.__name__ = batch.__qualname__ = name + BATCH_SUFFIX
+        batch.__doc__ = 'Batch version of {}.{}'.format(owner.__name__, name)
+        setattr(owner, name, fn)
+        setattr(owner, name + BATCH_SUFFIX, rpc(batch))
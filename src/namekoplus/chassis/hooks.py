@@ -0,0 +1,86 @@
+"""
+One shared wrapper of ``ServiceContainer.spawn_worker`` for the extensions that need to
+see calls before their worker runs.
+
+nameko has no extension hook between an entrypoint receiving a call and the worker pool
+spawning its worker, so ``spawn_hooks`` wraps ``spawn_worker`` once per container and
+every extension registers with it, instead of each one wrapping the method again:
+
+- ``admit(entrypoint)`` runs before the call waits for a free worker. One that raises
+  rejects the call: no worker is spawned and the entrypoint's ``handle_result`` gets the
+  error, so an RPC caller gets it as its reply and an event is acked, or requeued by
+  handlers with ``requeue_on_error=True``. Calls without ``handle_result`` are always admitted.
+  An admit may return a callable that undoes the admission, which runs when a later admit
+  rejects the call or ``spawn_worker`` raises, e.g. ``ContainerBeingKilled``
+- ``on_spawned(worker_ctx, waited, handle_result)`` runs once the worker is spawned.
+  ``spawn_worker`` blocks while the worker pool is exhausted, so ``waited`` is the time
+  the call waited for a free worker. ``handle_result`` is the callback of the entrypoint,
+  which AMQP entrypoints bind to the message they received
+- ``on_exited(worker_ctx)`` runs when the greenthread of the worker exits. nameko skips
+  ``worker_result`` and ``worker_teardown`` when dependency injection or ``handle_result``
+  raises, so what a worker holds until it finishes is released here
+"""
+
+import sys
+import time
+
+HOOKS_ATTR = '_namekoplus_spawn_hooks'
+
+
+class SpawnHooks:
+
+    def __init__(self, container):
+        self.admission = []
+        self.spawned = []
+        self.exited = []
+        self.container = container
+        self._spawn_worker = container.spawn_worker
+
+    def spawn_worker(self, entrypoint, args, kwargs, context_data=None, handle_result=None):
+        undo = []
+        if handle_result is not None:
+            try:
+                for admit in self.admission:
+                    release = admit(entrypoint)
+                    if release is not None:
+                        undo.append(release)
+            except Exception:
+                exc_info = sys.exc_info()
+                for release in undo:
+                    release()
+                handle_result(None, None, exc_info)
+                return None
+
+        started_at = time.perf_counter()
+        try:
+            worker_ctx = self._spawn_worker(entrypoint, args, kwargs, context_data=context_data,
+                                            handle_result=handle_result)
+        except Exception:
+            for release in undo:
+                release()
+            raise
+        waited = time.perf_counter() - started_at
+        for on_spawned in self.spawned:
+            on_spawned(worker_ctx, waited, handle_result)
+
+        thread = self.container._worker_threads.get(worker_ctx)
+        if self.exited and thread is not None:
+            # Runs at once if the worker already finished
+            thread.link(self._exited, worker_ctx)
+        return worker_ctx
+
+    def _exited(self, thread, worker_ctx):
+        for on_exited in self.exited:
+            on_exited(worker_ctx)
+
+
+def spawn_hooks(container):
+    """
+    The ``SpawnHooks`` of ``container``, wrapping its ``spawn_worker`` on the first call.
+    """
+    hooks = getattr(container, HOOKS_ATTR, None)
+    if hooks is None:
+        hooks = SpawnHooks(container)
+        setattr(container, HOOKS_ATTR, hooks)
+        container.spawn_worker = hooks.spawn_worker
+    return hooks
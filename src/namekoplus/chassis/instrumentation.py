@@ -0,0 +1,190 @@
+"""
+Automatic statsd instrumentation of every entrypoint of a service.
+
+Stat names only depend on the service name, the entrypoint method name and the kind
+of measurement, so ``metric_config_gen`` derives them from the scanned source:
+
+- ``entrypoint.<service>.<method>.handler``, ``.pool_wait`` and ``.broker_wait``
+  are timers in milliseconds
+- ``entrypoint.<service>.<method>.calls``, ``.errors``, ``.request_bytes`` and
+  ``.response_bytes`` are counters
+- ``pool.<service>.busy``, ``.size`` and ``.utilization`` are gauges
+"""
+
+import threading
+import time
+from functools import partial
+
+from kombu.serialization import dumps
+from nameko import config
+from nameko.constants import DEFAULT_SERIALIZER, SERIALIZER_CONFIG_KEY
+from nameko.extensions import DependencyProvider
+from nameko.rpc import Rpc
+
+from .hooks import spawn_hooks
+
+ENTRYPOINT_TIMERS = ('handler', 'pool_wait', 'broker_wait')
+ENTRYPOINT_COUNTERS = ('calls', 'errors', 'request_bytes', 'response_bytes')
+POOL_GAUGES = ('busy', 'size', 'utilization')
+
+# Set by RabbitMQ's message timestamp plugin, with millisecond precision since 3.8
+TIMESTAMP_MS_HEADER = 'timestamp_in_ms'
+
+
+def entrypoint_stat(service_name, method_name, kind):
+    return 'entrypoint.{}.{}.{}'.format(service_name, method_name, kind)
+
+
+def pool_stat(service_name, kind):
+    return 'pool.{}.{}'.format(service_name, kind)
+
+
+def prometheus_name(kind, scope='entrypoint'):
+    """
+    Name of the Prometheus metric the statsd-exporter mapping gives a kind of stat.
+    """
+    return 'namekoplus_{}_{}'.format(scope, kind)
+
+
+def _message(handle_result):
+    # AMQP entrypoints bind the message they received to their result callback
+    if isinstance(handle_result, partial) and handle_result.args:
+        message = handle_result.args[0]
+        if hasattr(message, 'body') and hasattr(message, 'headers'):
+            return message
+    return None
+
+
+def _sent_at(message):
+    timestamp_ms = message.headers.get(TIMESTAMP_MS_HEADER)
+    if timestamp_ms is not None:
+        return timestamp_ms / 1000.
+    return message.properties.get('timestamp')
+
+
+class EntrypointInstrumentation(DependencyProvider):
+    """
+    Time, count and size every ``@rpc``, ``@event_handler``, ``@http`` and ``@timer``
+    call of the service, without decorating its methods.
+
+    - ``handler`` is the time a worker spent on the call, result handling included
+    - ``pool_wait`` is the time the call waited for a free worker
+    - ``broker_wait`` is the time the message spent in the broker, from its AMQP
+      ``timestamp`` property or the ``timestamp_in_ms`` header of RabbitMQ's message
+      timestamp plugin to its delivery. nameko does not set the ``timestamp`` property
+      when it publishes, so ``broker_wait`` needs publishers that set it on every message
+      or the plugin enabled on the broker, and is skipped for messages carrying neither
+    - ``request_bytes`` and ``response_bytes``, with ``payload_sizes`` on, add up the size of
+      the serialized messages and RPC replies, or of the HTTP bodies. Averages are their rates
+      over the rate of ``calls``
+    - ``pool.<service>.*`` gauges are sampled every ``interval`` seconds
+
+    :Parameters:
+        statsd : statsd.StatsClient
+            Client the stats are sent with
+        interval : float
+            Seconds between two samples of the worker pool
+        payload_sizes : bool
+            Count request and response sizes; off by default, as responses of AMQP
+            entrypoints are serialized once more to be measured
+    """
+
+    def __init__(self, statsd, interval=1.0, payload_sizes=False):
+        self.statsd = statsd
+        self.interval = interval
+        self.payload_sizes = payload_sizes
+        self.messages = {}
+        self.started = {}
+        self._stopped = threading.Event()
+
+    def setup(self):
+        self.serializer = config.get(SERIALIZER_CONFIG_KEY, DEFAULT_SERIALIZER)
+        spawn_hooks(self.container).spawned.append(self._spawned)
+
+    def start(self):
+        self._stopped.clear()
+        self.container.spawn_managed_thread(self._sample_pool, identifier='EntrypointInstrumentation')
+
+    def stop(self):
+        self._stopped.set()
+
+    def kill(self):
+        self._stopped.set()
+
+    def _stat(self, worker_ctx, kind):
+        return entrypoint_stat(worker_ctx.service_name, worker_ctx.entrypoint.method_name, kind)
+
+    def _spawned(self, worker_ctx, waited, handle_result):
+        self.statsd.timing(self._stat(worker_ctx, 'pool_wait'), waited * 1000)
+
+        message = _message(handle_result)
+        if message is None:
+            return
+        sent_at = _sent_at(message)
+        if sent_at is not None:
+            # Whole seconds when only the AMQP timestamp property is set
+            delivered_at = time.time() - waited
+            self.statsd.timing(self._stat(worker_ctx, 'broker_wait'), max(0., delivered_at - sent_at) * 1000)
+        if self.payload_sizes:
+            self.statsd.incr(self._stat(worker_ctx, 'request_bytes'), len(message.body))
+        self.messages[worker_ctx] = message
+
+    def worker_setup(self, worker_ctx):
+        message = self.messages.pop(worker_ctx, None)
+        if message is None and self.payload_sizes and worker_ctx.args:
+            # HTTP entrypoints are called with the werkzeug request
+            content_length = getattr(worker_ctx.args[0], 'content_length', None)
+            if content_length:
+                self.statsd.incr(self._stat(worker_ctx, 'request_bytes'), content_length)
+        self.started[worker_ctx] = (time.perf_counter(), message is not None)
+
+    def worker_result(self, worker_ctx, result=None, exc_info=None):
+        started = self.started.pop(worker_ctx, None)
+        if started is None:
+            return
+        started_at, amqp = started
+        self.statsd.timing(self._stat(worker_ctx, 'handler'), (time.perf_counter() - started_at) * 1000)
+        self.statsd.incr(self._stat(worker_ctx, 'calls'))
+        if exc_info is not None:
+            self.statsd.incr(self._stat(worker_ctx, 'errors'))
+        elif self.payload_sizes:
+            size = self._response_size(worker_ctx, result, amqp)
+            if size:
+                self.statsd.incr(self._stat(worker_ctx, 'response_bytes'), size)
+
+    def _response_size(self, worker_ctx, result, amqp):
+        if amqp:
+            if not isinstance(worker_ctx.entrypoint, Rpc):
+                # Only RPC calls are answered
+                return None
+            try:
+                return len(dumps(result, serializer=self.serializer)[2])
+            except Exception:
+                return None
+        # HTTP entrypoints return a werkzeug response, a body or a tuple ending with one
+        if isinstance(result, tuple) and result:
+            result = result[-1]
+        content_length = getattr(result, 'content_length', None)
+        if content_length is not None:
+            return content_length
+        if isinstance(result, (str, bytes)):
+            return len(result)
+        return None
+
+    def worker_teardown(self, worker_ctx):
+        self.messages.pop(worker_ctx, None)
+        self.started.pop(worker_ctx, None)
+
+    def _sample_pool(self):
+        service_name = self.container.service_name
+        while not self._stopped.is_set():
+            pool = self.container._worker_pool
+            size = pool.size or 1
+            busy = pool.running()
+            self.statsd.gauge(pool_stat(service_name, 'busy'), busy)
+            self.statsd.gauge(pool_stat(service_name, 'size'), size)
+            self.statsd.gauge(pool_stat(service_name, 'utilization'), round(busy / float(size), 3))
+            self._stopped.wait(self.interval)
+
+    def get_dependency(self, worker_ctx):
+        return self.statsd
@@ -0,0 +1,209 @@
+"""
+Logging that stays off the request path.
+
+``QueueingHandler`` only appends records to a bounded in-memory queue. A writer on a
+real OS thread formats them and writes them in batches, so neither JSON formatting nor
+a slow stdout pipe stalls the eventlet hub. ``SamplingFilter`` and ``RateLimitFilter``
+thin out noisy loggers before their records are even queued.
+"""
+
+import atexit
+import logging
+import random
+import sys
+import threading
+import time
+from collections import deque
+
+from eventlet import patcher
+
+# The writer must not be a greenthread: a blocking write would stall the whole hub
+_os_threading = patcher.original('threading')
+
+POLICIES = ('drop', 'block')
+
+
+def _match(rules, name):
+    """
+    Return the rule of the most specific logger in ``rules`` that ``name`` is, or is a child of.
+    """
+    while name:
+        if name in rules:
+            return name, rules[name]
+        name = name.rpartition('.')[0]
+    if '' in rules:
+        return '', rules['']
+    return None, None
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keep a fraction of the records below ``max_level`` of the given loggers.
+
+    ``rates`` maps logger names to the fraction to keep, e.g. ``{'nameko.rpc': 0.01}``.
+    Child loggers follow the rate of their closest configured parent.
+    """
+
+    def __init__(self, rates, max_level=logging.INFO):
+        super().__init__()
+        self.rates = dict(rates)
+        self.max_level = max_level
+        self.sampled_out = 0
+
+    def filter(self, record):
+        if record.levelno > self.max_level:
+            return True
+        _, rate = _match(self.rates, record.name)
+        if rate is None or random.random() < rate:
+            return True
+        self.sampled_out += 1
+        return False
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Let at most ``per_second`` records per second through for each of the given loggers.
+
+    ``limits`` maps logger names to records per second, bursts of up to one second
+    worth of records are allowed. Records above ``max_level`` are never limited.
+    """
+
+    def __init__(self, limits, max_level=logging.WARNING):
+        super().__init__()
+        self.limits = dict(limits)
+        self.max_level = max_level
+        self.limited = 0
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno > self.max_level:
+            return True
+        name, limit = _match(self.limits, record.name)
+        if limit is None:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(name, (limit, now))
+            tokens = min(limit, tokens + (now - updated_at) * limit)
+            allowed = tokens >= 1
+            self._buckets[name] = (tokens - 1 if allowed else tokens, now)
+        if not allowed:
+            self.limited += 1
+        return allowed
+
+
+class QueueingHandler(logging.Handler):
+    """
+    Queue records and write them from a background thread in batches.
+
+    When ``max_queue`` records are waiting, ``policy='drop'`` drops new records and
+    counts them in ``dropped``, ``policy='block'`` makes the logging greenthread wait
+    for room. Waits poll with sleeps, which yield to the other greenthreads when
+    eventlet is monkey patched, but with ``block`` a stalled stream still stalls every
+    greenthread that logs, so services should keep the default ``drop``. Records are
+    formatted by the writer, so arguments passed to a log call should not be mutated afterwards.
+
+    :Parameters:
+        stream : file
+            Where formatted records are written, ``sys.stderr`` by default
+        max_queue : int
+            Maximum number of records waiting to be written
+        policy : str
+            ``'drop'`` or ``'block'``
+        batch_size : int
+            Maximum records formatted and written per write
+        flush_interval : float
+            Seconds the writer waits for more records before writing a partial batch
+        statsd : statsd.StatsClient
+            Client ``logging.dropped`` is counted on, optional
+    """
+
+    def __init__(self, stream=None, max_queue=10000, policy='drop', batch_size=256, flush_interval=0.1,
+                 statsd=None, level=logging.NOTSET):
+        if policy not in POLICIES:
+            raise ValueError('policy must be one of {}'.format(', '.join(POLICIES)))
+        super().__init__(level)
+        self.stream = stream if stream is not None else sys.stderr
+        self.max_queue = max_queue
+        self.policy = policy
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.statsd = statsd
+        self.dropped = 0
+        self.written = 0
+
+        self._queue = deque()
+        self._wakeup = _os_threading.Event()
+        self._idle = _os_threading.Event()
+        self._idle.set()
+        self._closed = False
+        self._writer = _os_threading.Thread(target=self._run, name='namekoplus-log-writer', daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+
+    def emit(self, record):
+        if len(self._queue) >= self.max_queue:
+            if self.policy == 'drop':
+                self.dropped += 1
+                if self.statsd is not None:
+                    self.statsd.incr('logging.dropped')
+                return
+            self._wakeup.set()
+            self._wait(lambda: len(self._queue) < self.max_queue or self._closed)
+        self._idle.clear()
+        self._queue.append(record)
+        if len(self._queue) >= self.batch_size:
+            self._wakeup.set()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self._drain()
+            if self._closed and not self._queue:
+                return
+
+    def _drain(self):
+        while self._queue:
+            lines = []
+            while self._queue and len(lines) < self.batch_size:
+                record = self._queue.popleft()
+                try:
+                    lines.append(self.format(record))
+                except Exception:
+                    self.handleError(record)
+            if lines:
+                try:
+                    self.stream.write('\n'.join(lines) + '\n')
+                    self.stream.flush()
+                except Exception:
+                    # Reported once per batch, like a failed emit of StreamHandler
+                    self.handleError(record)
+                self.written += len(lines)
+        self._idle.set()
+
+    @staticmethod
+    def _wait(done):
+        # Waiting on an Event of the writer's OS thread would block the eventlet hub,
+        # time.sleep is green when eventlet is monkey patched
+        delay = 0.0005
+        while not done():
+            time.sleep(delay)
+            delay = min(delay * 2, 0.05)
+
+    def flush(self):
+        """
+        Wait until every queued record has been written.
+        """
+        if self._writer.is_alive():
+            self._wakeup.set()
+            self._wait(lambda: not self._queue and self._idle.is_set() or not self._writer.is_alive())
+
+    def close(self):
+        if not self._closed:
+            self.flush()
+            self._closed = True
+            self._wakeup.set()
+            self._writer.join(timeout=5)
+        super().close()
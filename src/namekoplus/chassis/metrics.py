@@ -0,0 +1,198 @@
+import atexit
+import random
+import threading
+from datetime import timedelta
+
+from nameko.extensions import DependencyProvider
+from statsd import StatsClient
+
+
+class AggregatingStatsClient(StatsClient):
+    """
+    A statsd client that aggregates metrics in memory and sends them in batches.
+
+    Counters are summed, gauges keep their latest value and timer samples are
+    kept in a bounded reservoir per stat. Everything is flushed as packed
+    multi-metric datagrams every ``flush_interval`` seconds, or as soon as
+    ``max_pending`` metric updates have been buffered.
+
+    It is a drop-in replacement for ``statsd.StatsClient``, so ``@statsd.timer``
+    decorators keep working unchanged. ``tags`` are appended to every metric as
+    DogStatsD tags, which statsd-exporter turns into labels.
+    """
+
+    def __init__(self, host='localhost', port=8125, prefix=None, maxudpsize=1432, ipv6=False,
+                 flush_interval=1.0, max_samples=200, max_pending=5000, tags=None):
+        super().__init__(host, port, prefix=prefix, maxudpsize=maxudpsize, ipv6=ipv6)
+        self._tags = '|#' + ','.join('{}:{}'.format(name, value) for name, value in tags.items()) if tags else ''
+        self.flush_interval = flush_interval
+        self.max_samples = max_samples
+        self.max_pending = max_pending
+
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._sets = {}
+        self._timers = {}
+        self._pending = 0
+
+        self._flusher = None
+        self._stopped = threading.Event()
+        atexit.register(self.flush)
+
+    def timing(self, stat, delta, rate=1):
+        if isinstance(delta, timedelta):
+            delta = delta.total_seconds() * 1000.
+        if rate < 1 and random.random() > rate:
+            return
+        with self._lock:
+            seen, samples = self._timers.get(stat, (0., []))
+            seen += 1. / rate
+            if len(samples) < self.max_samples:
+                samples.append(delta)
+            else:
+                # Reservoir sampling keeps a uniform sample of every timing seen in this interval
+                idx = random.randrange(int(seen))
+                if idx < self.max_samples:
+                    samples[idx] = delta
+            self._timers[stat] = (seen, samples)
+            pending = self._add_pending()
+        self._buffered(pending)
+
+    def incr(self, stat, count=1, rate=1):
+        if rate < 1 and random.random() > rate:
+            return
+        with self._lock:
+            self._counters[stat] = self._counters.get(stat, 0) + count / rate
+            pending = self._add_pending()
+        self._buffered(pending)
+
+    def gauge(self, stat, value, rate=1, delta=False):
+        if rate < 1 and random.random() > rate:
+            return
+        with self._lock:
+            absolute, change = self._gauges.get(stat, (None, 0))
+            if delta:
+                change += value
+            else:
+                absolute, change = value, 0
+            self._gauges[stat] = (absolute, change)
+            pending = self._add_pending()
+        self._buffered(pending)
+
+    def set(self, stat, value, rate=1):
+        if rate < 1 and random.random() > rate:
+            return
+        with self._lock:
+            self._sets.setdefault(stat, set()).add(value)
+            pending = self._add_pending()
+        self._buffered(pending)
+
+    def _add_pending(self):
+        # Called with the lock held, as the flusher resets the count under it
+        self._pending += 1
+        return self._pending
+
+    def _buffered(self, pending):
+        if pending >= self.max_pending:
+            self.flush()
+        elif self._flusher is None:
+            self._start_flusher()
+
+    def _start_flusher(self):
+        with self._lock:
+            if self._flusher is not None:
+                return
+            self._stopped.clear()
+            self._flusher = threading.Thread(target=self._run_flusher, name='statsd-flusher', daemon=True)
+            self._flusher.start()
+
+    def _run_flusher(self):
+        while not self._stopped.wait(self.flush_interval):
+            self.flush()
+
+    def _drain(self):
+        with self._lock:
+            counters, self._counters = self._counters, {}
+            gauges, self._gauges = self._gauges, {}
+            sets, self._sets = self._sets, {}
+            timers, self._timers = self._timers, {}
+            self._pending = 0
+
+        lines = []
+        for stat, count in counters.items():
+            lines.append(self._prepare(stat, '%s|c' % _format_number(count), 1))
+        for stat, (absolute, change) in gauges.items():
+            if absolute is not None:
+                if absolute < 0:
+                    # A negative absolute value would be read as a delta, so reset to zero first
+                    lines.append(self._prepare(stat, '0|g', 1))
+                lines.append(self._prepare(stat, '%s|g' % _format_number(absolute), 1))
+            if change:
+                lines.append(self._prepare(stat, '%+g|g' % change, 1))
+        for stat, values in sets.items():
+            lines.extend(self._prepare(stat, '%s|s' % value, 1) for value in values)
+        for stat, (seen, samples) in timers.items():
+            rate = len(samples) / seen
+            suffix = '|@%0.6g' % rate if rate < 1 else ''
+            lines.extend(self._prepare(stat, '%0.6f|ms%s' % (sample, suffix), 1) for sample in samples)
+        if self._tags:
+            lines = [line + self._tags for line in lines]
+        return lines
+
+    def flush(self):
+        """
+        Send all aggregated metrics as packed datagrams.
+        """
+        lines = self._drain()
+        if not lines or self._sock is None:
+            return
+
+        data = lines[0]
+        for line in lines[1:]:
+            if len(data) + len(line) + 1 >= self._maxudpsize:
+                self._send(data)
+                data = line
+            else:
+                data += '\n' + line
+        self._send(data)
+
+    def stop(self):
+        """
+        Stop the background flusher and send everything that is still buffered.
+        """
+        flusher, self._flusher = self._flusher, None
+        self._stopped.set()
+        if flusher is not None and flusher is not threading.current_thread():
+            flusher.join(self.flush_interval)
+        self.flush()
+
+    def close(self):
+        self.stop()
+        atexit.unregister(self.flush)
+        super().close()
+
+
+def _format_number(value):
+    return int(value) if float(value).is_integer() else '%0.6g' % value
+
+
+class StatsdFlusher(DependencyProvider):
+    """
+    Flush an ``AggregatingStatsClient`` when the service container stops.
+
+    The client itself is returned as the dependency, so it can also be used
+    inside entrypoints as ``self.<attr>.incr(...)``.
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    def stop(self):
+        self.client.stop()
+
+    def kill(self):
+        self.client.stop()
+
+    def get_dependency(self, worker_ctx):
+        return self.client
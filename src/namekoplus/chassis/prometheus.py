@@ -0,0 +1,303 @@
+import os
+import threading
+from bisect import bisect_left
+from logging import getLogger
+from time import perf_counter
+
+import eventlet
+from eventlet import wsgi
+from nameko import config
+from nameko.extensions import DependencyProvider
+from nameko.web.server import parse_address
+
+from ..supervisor import WORKER_ID_ENV
+
+logger = getLogger(__name__)
+
+METRICS_ADDRESS_CONFIG_KEY = 'PROMETHEUS_METRICS_ADDRESS'
+DEFAULT_METRICS_ADDRESS = '0.0.0.0:9464'
+
+ENTRYPOINT_DURATION_METRIC = 'namekoplus_entrypoint_duration_seconds'
+# Named like the pool gauges of init_instrumentation after statsd-exporter, so dashboards work with either
+POOL_METRICS = {
+    'busy': ('namekoplus_pool_busy', 'Workers handling an entrypoint call.'),
+    'size': ('namekoplus_pool_size', 'Size of the worker pool.'),
+    'utilization': ('namekoplus_pool_utilization', 'Share of the worker pool that is busy.'),
+}
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (
+        (name, str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"'))
+        for name, value in pairs
+    )
+    return '{' + ','.join('{}="{}"'.format(name, value) for name, value in escaped) + '}'
+
+
+class Histogram:
+    """
+    A Prometheus histogram with a fixed set of label names.
+    """
+
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(float(bucket) for bucket in buckets))
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, value, *labelvalues):
+        idx = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][idx] += 1
+            series[1] += value
+
+    def collect(self):
+        with self._lock:
+            series = [(labels, list(counts), total) for labels, (counts, total) in self._series.items()]
+
+        for labelvalues, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, labelvalues, [('le', _format_value(bound))])
+                yield '{}_bucket{} {}'.format(self.name, labels, cumulative)
+            labels = _format_labels(self.labelnames, labelvalues)
+            yield '{}_sum{} {}'.format(self.name, labels, _format_value(total))
+            yield '{}_count{} {}'.format(self.name, labels, cumulative)
+
+
+class Counter:
+    """
+    A Prometheus counter with a fixed set of label names.
+    """
+
+    type_name = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self._series[labelvalues] = self._series.get(labelvalues, 0) + amount
+
+    def collect(self):
+        with self._lock:
+            series = list(self._series.items())
+        for labelvalues, value in series:
+            yield '{}{} {}'.format(self.name, _format_labels(self.labelnames, labelvalues), _format_value(value))
+
+
+class Gauge(Counter):
+    """
+    A Prometheus gauge with a fixed set of label names.
+    """
+
+    type_name = 'gauge'
+
+    def set(self, value, *labelvalues):
+        with self._lock:
+            self._series[labelvalues] = value
+
+
+class MetricsRegistry:
+    """
+    A process-wide collection of metrics rendered in the Prometheus text format.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def _get_or_create(self, cls, name, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            elif type(metric) is not cls:
+                raise ValueError('Metric {} is already registered as a {}'.format(name, metric.type_name))
+            else:
+                # Series of the existing metric would not match what the caller observes
+                wanted = cls(name, *args, **kwargs)
+                if metric.labelnames != wanted.labelnames or getattr(metric, 'buckets', None) != getattr(
+                        wanted, 'buckets', None):
+                    raise ValueError('Metric {} is already registered with different labelnames or buckets'.format(
+                        name))
+            return metric
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._get_or_create(Histogram, name, documentation, labelnames, buckets)
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._get_or_create(Gauge, name, documentation, labelnames)
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append('# HELP {} {}'.format(metric.name, metric.documentation))
+            lines.append('# TYPE {} {}'.format(metric.name, metric.type_name))
+            lines.extend(metric.collect())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+
+class ExpositionServer:
+    """
+    A lightweight eventlet HTTP listener serving ``/metrics`` for every service in the process.
+
+    Containers of the same runner share one listener, which is closed when the last one stops.
+    """
+
+    def __init__(self, registry):
+        self.registry = registry
+        self._lock = threading.Lock()
+        self._users = 0
+        self._sock = None
+        self._gt = None
+
+    def __call__(self, environ, start_response):
+        if environ.get('PATH_INFO') != '/metrics':
+            start_response('404 Not Found', [('Content-Type', 'text/plain')])
+            return [b'Not Found']
+        body = self.registry.render().encode('utf-8')
+        start_response('200 OK', [('Content-Type', 'text/plain; version=0.0.4; charset=utf-8'),
+                                  ('Content-Length', str(len(body)))])
+        return [body]
+
+    def acquire(self, address):
+        with self._lock:
+            self._users += 1
+            if self._sock is None:
+                self._sock = eventlet.listen(parse_address(address))
+                self._gt = eventlet.spawn(wsgi.server, self._sock, self, log=logger, log_output=False)
+                logger.info('Serving prometheus metrics on %s/metrics', address)
+
+    def release(self):
+        with self._lock:
+            self._users -= 1
+            if self._users > 0 or self._sock is None:
+                return
+            self._gt.kill()
+            self._sock.close()
+            self._sock = self._gt = None
+
+
+exposition_server = ExpositionServer(REGISTRY)
+
+
+def worker_address(address):
+    """
+    Offset the port of ``address`` by the worker id of a `namekoplus run` process,
+    so the processes of one service do not compete for the same port.
+    """
+    worker_id = os.environ.get(WORKER_ID_ENV)
+    if worker_id is None:
+        return address
+    host, port = address.rsplit(':', 1)
+    return '{}:{}'.format(host, int(port) + int(worker_id))
+
+
+class PrometheusMetrics(DependencyProvider):
+    """
+    Record a latency histogram for every entrypoint of the service and expose it to Prometheus.
+
+    Metrics are served on ``http://<PROMETHEUS_METRICS_ADDRESS>/metrics``, so Prometheus can scrape
+    services directly instead of going through statsd-agent and statsd-exporter. In the processes
+    of `namekoplus run` the port is offset by the worker id and series get a ``worker`` label.
+    The worker pool is described by the ``namekoplus_pool_busy``, ``_size`` and ``_utilization``
+    gauges, updated whenever a worker starts or ends.
+    The dependency injected into workers is the metrics registry, which can be used to add
+    custom histograms, counters and gauges.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, address=None):
+        self.buckets = buckets
+        self.address = address
+        self.histogram = None
+        self.pool_gauges = {}
+        self.worker_id = None
+        self.started_at = {}
+
+    def setup(self):
+        labelnames = ('service', 'entrypoint', 'outcome')
+        self.worker_id = os.environ.get(WORKER_ID_ENV)
+        if self.worker_id is not None:
+            labelnames += ('worker',)
+        self.histogram = REGISTRY.histogram(
+            ENTRYPOINT_DURATION_METRIC, 'Time spent handling an entrypoint call.', labelnames, self.buckets
+        )
+        pool_labelnames = ('service',) if self.worker_id is None else ('service', 'worker')
+        self.pool_gauges = {
+            kind: REGISTRY.gauge(name, documentation, pool_labelnames)
+            for kind, (name, documentation) in POOL_METRICS.items()
+        }
+
+    def _update_pool(self, ending=0):
+        pool = self.container._worker_pool
+        size = pool.size or 1
+        busy = max(pool.running() - ending, 0)
+        labelvalues = (self.container.service_name,)
+        if self.worker_id is not None:
+            labelvalues += (self.worker_id,)
+        self.pool_gauges['busy'].set(busy, *labelvalues)
+        self.pool_gauges['size'].set(size, *labelvalues)
+        self.pool_gauges['utilization'].set(round(busy / float(size), 3), *labelvalues)
+
+    def start(self):
+        address = self.address or config.get(METRICS_ADDRESS_CONFIG_KEY, DEFAULT_METRICS_ADDRESS)
+        exposition_server.acquire(worker_address(address))
+
+    def stop(self):
+        exposition_server.release()
+
+    def kill(self):
+        exposition_server.release()
+
+    def get_dependency(self, worker_ctx):
+        return REGISTRY
+
+    def worker_setup(self, worker_ctx):
+        self.started_at[worker_ctx] = perf_counter()
+        self._update_pool()
+
+    def worker_result(self, worker_ctx, result=None, exc_info=None):
+        started_at = self.started_at.pop(worker_ctx, None)
+        if started_at is None:
+            return
+        outcome = 'error' if exc_info is not None else 'success'
+        labelvalues = (worker_ctx.service_name, worker_ctx.entrypoint.method_name, outcome)
+        if self.worker_id is not None:
+            labelvalues += (self.worker_id,)
+        self.histogram.observe(perf_counter() - started_at, *labelvalues)
+
+    def worker_teardown(self, worker_ctx):
+        self.started_at.pop(worker_ctx, None)
+        # The worker tearing down still counts as running
+        self._update_pool(ending=1)
@@ -0,0 +1,220 @@
+"""
+Error reporting to Sentry that stays cheap while everything is failing.
+
+A failing worker only fingerprints its exception and hands it to a bounded queue.
+Within a window, the first occurrences of a fingerprint are reported and the rest
+are only counted, the count is reported once the window is over. The context of
+a report, e.g. the HTTP request, is collected by the worker while it is still
+valid, and only for the occurrences that are reported. Building the Sentry event,
+which walks the stack and serializes the context, and sending it happen in a
+background thread of the container.
+"""
+
+import hashlib
+import time
+from collections import OrderedDict
+from logging import getLogger
+
+from eventlet.queue import Empty, Full, LightQueue
+from nameko_sentry import SentryReporter
+
+logger = getLogger(__name__)
+
+OCCURRENCES_KEY = 'occurrences'
+
+
+def fingerprint(worker_ctx, exc_info, depth=20):
+    """
+    Identify an exception by its entrypoint, its type and the functions it passed through.
+
+    Line numbers and the exception message are left out, so the same failure with different
+    arguments, or in a slightly edited module, has the same fingerprint.
+    """
+    exc_type, _, tb = exc_info
+    parts = [worker_ctx.service_name, worker_ctx.entrypoint.method_name,
+             exc_type.__module__, exc_type.__qualname__]
+    frames = []
+    while tb is not None:
+        code = tb.tb_frame.f_code
+        frames.append('{}:{}'.format(code.co_filename, code.co_name))
+        tb = tb.tb_next
+    # The innermost frames tell failures apart, the outer ones are the same nameko plumbing
+    parts.extend(frames[-depth:])
+    return hashlib.sha1('\n'.join(parts).encode('utf-8')).hexdigest()[:16]
+
+
+class _Window:
+
+    def __init__(self, started_at):
+        self.started_at = started_at
+        self.reported = 0
+        self.suppressed = 0
+        self.representative = None
+
+
+class DeduplicatingSentryReporter(SentryReporter):
+    """
+    Report entrypoint exceptions to Sentry asynchronously, aggregating duplicates.
+
+    For every fingerprint, at most ``max_reports`` exceptions are reported per ``window``
+    seconds. The others are counted, and the first of them is reported at the end of
+    the window with the count in its ``occurrences`` extra. Reports that do not fit into
+    the ``max_queue`` slots of the queue are dropped.
+
+    Counts of reported, suppressed and dropped exceptions are sent as ``sentry.reported``,
+    ``sentry.suppressed`` and ``sentry.dropped`` to the optional statsd client.
+
+    :Parameters:
+        window : float
+            Seconds over which duplicates are aggregated
+        max_reports : int
+            Exceptions of one fingerprint reported right away within a window
+        max_queue : int
+            Reports waiting for the background thread
+        max_fingerprints : int
+            Fingerprints tracked at once, the least recently seen ones are forgotten
+        statsd : statsd.StatsClient
+            Client the counts are sent with, optional
+    """
+
+    def __init__(self, window=60.0, max_reports=1, max_queue=100, max_fingerprints=1000, statsd=None):
+        self.window = window
+        self.max_reports = max_reports
+        self.max_queue = max_queue
+        self.max_fingerprints = max_fingerprints
+        self.statsd = statsd
+        self.windows = OrderedDict()
+        self.queue = None
+        self.dropped = 0
+        self._running = False
+
+    def setup(self):
+        super().setup()
+        self.queue = LightQueue(self.max_queue)
+
+    def start(self):
+        self._running = True
+        self.container.spawn_managed_thread(self._run, identifier='DeduplicatingSentryReporter')
+
+    def stop(self):
+        self._running = False
+        # Report what is still waiting, including the counts of open windows
+        self._close_windows(force=True)
+        self._drain()
+
+    def kill(self):
+        self._running = False
+
+    def _incr(self, stat):
+        if self.statsd is not None:
+            self.statsd.incr(stat)
+
+    def worker_setup(self, worker_ctx):
+        # The HTTP context is only collected for exceptions that are reported
+        pass
+
+    def collect_context(self, worker_ctx, exc_info):
+        """
+        The Sentry context of an exception, collected before its worker is torn down.
+
+        The request of an HTTP entrypoint and the context data can change or be closed
+        once the worker is done, so the background thread only sends what is collected here.
+        """
+        try:
+            self.http_context(worker_ctx)
+            self.user_context(worker_ctx, exc_info)
+            self.tags_context(worker_ctx, exc_info)
+            self.extra_context(worker_ctx, exc_info)
+            # Clearing replaces the data of the context, so this one is left to the report
+            return self.client.context.get()
+        except Exception:
+            logger.warning('Failed to collect the Sentry context of an exception', exc_info=True)
+            return {}
+        finally:
+            self.client.context.clear(deactivate=True)
+
+    def worker_result(self, worker_ctx, result, exc_info):
+        if exc_info is None:
+            return
+        if not self.report_expected_exceptions and self.is_expected_exception(worker_ctx, exc_info):
+            return
+
+        key = fingerprint(worker_ctx, exc_info)
+        now = time.monotonic()
+        window = self.windows.get(key)
+        if window is not None and now - window.started_at >= self.window:
+            self._close_window(window)
+            del self.windows[key]
+            window = None
+        if window is None:
+            window = self.windows[key] = _Window(now)
+            if len(self.windows) > self.max_fingerprints:
+                self._close_window(self.windows.popitem(last=False)[1])
+        else:
+            self.windows.move_to_end(key)
+
+        if window.reported < self.max_reports:
+            window.reported += 1
+            self._enqueue(worker_ctx, exc_info, self.collect_context(worker_ctx, exc_info), 1)
+        else:
+            window.suppressed += 1
+            if window.representative is None:
+                # The other duplicates are only counted, without the cost of their context
+                window.representative = (worker_ctx, exc_info, self.collect_context(worker_ctx, exc_info))
+            self._incr('sentry.suppressed')
+
+    def worker_teardown(self, worker_ctx):
+        pass
+
+    def _enqueue(self, worker_ctx, exc_info, context, occurrences):
+        try:
+            self.queue.put_nowait((worker_ctx, exc_info, context, occurrences))
+        except Full:
+            self.dropped += 1
+            self._incr('sentry.dropped')
+
+    def _close_window(self, window):
+        if window.suppressed:
+            worker_ctx, exc_info, context = window.representative
+            self._enqueue(worker_ctx, exc_info, context, window.suppressed)
+            window.suppressed = 0
+            window.representative = None
+
+    def _close_windows(self, force=False):
+        now = time.monotonic()
+        for key, window in list(self.windows.items()):
+            if force or now - window.started_at >= self.window:
+                self._close_window(window)
+                del self.windows[key]
+
+    def _run(self):
+        while self._running:
+            try:
+                report = self.queue.get(timeout=1.0)
+            except Empty:
+                self._close_windows()
+                continue
+            self.report(*report)
+            self._close_windows()
+
+    def _drain(self):
+        while True:
+            try:
+                report = self.queue.get_nowait()
+            except Empty:
+                return
+            self.report(*report)
+
+    def report(self, worker_ctx, exc_info, context, occurrences):
+        """
+        Build and send the Sentry event of one exception with the context collected by its worker.
+        """
+        try:
+            self.client.context.merge(context)
+            self.client.extra_context({OCCURRENCES_KEY: occurrences})
+            self.capture_exception(worker_ctx, exc_info)
+            self._incr('sentry.reported')
+        except Exception:
+            logger.warning('Failed to report an exception to Sentry', exc_info=True)
+        finally:
+            self.client.context.clear(deactivate=True)
@@ -0,0 +1,318 @@
+"""
+Keep latency bounded under overload.
+
+``AdaptiveConcurrency`` limits the number of workers in flight per entrypoint with an
+AIMD limit driven by observed latency, and sheds the work above it before a worker is
+spawned for it. Shed RPC calls fail fast with ``Overloaded``. Event handlers declared
+with ``requeue_on_error=True`` are not shed, as a requeued event would come straight
+back; their events wait for a worker and the prefetch count bounds them.
+
+``ResilientServiceRpc`` wraps outgoing calls in a circuit breaker per target method and
+retries failures with jittered backoff, within a retry budget so that retries cannot
+multiply the load on a service that is already struggling.
+"""
+
+import threading
+import time
+from weakref import WeakKeyDictionary
+
+import eventlet
+from circuitbreaker import CircuitBreaker, CircuitBreakerError
+from nameko.exceptions import RemoteError, RpcTimeout
+from nameko.extensions import DependencyProvider
+from nameko.rpc import ServiceRpc
+from tenacity import Retrying, retry_if_exception, stop_after_attempt, wait_random_exponential
+
+from .hooks import spawn_hooks
+
+
+class Overloaded(Exception):
+    pass
+
+
+class AdaptiveLimiter:
+    """
+    An AIMD concurrency limit.
+
+    A completion slower than ``target_latency`` (or, without a target, ``tolerance`` times
+    the baseline latency seen without load) cuts the limit, at most once per such latency.
+    The cut is proportional to how far the latency is over the threshold, between
+    ``backoff`` and half the limit. Other completions grow it by ``1 / limit`` while the
+    limit is in use.
+    """
+
+    def __init__(self, initial=10, min_limit=1, max_limit=100, target_latency=None, tolerance=2.0, backoff=0.9):
+        self.limit = float(min(max(initial, min_limit), max_limit))
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.target_latency = target_latency
+        self.tolerance = tolerance
+        self.backoff = backoff
+        self.in_flight = 0
+        self.baseline = None
+        self._last_decrease = 0.
+        self._lock = threading.Lock()
+
+    @property
+    def threshold(self):
+        if self.target_latency is not None:
+            return self.target_latency
+        return None if self.baseline is None else self.baseline * self.tolerance
+
+    def acquire(self):
+        with self._lock:
+            if self.in_flight >= int(self.limit):
+                return False
+            self.in_flight += 1
+            return True
+
+    def release(self, latency=None, overloaded=False):
+        with self._lock:
+            self.in_flight -= 1
+            if latency is None:
+                # The call never completed, so there is no latency to learn from
+                return
+            # The baseline follows the fastest completions and drifts up slowly,
+            # so it recovers when the service legitimately gets slower
+            if self.baseline is None or latency < self.baseline:
+                self.baseline = latency
+            else:
+                self.baseline *= 1.001
+
+            threshold = self.threshold
+            now = time.monotonic()
+            if overloaded or (threshold is not None and latency > threshold):
+                if now - self._last_decrease > latency:
+                    factor = self.backoff if threshold is None else max(0.5, min(self.backoff, threshold / latency))
+                    self.limit = max(self.min_limit, self.limit * factor)
+                    self._last_decrease = now
+            elif self.in_flight + 1 >= self.limit / 2:
+                self.limit = min(self.max_limit, self.limit + 1. / self.limit)
+
+
+class AdaptiveConcurrency(DependencyProvider):
+    """
+    Limit the workers in flight of every entrypoint of the service and shed the excess.
+
+    Calls over the limit are rejected with ``Overloaded`` before they wait for a free
+    worker, so they neither take a worker nor hold a prefetched message for long.
+
+    :Parameters:
+        target_latency : float
+            Latency in seconds above which the limit is cut, derived from the observed
+            baseline latency when not given
+        min_limit : int
+            Lowest limit per entrypoint
+        max_limit : int
+            Highest limit per entrypoint, ``max_workers`` of the service by default
+        statsd : statsd.StatsClient
+            Client ``limiter.<entrypoint>.limit`` and ``limiter.<entrypoint>.shed`` are sent to, optional
+    """
+
+    def __init__(self, target_latency=None, min_limit=1, max_limit=None, tolerance=2.0, backoff=0.9, statsd=None):
+        self.target_latency = target_latency
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.tolerance = tolerance
+        self.backoff = backoff
+        self.statsd = statsd
+        self.limiters = {}
+        self.admitted = WeakKeyDictionary()
+
+    def setup(self):
+        if self.max_limit is None:
+            self.max_limit = self.container.max_workers
+        hooks = spawn_hooks(self.container)
+        hooks.admission.append(self._admit)
+        hooks.spawned.append(self._spawned)
+        hooks.exited.append(self._exited)
+
+    def limiter(self, method_name):
+        limiter = self.limiters.get(method_name)
+        if limiter is None:
+            limiter = self.limiters[method_name] = AdaptiveLimiter(
+                initial=self.max_limit, min_limit=self.min_limit, max_limit=self.max_limit,
+                target_latency=self.target_latency, tolerance=self.tolerance, backoff=self.backoff
+            )
+        return limiter
+
+    def get_dependency(self, worker_ctx):
+        return self.limiter(worker_ctx.entrypoint.method_name)
+
+    @staticmethod
+    def sheddable(entrypoint):
+        # A requeued event would be redelivered at once, keeping the service just as busy
+        return not getattr(entrypoint, 'requeue_on_error', False)
+
+    def _admit(self, entrypoint):
+        if not self.sheddable(entrypoint):
+            return
+        method_name = entrypoint.method_name
+        limiter = self.limiter(method_name)
+        if limiter.acquire():
+            return limiter.release
+        if self.statsd is not None:
+            self.statsd.incr('limiter.{}.shed'.format(method_name))
+        raise Overloaded('{} is over its concurrency limit of {}'.format(method_name, int(limiter.limit)))
+
+    def _spawned(self, worker_ctx, waited, handle_result):
+        # Admission ran in this same call of spawn_worker and acquired the limiter
+        if worker_ctx is not None and handle_result is not None and self.sheddable(worker_ctx.entrypoint):
+            self.admitted[worker_ctx] = None
+
+    def worker_setup(self, worker_ctx):
+        if worker_ctx in self.admitted:
+            self.admitted[worker_ctx] = time.perf_counter()
+
+    def worker_result(self, worker_ctx, result=None, exc_info=None):
+        if worker_ctx not in self.admitted:
+            return
+        started_at = self.admitted.pop(worker_ctx) or time.perf_counter()
+        limiter = self.limiter(worker_ctx.entrypoint.method_name)
+        overloaded = exc_info is not None and _is_overload(exc_info[1])
+        limiter.release(time.perf_counter() - started_at, overloaded=overloaded)
+        if self.statsd is not None:
+            self.statsd.gauge('limiter.{}.limit'.format(worker_ctx.entrypoint.method_name), int(limiter.limit))
+
+    def _exited(self, worker_ctx):
+        # worker_result did not run, e.g. dependency injection or handle_result raised
+        if worker_ctx in self.admitted:
+            del self.admitted[worker_ctx]
+            self.limiter(worker_ctx.entrypoint.method_name).release()
+
+
+def _is_overload(exc):
+    if isinstance(exc, (Overloaded, RpcTimeout, CircuitBreakerError)):
+        return True
+    return isinstance(exc, RemoteError) and exc.exc_type == 'Overloaded'
+
+
+class RetryBudget:
+    """
+    A token bucket that lets retries add at most ``ratio`` extra requests on top of
+    the requests made, plus ``min_per_second`` so a quiet client can still retry.
+    """
+
+    def __init__(self, ratio=0.1, min_per_second=1.0, capacity=10):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self._refilled_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self.tokens = min(self.capacity, self.tokens + self.ratio)
+
+    def withdraw(self):
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self._refilled_at) * self.min_per_second)
+            self._refilled_at = now
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+class ResilientClient:
+    """
+    A ServiceRpc client whose calls go through a circuit breaker and a budgeted retry policy.
+    """
+
+    def __init__(self, client, provider):
+        self._client = client
+        self._provider = provider
+
+    def __getattr__(self, name):
+        method = getattr(self._client, name)
+        provider = self._provider
+
+        def call(*args, **kwargs):
+            provider.budget.deposit()
+            for attempt in provider.retrying():
+                with attempt:
+                    return provider.call(name, method, args, kwargs)
+        call.call_async = method.call_async
+        return call
+
+
+class ResilientServiceRpc(ServiceRpc):
+    """
+    ServiceRpc with a circuit breaker per target method and jittered, budgeted retries.
+
+    A call fails, for the breaker and for retries, when it times out or when the remote
+    raised one of ``retry_on`` (exception type names, as in ``RemoteError.exc_type``).
+    Other remote errors are the target's answer and are raised as they are.
+
+    :Parameters:
+        target_service : str
+            Target service name
+        timeout : float
+            Seconds to wait for each attempt, no timeout when not given
+        attempts : int
+            Maximum attempts per call
+        failure_threshold : int
+            Consecutive failures that open the breaker of a method
+        recovery_timeout : float
+            Seconds an open breaker waits before letting a trial call through
+        retry_ratio : float
+            Retries allowed as a fraction of calls, see ``RetryBudget``
+    """
+
+    def __init__(self, target_service, timeout=None, attempts=3, retry_on=('Overloaded',),
+                 failure_threshold=5, recovery_timeout=30, retry_ratio=0.1, backoff=0.05, max_backoff=2.0,
+                 **kwargs):
+        self.timeout = timeout
+        self.attempts = attempts
+        self.retry_on = tuple(retry_on)
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.budget = RetryBudget(ratio=retry_ratio)
+        self.breakers = {}
+        super().__init__(target_service, **kwargs)
+
+    def is_failure(self, exc):
+        if isinstance(exc, RpcTimeout):
+            return True
+        return isinstance(exc, RemoteError) and exc.exc_type in self.retry_on
+
+    def breaker(self, method_name):
+        breaker = self.breakers.get(method_name)
+        if breaker is None:
+            breaker = self.breakers[method_name] = CircuitBreaker(
+                failure_threshold=self.failure_threshold, recovery_timeout=self.recovery_timeout,
+                expected_exception=lambda exc_type, exc: self.is_failure(exc),
+                name='{}.{}'.format(self.target_service, method_name)
+            )
+        return breaker
+
+    def retrying(self):
+        return Retrying(
+            stop=stop_after_attempt(self.attempts),
+            wait=wait_random_exponential(multiplier=self.backoff, max=self.max_backoff),
+            retry=retry_if_exception(lambda exc: self.is_failure(exc) and self.budget.withdraw()),
+            reraise=True,
+        )
+
+    def call(self, method_name, method, args, kwargs):
+        breaker = self.breaker(method_name)
+        if breaker.opened:
+            raise CircuitBreakerError(breaker)
+        with breaker:
+            if self.timeout is None:
+                return method(*args, **kwargs)
+            rpc_call = method.call_async(*args, **kwargs)
+            try:
+                with eventlet.Timeout(self.timeout, RpcTimeout):
+                    return rpc_call.result()
+            except RpcTimeout:
+                self.reply_listener.pending.pop(rpc_call.correlation_id, None)
+                raise RpcTimeout('{}.{} timed out after {}s'.format(self.target_service, method_name, self.timeout))
+
+    def get_dependency(self, worker_ctx):
+        client = super().get_dependency(worker_ctx)
+        return ResilientClient(client, self)
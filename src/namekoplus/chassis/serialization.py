@@ -0,0 +1,131 @@
+"""
+Faster serializers and size based compression for AMQP messages.
+
+The serializers are registered through nameko's own ``SERIALIZERS`` config and
+chosen with ``serializer``, e.g. in ``config.yml``::
+
+    serializer: orjson
+    ACCEPT: [orjson, msgpack, json]
+    SERIALIZERS:
+        orjson:
+            encoder: namekoplus.chassis.serialization.orjson_dumps
+            decoder: namekoplus.chassis.serialization.orjson_loads
+            content_type: application/x-orjson
+            content_encoding: utf-8
+        msgpack:
+            encoder: namekoplus.chassis.serialization.msgpack_dumps
+            decoder: namekoplus.chassis.serialization.msgpack_loads
+            content_type: application/x-msgpack
+            content_encoding: binary
+    COMPRESSION: zlib
+    COMPRESSION_THRESHOLD: 16384
+
+``orjson`` writes the same JSON as nameko's ``json`` serializer, with kombu's envelopes
+for dates, decimals and bytes; only ``uuid.UUID`` values arrive as strings. It travels
+under its own ``application/x-orjson`` content type, so kombu's ``application/json``
+decoder stays in place for every other message of the process, and only services that
+accept ``orjson`` read it. ``msgpack`` is smaller still, and likewise only read by
+services that accept it. RPC replies are always encoded like their request, so callers
+get the format they sent. Switch ``serializer`` once every consumer accepts the format.
+
+Messages whose serialized body reaches ``COMPRESSION_THRESHOLD`` bytes are compressed
+with ``COMPRESSION`` (any kombu compression, e.g. ``zlib``, ``bz2``, ``lzma``). The
+method travels in kombu's ``compression`` header, which every kombu consumer
+decompresses transparently. Publishers only compress once ``register_compression``
+is called, e.g. at the top of the service module; ``namekoplus profile`` and the
+generated benchmarks call it themselves.
+"""
+
+import json
+
+from kombu.serialization import dumps
+from kombu.utils.json import JSONEncoder, dumps as json_dumps, object_hook
+from nameko import config
+from nameko.amqp.publish import Publisher
+
+COMPRESSION_CONFIG_KEY = 'COMPRESSION'
+COMPRESSION_THRESHOLD_CONFIG_KEY = 'COMPRESSION_THRESHOLD'
+DEFAULT_COMPRESSION_THRESHOLD = 16384
+
+_TYPE_MARKER = b'"__type__"'
+
+# Encodes dates, decimals, bytes and objects with ``__json__`` in kombu's envelopes
+_default = JSONEncoder().default
+
+
+def orjson_dumps(obj):
+    import orjson
+    try:
+        return orjson.dumps(obj, default=_default,
+                            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME)
+    except orjson.JSONEncodeError:
+        # e.g. integers beyond 64 bits
+        return json_dumps(obj)
+
+
+def orjson_loads(data):
+    import orjson
+    if isinstance(data, memoryview):
+        data = data.tobytes()
+    marker = _TYPE_MARKER if isinstance(data, bytes) else _TYPE_MARKER.decode()
+    if marker in data:
+        # The envelopes have to be decoded dict by dict, which the C scanner of the
+        # json module does with less overhead than walking orjson's result
+        return json.loads(data, object_hook=object_hook)
+    return orjson.loads(data)
+
+
+def msgpack_dumps(obj):
+    import msgpack
+    return msgpack.packb(obj, use_bin_type=True, default=_default)
+
+
+def msgpack_loads(data):
+    import msgpack
+    return msgpack.unpackb(data, raw=False, strict_map_key=False, object_hook=object_hook)
+
+
+class CompressingPublisher(Publisher):
+    """
+    A nameko publisher compressing messages from ``COMPRESSION_THRESHOLD`` bytes on.
+
+    The payload is serialized here, once, to learn its size. Publishers with an
+    explicit ``compression`` keep compressing every message.
+    """
+
+    def publish(self, payload, **kwargs):
+        method = config.get(COMPRESSION_CONFIG_KEY)
+        if not method or self.compression or kwargs.get('compression') or 'content_type' in kwargs:
+            return super().publish(payload, **kwargs)
+
+        threshold = config.get(COMPRESSION_THRESHOLD_CONFIG_KEY, DEFAULT_COMPRESSION_THRESHOLD)
+        serializer = kwargs.pop('serializer', self.serializer)
+        content_type, content_encoding, body = dumps(payload, serializer=serializer)
+        if len(body) >= threshold:
+            kwargs['compression'] = method
+        return super().publish(body, content_type=content_type, content_encoding=content_encoding, **kwargs)
+
+
+# Classes of nameko's RPC, reply and event publishers, by module
+PUBLISHING_CLASSES = {
+    'nameko.messaging': ('Publisher',),
+    'nameko.rpc': ('Responder', 'ClusterRpc'),
+    'nameko.standalone.rpc': ('ClusterRpcClient',),
+}
+
+
+def register_compression(module_name=None):
+    """
+    Make nameko's RPC, reply and event publishers compress large messages.
+
+    Nothing changes until ``COMPRESSION`` is set in the config. Only the classes of
+    ``module_name``, one of ``PUBLISHING_CLASSES``, are patched when it is given.
+    """
+    import importlib
+
+    for name in [module_name] if module_name else PUBLISHING_CLASSES:
+        module = importlib.import_module(name)
+        for cls_name in PUBLISHING_CLASSES[name]:
+            cls = getattr(module, cls_name)
+            if cls.publisher_cls is Publisher:
+                cls.publisher_cls = CompressingPublisher
@@ -0,0 +1,163 @@
+"""
+Sampled entrypoint tracing with compact single-line records.
+
+The sampling decision is taken once, where a call chain enters the system, and
+travels with the nameko context data, so an RPC call or event of a sampled call is
+sampled as well. Failed and slow calls are always kept. Every call, sampled or not,
+also lands in a bounded in-memory ring buffer that can be dumped on demand.
+"""
+
+import json
+import os
+import random
+import signal
+import time
+from collections import deque
+from logging import getLogger
+from weakref import WeakSet
+
+import eventlet
+from nameko import config
+from nameko.extensions import DependencyProvider
+from nameko.utils import get_redacted_args
+
+TRACING_CONFIG_KEY = 'TRACING'
+SAMPLED_CONTEXT_KEY = 'trace_sampled'
+
+logger = getLogger(__name__)
+
+_tracers = WeakSet()
+
+
+def _short(value, limit=200):
+    text = value if isinstance(value, str) else repr(value)
+    return text if len(text) <= limit else text[:limit] + '...'
+
+
+def dump_traces(path=None):
+    """
+    Write the ring buffers of every tracer in this process as JSON lines.
+
+    Written to ``path`` when given, to the tracing logger otherwise. Returns the number of records.
+    """
+    records = sorted((record for tracer in list(_tracers) for record in list(tracer.recent)),
+                     key=lambda record: record['ts'])
+    lines = [json.dumps(record, separators=(',', ':'), default=repr) for record in records]
+    if path is None:
+        for line in lines:
+            logger.info(line)
+    else:
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(''.join(line + '\n' for line in lines))
+    return len(lines)
+
+
+def _dump_on_signal(signum, frame):
+    path = os.path.join(os.environ.get('TMPDIR', '/tmp'), 'namekoplus-traces-{}.jsonl'.format(os.getpid()))
+    # Signal handlers run in the hub and cannot use eventlet primitives
+    eventlet.spawn_n(dump_traces, path)
+
+
+class SampledTracer(DependencyProvider):
+    """
+    Trace a sample of the entrypoint calls of the service.
+
+    Settings are taken from the arguments, then from the ``TRACING`` config section
+    (``SAMPLE_RATE``, ``SLOW_THRESHOLD``, ``RING_SIZE``, ``INCLUDE_ARGS``).
+
+    :Parameters:
+        sample_rate : float
+            Fraction of call chains that are traced
+        slow_threshold : float
+            Calls slower than this many seconds are always traced
+        ring_size : int
+            Number of recent calls kept in memory for ``dump_traces``
+        include_args : bool
+            Add call arguments, with the entrypoint's sensitive arguments redacted
+        dump_signal : int
+            Signal that dumps the ring buffers to ``$TMPDIR/namekoplus-traces-<pid>.jsonl``,
+            e.g. ``signal.SIGUSR2``; off by default, as it replaces any handler the process has
+    """
+
+    def __init__(self, sample_rate=None, slow_threshold=None, ring_size=None, include_args=None,
+                 dump_signal=None):
+        self.options = {
+            'SAMPLE_RATE': sample_rate,
+            'SLOW_THRESHOLD': slow_threshold,
+            'RING_SIZE': ring_size,
+            'INCLUDE_ARGS': include_args,
+        }
+        self.dump_signal = dump_signal
+        self.recent = None
+        self.started_at = {}
+
+    def _setting(self, key, default):
+        value = self.options[key]
+        if value is None:
+            value = config.get(TRACING_CONFIG_KEY, {}).get(key, default)
+        return value
+
+    def setup(self):
+        self.sample_rate = float(self._setting('SAMPLE_RATE', 0.01))
+        self.slow_threshold = float(self._setting('SLOW_THRESHOLD', 1.0))
+        self.include_args = bool(self._setting('INCLUDE_ARGS', False))
+        self.recent = deque(maxlen=int(self._setting('RING_SIZE', 1000)))
+        _tracers.add(self)
+        if self.dump_signal is not None:
+            try:
+                signal.signal(self.dump_signal, _dump_on_signal)
+            except ValueError:
+                # Not in the main thread, e.g. in tests; dump_traces() still works
+                pass
+
+    def worker_setup(self, worker_ctx):
+        sampled = worker_ctx.data.get(SAMPLED_CONTEXT_KEY)
+        if sampled is None:
+            # Head of the call chain: decide for every call it leads to
+            sampled = '1' if random.random() < self.sample_rate else '0'
+            worker_ctx.data[SAMPLED_CONTEXT_KEY] = sampled
+        self.started_at[worker_ctx] = (time.time(), time.perf_counter())
+
+    def worker_result(self, worker_ctx, result=None, exc_info=None):
+        started = self.started_at.pop(worker_ctx, None)
+        if started is None:
+            return
+        started_ts, started_perf = started
+        duration = time.perf_counter() - started_perf
+
+        stack = worker_ctx.call_id_stack
+        record = {
+            'ts': round(started_ts, 6),
+            'trace': stack[0],
+            'call': worker_ctx.call_id,
+            'parent': worker_ctx.immediate_parent_call_id,
+            'service': worker_ctx.service_name,
+            'entrypoint': worker_ctx.entrypoint.method_name,
+            'type': type(worker_ctx.entrypoint).__name__,
+            'ms': round(duration * 1000, 3),
+            'status': 'ok' if exc_info is None else 'error',
+        }
+        if exc_info is not None:
+            record['error'] = '{}: {}'.format(exc_info[0].__name__, _short(str(exc_info[1])))
+        self.recent.append(record)
+
+        if exc_info is not None:
+            reason = 'error'
+        elif duration >= self.slow_threshold:
+            reason = 'slow'
+        elif worker_ctx.data.get(SAMPLED_CONTEXT_KEY) == '1':
+            reason = 'sampled'
+        else:
+            return
+
+        record = dict(record, kept=reason)
+        if self.include_args:
+            callargs = get_redacted_args(worker_ctx.entrypoint, *worker_ctx.args, **worker_ctx.kwargs)
+            record['args'] = {key: _short(value) for key, value in callargs.items() if key != 'self'}
+        logger.info(json.dumps(record, separators=(',', ':'), default=repr))
+
+    def worker_teardown(self, worker_ctx):
+        self.started_at.pop(worker_ctx, None)
+
+    def get_dependency(self, worker_ctx):
+        return self
@@ -0,0 +1,217 @@
+"""
+Adjust the worker pool and prefetch count of a running service to its workload.
+"""
+
+import threading
+import time
+from logging import getLogger
+from weakref import WeakKeyDictionary
+
+from nameko.amqp.consume import Consumer as ConsumerCore
+from nameko.extensions import DependencyProvider
+from nameko.rpc import ReplyListener
+
+from .hooks import spawn_hooks
+
+_log = getLogger(__name__)
+
+
+class _Window:
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.waits = 0.
+        self.spawned = 0
+        self.latencies = 0.
+        self.completed = 0
+        self.busy = 0.
+        self.samples = 0
+
+    @property
+    def mean_wait(self):
+        return self.waits / self.spawned if self.spawned else 0.
+
+    @property
+    def mean_latency(self):
+        return self.latencies / self.completed if self.completed else None
+
+    @property
+    def utilization(self):
+        return self.busy / self.samples if self.samples else 0.
+
+
+class WorkloadTuner(DependencyProvider):
+    """
+    Resize the worker pool and the AMQP prefetch count within bounds.
+
+    Every ``interval`` seconds the tuner looks at the worker pool utilization, the time
+    messages waited for a free worker and the entrypoint latency:
+
+    - when messages wait for workers, or the pool is more than ``target_utilization``
+      busy, and latency stays close to its baseline, the work is IO bound and the pool
+      grows by ``step``. Messages beyond the prefetch count wait in the broker, where
+      their wait cannot be seen, so a busy pool alone is enough to grow it
+    - when latency climbs above ``latency_tolerance`` times its baseline, more workers
+      only compete for the CPU and the pool shrinks by ``step``
+    - when the pool stays mostly idle it shrinks slowly towards ``min_workers``
+
+    The prefetch count of every consumer follows the pool size times ``prefetch_ratio``,
+    so an instance does not hoard messages it has no worker for.
+
+    The tuner only sees workers through the ``worker_setup`` and ``worker_teardown``
+    hooks, and the time calls waited for one and the exit of their greenthread through
+    ``namekoplus.chassis.hooks``, as teardown is skipped when ``handle_result`` raises. It
+    keeps ``container.max_workers`` in line with the pool size it picks.
+
+    Decisions are logged on ``namekoplus.chassis.tuning`` and sent as
+    ``tuner.max_workers``, ``tuner.prefetch_count``, ``tuner.utilization`` and
+    ``tuner.queue_wait`` to the optional statsd client.
+    """
+
+    def __init__(self, min_workers=2, max_workers=200, interval=5.0, step=0.25, wait_threshold=0.01,
+                 latency_tolerance=2.0, target_utilization=0.8, prefetch_ratio=1.0, statsd=None):
+        self.min_workers = min_workers
+        self.max_workers = max_workers
+        self.interval = interval
+        self.step = step
+        self.wait_threshold = wait_threshold
+        self.latency_tolerance = latency_tolerance
+        self.target_utilization = target_utilization
+        self.prefetch_ratio = prefetch_ratio
+        self.statsd = statsd
+
+        self.window = _Window()
+        self.baseline_latency = None
+        self.consumers = {}
+        self.pending_prefetch = None
+        self.started = WeakKeyDictionary()
+        self.busy = 0
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def setup(self):
+        hooks = spawn_hooks(self.container)
+        hooks.spawned.append(self._spawned)
+        hooks.exited.append(self._exited)
+
+    def start(self):
+        # Entrypoint consumers are set up by now and start after dependencies
+        for extension in self.container.extensions:
+            if isinstance(extension, ReplyListener):
+                continue
+            consumer = getattr(extension, 'consumer', None)
+            if isinstance(consumer, ConsumerCore) and consumer not in self.consumers:
+                self._watch_consumer(consumer)
+        self._stopped.clear()
+        self.container.spawn_managed_thread(self._run, identifier='WorkloadTuner')
+
+    def stop(self):
+        self._stopped.set()
+
+    def kill(self):
+        self._stopped.set()
+
+    def _watch_consumer(self, consumer):
+        self.consumers[consumer] = []
+        on_consume_ready = consumer.on_consume_ready
+        on_iteration = consumer.on_iteration
+
+        def consume_ready(connection, channel, consumers, **kwargs):
+            self.consumers[consumer] = consumers
+            return on_consume_ready(connection, channel, consumers, **kwargs)
+
+        def iteration():
+            # QoS has to be changed from the consumer's own thread, which owns the channel
+            prefetch_count = self.pending_prefetch
+            if prefetch_count is not None and consumer.prefetch_count != prefetch_count:
+                consumer.prefetch_count = prefetch_count
+                for kombu_consumer in self.consumers[consumer]:
+                    kombu_consumer.qos(prefetch_count=prefetch_count)
+            return on_iteration()
+
+        consumer.on_consume_ready = consume_ready
+        consumer.on_iteration = iteration
+
+    def _spawned(self, worker_ctx, waited, handle_result):
+        with self._lock:
+            self.window.waits += waited
+            self.window.spawned += 1
+
+    def worker_setup(self, worker_ctx):
+        self.started[worker_ctx] = time.perf_counter()
+        with self._lock:
+            self.busy += 1
+
+    def worker_teardown(self, worker_ctx):
+        started_at = self.started.get(worker_ctx)
+        if started_at is not None:
+            with self._lock:
+                self.window.latencies += time.perf_counter() - started_at
+                self.window.completed += 1
+
+    def _exited(self, worker_ctx):
+        if self.started.pop(worker_ctx, None) is not None:
+            with self._lock:
+                self.busy -= 1
+
+    def _run(self):
+        samples_per_interval = 20
+        sample = 0
+        while not self._stopped.wait(self.interval / samples_per_interval):
+            with self._lock:
+                self.window.busy += self.busy / float(self.container.max_workers or 1)
+                self.window.samples += 1
+            sample += 1
+            if sample >= samples_per_interval:
+                sample = 0
+                self.tune()
+
+    def tune(self):
+        with self._lock:
+            window, self.window = self.window, _Window()
+
+        size = self.container.max_workers
+        latency = window.mean_latency
+        if latency is not None:
+            if self.baseline_latency is None or latency < self.baseline_latency:
+                self.baseline_latency = latency
+            else:
+                # Let the baseline follow a workload that legitimately got slower
+                self.baseline_latency *= 1.01
+
+        target, reason = size, None
+        slow = latency is not None and latency > self.baseline_latency * self.latency_tolerance
+        if slow and window.mean_wait > self.wait_threshold:
+            target = size - max(1, int(size * self.step))
+            reason = 'latency {:.1f}ms is over {}x its baseline'.format(latency * 1000, self.latency_tolerance)
+        elif window.mean_wait > self.wait_threshold or window.utilization > self.target_utilization:
+            target = size + max(1, int(size * self.step))
+            reason = 'messages waited {:.1f}ms for a worker, pool is {:.0%} utilized'.format(
+                window.mean_wait * 1000, window.utilization)
+        elif window.utilization < 0.25 and size > self.min_workers:
+            target = size - max(1, int(size * self.step / 2))
+            reason = 'pool is {:.0%} utilized'.format(window.utilization)
+
+        target = max(self.min_workers, min(self.max_workers, target))
+        if target != size:
+            self.resize(target)
+            _log.info('Tuned %s to %d workers (was %d): %s',
+                      self.container.service_name, target, size, reason)
+
+        if self.statsd is not None:
+            self.statsd.gauge('tuner.max_workers', self.container.max_workers)
+            self.statsd.gauge('tuner.prefetch_count', self.pending_prefetch or 0)
+            self.statsd.gauge('tuner.utilization', round(window.utilization, 3))
+            self.statsd.timing('tuner.queue_wait', window.mean_wait * 1000)
+        return target, reason
+
+    def resize(self, workers):
+        # nameko sizes the pool from max_workers once, only the pool itself can be resized
+        self.container._worker_pool.resize(workers)
+        self.container.max_workers = workers
+        self.pending_prefetch = max(1, int(workers * self.prefetch_ratio))
+
+    def get_dependency(self, worker_ctx):
+        return self
@@ -1,25 +1,50 @@
-import inspect
+import json
 import os
+import re
 import shutil
 from contextlib import contextmanager
-from time import sleep
+from functools import partial
+from urllib.parse import urlsplit
 
 import click
-import shortuuid
-from python_on_whales import DockerException, ClientNotFoundError, DockerClient, docker
-from mako.template import Template
+
+from namekoplus.bench import DEFAULT_AMQP_URI
+from namekoplus.middleware import Component, ComponentFailed, amqp_probe, bring_up, http_probe, tcp_probe, tear_down
+from namekoplus.top import DEFAULT_MANAGEMENT_URL
 
 INIT_TYPE_CHOICES = ['all', 'rpc', 'event', 'http', 'timer', 'demo']
-MIDDLEWARE_CHOICES = ['rabbitmq', 'metrics']
-TEST_TYPE_CHOICES = ['unit']
+MIDDLEWARE_CHOICES = ['rabbitmq', 'metrics', 'metrics-direct']
+TEST_TYPE_CHOICES = ['unit', 'bench']
+METRIC_MODE_CHOICES = ['statsd', 'direct']
+OBSERVER_TYPE_CHOICES = ['summary', 'histogram']
+
+# Worker settings per workload. An eventlet worker holding the CPU blocks every other one,
+# so CPU bound services get few workers (scale them with processes), IO bound ones many.
+WORKLOAD_PROFILES = {
+    'mixed': {'max_workers': 20, 'PREFETCH_COUNT': 20, 'parent_calls_tracked': 20},
+    'cpu': {'max_workers': 4, 'PREFETCH_COUNT': 4, 'parent_calls_tracked': 10},
+    'io': {'max_workers': 100, 'PREFETCH_COUNT': 100, 'parent_calls_tracked': 20},
+    'http': {'max_workers': 50, 'PREFETCH_COUNT': 10, 'parent_calls_tracked': 10},
+    'timer': {'max_workers': 5, 'PREFETCH_COUNT': 5, 'parent_calls_tracked': 10},
+}
+
+
+def docker_client():
+    """
+    The docker client of python_on_whales, which is only imported by the commands managing containers.
+    """
+    from python_on_whales import docker
+    return docker
 
 
 def check_docker():
     """
     Check if docker and docker compose are installed and running.
     """
+    from python_on_whales import DockerException, ClientNotFoundError
+
     try:
-        docker.ps()
+        docker_client().ps()
     except ClientNotFoundError:
         click.echo('Please install docker first', err=True)
         raise
@@ -72,9 +97,23 @@ def copy_files(src_dir, dest_dir):
             shutil.copy(src_file_path, output_file)
 
 
+def apply_profile(config_file, profile):
+    """
+    Rewrite the worker settings of a generated config.yml for the given workload profile.
+    """
+    with open(config_file, encoding='utf-8') as f:
+        content = f.read()
+    for key, value in WORKLOAD_PROFILES[profile].items():
+        content = re.sub(r'^{}:.*$'.format(key), '{}: {}'.format(key, value), content, flags=re.MULTILINE)
+    with open(config_file, 'w', encoding='utf-8') as f:
+        f.write(content)
+
+
 def template_to_file(
         template_file: str, dest: str, output_encoding: str, **kw
 ) -> None:
+    from mako.template import Template
+
     template = Template(filename=template_file)
     try:
         output = template.render_unicode(**kw).encode(output_encoding)
@@ -86,147 +125,210 @@ def template_to_file(
             f.write(output)
 
 
-def start_rabbitmq():
+METRIC_NETWORK = 'metric_servers'
+
+
+def rabbitmq_compose_files():
     docker_compose_file_dir = os.path.join(get_directory('chassis-agent'), 'rabbitmq')
-    for file_ in os.listdir(docker_compose_file_dir):
-        compose_file_path = os.path.join(docker_compose_file_dir, file_)
-        with status(f'Starting rabbitmq'):
-            temp_docker = DockerClient(compose_files=[compose_file_path])
-            temp_docker.compose.up(detach=True)
+    return [os.path.join(docker_compose_file_dir, file_) for file_ in os.listdir(docker_compose_file_dir)]
+
+
+def start_rabbitmq():
+    from python_on_whales import DockerClient
+
+    for compose_file_path in rabbitmq_compose_files():
+        temp_docker = DockerClient(compose_files=[compose_file_path])
+        temp_docker.compose.up(detach=True)
 
 
 def start_statsd_agent():
-    with status(f'Starting statsd agent'):
-        metric_configs_dir = os.path.join(get_directory('chassis-agent'), 'metric-configs')
-        statsd_config_file_path = os.path.join(metric_configs_dir, 'statsd_config.js')
-        returned_string = docker.run(image='statsd/statsd:latest', name='statsd-agent', hostname='statsd-agent',
-                                     detach=True, restart='always', interactive=True, tty=True,
-                                     publish=[(8125, 8125, 'udp'), (8126, 8126)], pull='missing',
-                                     volumes=[(statsd_config_file_path, '/usr/src/app/config.js', 'rw')],
-                                     networks=['metric_servers'])
-        click.echo('\nContainer ID: ' + str(returned_string) + '\n')
+    metric_configs_dir = os.path.join(get_directory('chassis-agent'), 'metric-configs')
+    statsd_config_file_path = os.path.join(metric_configs_dir, 'statsd_config.js')
+    docker_client().run(image='statsd/statsd:latest', name='statsd-agent', hostname='statsd-agent',
+               detach=True, restart='always', interactive=True, tty=True,
+               publish=[(8125, 8125, 'udp'), (8126, 8126)], pull='missing',
+               volumes=[(statsd_config_file_path, '/usr/src/app/config.js', 'rw')],
+               networks=[METRIC_NETWORK])
 
 
 def start_statsd_exporter():
-    with status(f'Starting statsd exporter'):
-        statsd_mapping_file_path = os.getcwd() + '/statsd_mapping.yml'
-        returned_string = docker.run(image='prom/statsd-exporter:latest', name='statsd-exporter', pull='missing',
-                                     detach=True, restart='always', tty=True, hostname='statsd-exporter',
-                                     publish=[(9125, 9125, 'udp'), (9102, 9102)], interactive=True,
-                                     command=['--statsd.mapping-config=/tmp/statsd_mapping.yml'],
-                                     volumes=[(statsd_mapping_file_path, '/tmp/statsd_mapping.yml', 'rw')],
-                                     networks=['metric_servers'])
-        click.echo('\nContainer ID: ' + str(returned_string) + '\n')
-
-
-def start_prometheus():
-    with status(f'Starting prometheus'):
+    statsd_mapping_file_path = os.getcwd() + '/statsd_mapping.yml'
+    docker_client().run(image='prom/statsd-exporter:latest', name='statsd-exporter', pull='missing',
+               detach=True, restart='always', tty=True, hostname='statsd-exporter',
+               publish=[(9125, 9125, 'udp'), (9102, 9102)], interactive=True,
+               command=['--statsd.mapping-config=/tmp/statsd_mapping.yml'],
+               volumes=[(statsd_mapping_file_path, '/tmp/statsd_mapping.yml', 'rw')],
+               networks=[METRIC_NETWORK])
+
+
+PROMETHEUS_CONF_MOUNT = '/etc/prometheus/prometheus.yml'
+
+
+def prometheus_conf_file(direct=False):
+    # Services scraped directly need the prometheus.yml `metric-config-gen --mode direct` wrote in the current
+    # directory, the statsd mode always scrapes statsd-exporter
+    prometheus_conf_file_path = os.path.join(os.getcwd(), 'prometheus.yml')
+    if not direct or not os.access(prometheus_conf_file_path, os.F_OK):
         prometheus_conf_dir = os.path.join(get_directory('chassis-agent'), 'metric-configs')
         prometheus_conf_file_path = os.path.join(prometheus_conf_dir, 'prometheus_conf/prometheus.yml')
-        returned_string = docker.run(image='prom/prometheus:latest', name='prometheus', hostname='prometheus',
-                                     detach=True, restart='always', tty=True, interactive=True,
-                                     publish=[(9193, 9090)], pull='missing',
-                                     volumes=[(prometheus_conf_file_path, '/etc/prometheus/prometheus.yml', 'rw')],
-                                     networks=['metric_servers'])
-        click.echo('\nContainer ID: ' + str(returned_string) + '\n')
+    return prometheus_conf_file_path
+
+
+def start_prometheus(direct=False):
+    docker_client().run(image='prom/prometheus:latest', name='prometheus', hostname='prometheus',
+               detach=True, restart='always', tty=True, interactive=True,
+               publish=[(9193, 9090)], pull='missing',
+               add_hosts=[('host.docker.internal', 'host-gateway')],
+               volumes=[(prometheus_conf_file(direct), PROMETHEUS_CONF_MOUNT, 'rw')],
+               networks=[METRIC_NETWORK])
 
 
 def start_grafana():
-    with status(f'Starting grafana'):
-        grafana_conf_dir = os.path.join(get_directory('chassis-agent'), 'metric-configs')
-        grafana_provisioning_path = os.path.join(grafana_conf_dir, 'grafana_conf/provisioning')
-        grafana_config_path = os.path.join(grafana_conf_dir, 'grafana_conf/config/grafana.ini')
-        grafana_dashboard_path = os.path.join(os.getcwd(), 'grafana_dashboards')
-        returned_string = docker.run(image='grafana/grafana:latest', name='grafana', hostname='grafana',
-                                     detach=True, restart='always', tty=True, interactive=True,
-                                     publish=[(3100, 3000)], pull='missing',
-                                     volumes=[(grafana_provisioning_path, '/etc/grafana/provisioning', 'rw'),
-                                              (grafana_config_path, '/etc/grafana/grafana.ini', 'rw'),
-                                              (grafana_dashboard_path, '/var/lib/grafana/dashboards', 'rw')],
-                                     networks=['metric_servers'])
-        click.echo('\nContainer ID: ' + str(returned_string) + '\n')
-
-
-def start_network(network_name):
-    with status(f'Starting network {network_name}'):
-        docker.network.create(network_name, driver='bridge')
-
-
-def stop_network(network_name):
-    with status(f'Stopping network {network_name}'):
-        docker.network.remove(network_name)
-
-
-def start_metric_servers():
-    # TODO 检查相应容器是否已启动，如果启动，则先删除
-    start_network('metric_servers')
-    sleep(0.5)
-    start_prometheus()
-    sleep(0.5)
-    start_statsd_exporter()
-    sleep(0.5)
-    start_statsd_agent()
-    sleep(0.5)
-    start_grafana()
+    grafana_conf_dir = os.path.join(get_directory('chassis-agent'), 'metric-configs')
+    grafana_provisioning_path = os.path.join(grafana_conf_dir, 'grafana_conf/provisioning')
+    grafana_config_path = os.path.join(grafana_conf_dir, 'grafana_conf/config/grafana.ini')
+    grafana_dashboard_path = os.path.join(os.getcwd(), 'grafana_dashboards')
+    docker_client().run(image='grafana/grafana:latest', name='grafana', hostname='grafana',
+               detach=True, restart='always', tty=True, interactive=True,
+               publish=[(3100, 3000)], pull='missing',
+               volumes=[(grafana_provisioning_path, '/etc/grafana/provisioning', 'rw'),
+                        (grafana_config_path, '/etc/grafana/grafana.ini', 'rw'),
+                        (grafana_dashboard_path, '/var/lib/grafana/dashboards', 'rw')],
+               networks=[METRIC_NETWORK])
 
 
 def stop_rabbitmq():
-    docker_compose_file_dir = os.path.join(get_directory('chassis-agent'), 'rabbitmq')
-    for file_ in os.listdir(docker_compose_file_dir):
-        compose_file_path = os.path.join(docker_compose_file_dir, file_)
-        with status(f'Stopping rabbitmq'):
-            temp_docker = DockerClient(compose_files=[compose_file_path])
-            temp_docker.compose.down()
+    from python_on_whales import DockerClient
+
+    for compose_file_path in rabbitmq_compose_files():
+        temp_docker = DockerClient(compose_files=[compose_file_path])
+        temp_docker.compose.down()
+
+
+def container_state(name):
+    def state():
+        if not docker_client().container.exists(name):
+            return 'absent'
+        return 'running' if docker_client().container.inspect(name).state.running else 'stopped'
+    return state
+
+
+def prometheus_state(direct=False):
+    container = container_state('prometheus')
+
+    def state():
+        current = container()
+        if current != 'running':
+            return current
+        mounts = docker_client().container.inspect('prometheus').mounts or []
+        mounted = next((str(mount.source) for mount in mounts if str(mount.destination) == PROMETHEUS_CONF_MOUNT), None)
+        # A container started for the other metrics mode scrapes the wrong targets
+        return 'running' if mounted == prometheus_conf_file(direct) else 'outdated'
+    return state
+
+
+def network_state():
+    return 'running' if docker_client().network.exists(METRIC_NETWORK) else 'absent'
+
+
+def container_component(name, start_fn, probe, depends_on=(), state=None):
+    return Component(name, start=start_fn, stop=lambda: docker_client().remove(name, force=True),
+                     probe=probe, depends_on=('network',) + tuple(depends_on), state=state or container_state(name))
+
+
+def rabbitmq_components():
+    return [
+        Component('rabbitmq', start=start_rabbitmq, stop=stop_rabbitmq, probe=amqp_probe('localhost', 5672),
+                  state=container_state('rabbitmq')),
+    ]
+
+
+def metric_components(direct=False):
+    components = [
+        Component('network', start=lambda: docker_client().network.create(METRIC_NETWORK, driver='bridge'),
+                  stop=lambda: docker_client().network.remove(METRIC_NETWORK), state=network_state),
+        container_component('prometheus', partial(start_prometheus, direct=direct),
+                            http_probe('http://localhost:9193/-/ready'), state=prometheus_state(direct)),
+        container_component('grafana', start_grafana, http_probe('http://localhost:3100/api/health'),
+                            depends_on=['prometheus']),
+    ]
+    if not direct:
+        # Services using init_prometheus_metrics are scraped directly and skip the statsd hops
+        components += [
+            container_component('statsd-exporter', start_statsd_exporter, http_probe('http://localhost:9102/metrics')),
+            container_component('statsd-agent', start_statsd_agent, tcp_probe('localhost', 8126),
+                                depends_on=['statsd-exporter']),
+        ]
+    return components
+
+
+middleware_components = {
+    'rabbitmq': rabbitmq_components,
+    'metrics': metric_components,
+    'metrics-direct': partial(metric_components, direct=True),
+}
 
 
-def stop_statsd_agent():
-    with status(f'Stopping statsd agent'):
-        docker.remove('statsd-agent', force=True)
-        click.echo('\nContainer is removed.' + '\n')
+COMMANDS_ENTRY_POINT_GROUP = 'namekoplus.commands'
 
 
-def stop_statsd_exporter():
-    with status(f'Stopping statsd exporter'):
-        docker.remove('statsd-exporter', force=True)
-        click.echo('\nContainer is removed.' + '\n')
+def command_entry_points() -> dict:
+    """
+    Entry points of the commands plugins add to the CLI, by command name.
+    """
+    from importlib import metadata
 
+    entry_points = metadata.entry_points()
+    if hasattr(entry_points, 'select'):
+        entry_points = entry_points.select(group=COMMANDS_ENTRY_POINT_GROUP)
+    else:
+        # Python < 3.10
+        entry_points = entry_points.get(COMMANDS_ENTRY_POINT_GROUP, [])
+    return {entry_point.name: entry_point for entry_point in entry_points}
 
-def stop_prometheus():
-    with status(f'Stopping prometheus'):
-        docker.remove('prometheus', force=True)
-        click.echo('\nContainer is removed.' + '\n')
 
+class PluginGroup(click.Group):
+    """
+    A command group extended with the commands registered by installed packages.
 
-def stop_grafana():
-    with status(f'Stopping grafana'):
-        docker.remove('grafana', force=True)
-        click.echo('\nContainer is removed.' + '\n')
+    A package adds a command by declaring the click command under the
+    ``namekoplus.commands`` entry point group, e.g. in its ``pyproject.toml``::
 
+        [project.entry-points."namekoplus.commands"]
+        deploy = "mypackage.cli:deploy"
 
-def stop_metric_servers():
-    stop_statsd_agent()
-    sleep(0.5)
-    stop_statsd_exporter()
-    sleep(0.5)
-    stop_prometheus()
-    sleep(0.5)
-    stop_grafana()
-    sleep(0.5)
-    stop_network('metric_servers')
+    Entry points are only looked up for names that are no built-in command, and a
+    plugin's module is only imported when its command runs or is listed by ``--help``.
+    Like the built-in commands, plugins should import their heavy dependencies inside
+    the command function.
+    """
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._plugins = None
 
-middleware_starting_dict = {
-    'rabbitmq': start_rabbitmq,
-    'metrics': start_metric_servers,
-}
+    def plugins(self) -> dict:
+        if self._plugins is None:
+            self._plugins = command_entry_points()
+        return self._plugins
 
-middleware_stopping_dict = {
-    'rabbitmq': stop_rabbitmq,
-    'metrics': stop_metric_servers,
-}
+    def list_commands(self, ctx):
+        return sorted(set(super().list_commands(ctx)) | set(self.plugins()))
+
+    def get_command(self, ctx, cmd_name):
+        command = super().get_command(ctx, cmd_name)
+        if command is None and cmd_name in self.plugins():
+            try:
+                command = self.plugins()[cmd_name].load()
+            except Exception as e:
+                click.echo(f'Failed to load the plugin command {cmd_name}: {e}', err=True)
+                return None
+            # Keep the loaded command for later lookups
+            self.add_command(command, cmd_name)
+        return command
 
 
-@click.group()
+@click.group(cls=PluginGroup)
 def cli():
     pass
 
@@ -240,7 +342,12 @@ def cli():
               show_default=True,
               type=click.Choice(INIT_TYPE_CHOICES, case_sensitive=False),
               help='The template type of nameko service')
-def init(directory, _type):
+@click.option('-p', '--profile',
+              default='mixed',
+              show_default=True,
+              type=click.Choice(list(WORKLOAD_PROFILES), case_sensitive=False),
+              help='The workload profile that max_workers, PREFETCH_COUNT and parent_calls_tracked are set for')
+def init(directory, _type, profile):
     """
     Initialize a new service via templates.
     """
@@ -259,18 +366,30 @@ def init(directory, _type):
 
     copy_files(template_dir, directory)
 
+    config_file = os.path.join(directory, 'config.yml')
+    if os.access(config_file, os.F_OK):
+        with status(f'Applying the {profile} workload profile to {os.path.abspath(config_file)}'):
+            apply_profile(config_file, profile)
+
 
 @cli.command()
 @click.option('-m', '--middleware',
               required=True,
               type=click.Choice(MIDDLEWARE_CHOICES, case_sensitive=False),
               help='The middleware name')
-def start(middleware):
+@click.option('--timeout',
+              default=120,
+              show_default=True,
+              help='Seconds to wait for each component to become ready')
+def start(middleware, timeout):
     """
     Start a middleware that the nameko service depends on.
     """
     check_docker()
-    middleware_starting_dict.get(middleware)()
+    try:
+        bring_up(middleware_components[middleware](), timeout=timeout)
+    except ComponentFailed as exc:
+        raise click.ClickException(str(exc))
 
 
 @cli.command()
@@ -283,7 +402,10 @@ def stop(middleware):
     Stop a middleware that the nameko service depends on.
     """
     check_docker()
-    middleware_stopping_dict.get(middleware)()
+    try:
+        tear_down(middleware_components[middleware]())
+    except ComponentFailed as exc:
+        raise click.ClickException(str(exc))
 
 
 @cli.command()
@@ -298,11 +420,18 @@ def stop(middleware):
 def test_gen(directory, _type):
     """
     Generate test files for nameko services.
+
+    The bench type generates a micro and an end-to-end benchmark per rpc, event_handler and
+    http entrypoint of the services in the directory, with one file per module.
     """
     if not os.access(directory, os.F_OK) or not os.listdir(directory):
         click.echo('Directory {} dose not exist or is empty'.format(directory), err=True)
         return
 
+    if _type == 'bench':
+        generate_benchmarks(directory)
+        return
+
     tests_dir = os.path.join(get_directory('tests'), _type)
     if not os.access(tests_dir, os.F_OK):
         click.echo('No such test type {}'.format(_type), err=True)
@@ -311,73 +440,741 @@ def test_gen(directory, _type):
     copy_files(tests_dir, directory)
 
 
+BENCH_ENTRYPOINT_TYPES = ('rpc', 'event_handler', 'http')
+
+# Variables of werkzeug URL rules, e.g. <int:book_id>
+URL_VARIABLE_PATTERN = re.compile(r'<(?:([^<>:]+):)?([^<>:]+)>')
+
+
+def decorator_arg(entrypoint: dict, index: int, default):
+    args = entrypoint.get('args', [])
+    return args[index] if len(args) > index and args[index] is not None else default
+
+
+def bench_call(entrypoint: dict) -> dict:
+    """
+    Placeholder arguments of the benchmarks of an entrypoint, to be replaced by representative ones.
+
+    The source service and event type of an event handler are ``None`` when they are not literals
+    in the source; the end-to-end benchmark skips until they are filled in.
+    """
+    if entrypoint['type'] == 'rpc':
+        return {'args': list(entrypoint.get('required_params', [])), 'kwargs': {}}
+    if entrypoint['type'] == 'event_handler':
+        return {'source_service': decorator_arg(entrypoint, 0, None), 'event_type': decorator_arg(entrypoint, 1, None),
+                'payload': {}}
+
+    method = decorator_arg(entrypoint, 0, 'GET').upper()
+    kwargs = {}
+
+    def placeholder(match):
+        converter, name = match.groups()
+        kwargs[name] = 1 if converter in ('int', 'float') else name
+        return str(kwargs[name])
+
+    path = URL_VARIABLE_PATTERN.sub(placeholder, decorator_arg(entrypoint, 1, '/'))
+    return {'method': method, 'path': path, 'body': None if method in ('GET', 'HEAD', 'DELETE') else '{}',
+            'kwargs': kwargs}
+
+
+def bench_cases(classes: list) -> list:
+    cases = []
+    for class_info in classes:
+        name = class_info['service_name'] or re.sub(r'(?<!^)(?=[A-Z])', '_', class_info['class_name']).lower()
+        for entrypoint in class_info['entrypoints']:
+            if entrypoint['type'] not in BENCH_ENTRYPOINT_TYPES:
+                continue
+            cases.append({
+                'key': '{}.{}'.format(class_info['class_name'], entrypoint['method']),
+                # Service names like greeting-service are no valid identifiers
+                'name': re.sub(r'\W', '_', '{}_{}'.format(name, entrypoint['method'])),
+                'class_name': class_info['class_name'],
+                'method': entrypoint['method'],
+                'type': entrypoint['type'],
+                'call': repr(bench_call(entrypoint)),
+            })
+    return cases
+
+
+def generate_benchmarks(directory: str):
+    """
+    Write a benchmark file per module of ``directory`` whose services have rpc, event_handler or http entrypoints.
+    """
+    from namekoplus.scanner import scan
+
+    by_module = {}
+    for class_info in scan([directory], root=directory, use_cache=False):
+        if class_info['service_name'] or class_info['entrypoints']:
+            by_module.setdefault(class_info['module'], []).append(class_info)
+
+    template_file = os.path.join(get_directory('tests'), 'bench', 'test_bench.py.mako')
+    # Test files in a package are imported as part of it by pytest
+    package = os.path.exists(os.path.join(directory, '__init__.py'))
+    generated = 0
+    for module, classes in sorted(by_module.items()):
+        cases = bench_cases(classes)
+        if not cases:
+            continue
+        output_file = os.path.join(directory, 'test_bench_{}.py'.format(module.replace('.', '_')))
+        if os.path.exists(output_file):
+            click.echo(f'{os.path.abspath(output_file)} exists, delete it to generate it again', err=True)
+            continue
+        with status(f'Generating {os.path.abspath(output_file)}'):
+            template_to_file(template_file=template_file, dest=output_file, output_encoding='utf-8',
+                             module=module, import_path=('.' if package else '') + module,
+                             file_name=os.path.basename(output_file),
+                             class_names=[class_info['class_name'] for class_info in classes], cases=cases)
+        generated += 1
+    if not generated:
+        click.echo(f'No new benchmarks for the services in {directory}', err=True)
+
+
+def parse_buckets(bucket_options: tuple) -> dict:
+    """
+    Parse ``--buckets`` options of the form ``[stat_name=]b1,b2,...`` into a dict keyed by stat name.
+
+    Buckets without a stat name are stored under ``None`` and used as the default layout.
+    """
+    buckets = {}
+    for option in bucket_options:
+        stat_name, _, layout = option.rpartition('=')
+        try:
+            bounds = sorted(float(bound) for bound in layout.split(',') if bound.strip())
+        except ValueError:
+            raise click.BadParameter(f'Invalid bucket layout {option!r}', param_hint='--buckets')
+        if not bounds:
+            raise click.BadParameter(f'Empty bucket layout {option!r}', param_hint='--buckets')
+        buckets[stat_name or None] = bounds
+    return buckets
+
+
+def query_prometheus(prometheus_url: str, query: str):
+    """
+    Run an instant query against Prometheus and return the first value, or None.
+    """
+    from urllib.parse import urlencode
+    from urllib.request import urlopen
+
+    url = '{}/api/v1/query?{}'.format(prometheus_url.rstrip('/'), urlencode({'query': query}))
+    try:
+        with urlopen(url, timeout=5) as response:
+            result = json.loads(response.read().decode('utf-8'))['data']['result']
+    except (OSError, ValueError, KeyError):
+        return None
+    values = [float(item['value'][1]) for item in result]
+    values = [value for value in values if value == value and value != float('inf')]
+    return max(values) if values else None
+
+
+def label_matchers(labels: dict) -> str:
+    return ', '.join('{}="{}"'.format(name, value) for name, value in labels.items())
+
+
+def derive_buckets(stat_name: str, prometheus_url: str, lookback: str = '1d', count: int = 12,
+                   labels: dict = None) -> list:
+    """
+    Derive a bucket layout from the latency observed for the ``stat_name`` series with ``labels`` in Prometheus.
+
+    Buckets are spaced geometrically from a quarter of the observed p50 to four times
+    the observed p99, so most of the resolution sits where the latency actually is.
+    """
+    import math
+    from namekoplus.chassis.prometheus import DEFAULT_BUCKETS
+
+    matchers = label_matchers(labels or {})
+    quantiles = {}
+    for quantile in (0.5, 0.99):
+        summary_matchers = ', '.join(filter(None, [matchers, f'quantile="{quantile}"']))
+        quantiles[quantile] = query_prometheus(
+            prometheus_url, f'max_over_time({stat_name}{{{summary_matchers}}}[{lookback}])'
+        ) or query_prometheus(
+            prometheus_url,
+            f'histogram_quantile({quantile}, sum by (le) (rate({stat_name}_bucket{{{matchers}}}[{lookback}])))'
+        )
+
+    low, high = quantiles[0.5], quantiles[0.99]
+    if not low or not high:
+        click.echo(f'No latency observed for {stat_name!r}, using the default buckets', err=True)
+        return list(DEFAULT_BUCKETS)
+
+    low, high = low / 4, max(high * 4, low * 8)
+    factor = (high / low) ** (1 / (count - 1))
+    buckets = []
+    for idx in range(count):
+        bound = low * factor ** idx
+        digits = 1 - int(math.floor(math.log10(bound)))
+        bound = round(bound, digits)
+        if not buckets or bound > buckets[-1]:
+            buckets.append(bound)
+    return buckets
+
+
+def instrumentation_configs(class_info: dict, statsd_prefix: str) -> list:
+    """
+    Return the metric configs of every stat ``init_instrumentation`` sends for a scanned service.
+    """
+    from namekoplus.chassis.instrumentation import (
+        ENTRYPOINT_COUNTERS, ENTRYPOINT_TIMERS, POOL_GAUGES, entrypoint_stat, pool_stat, prometheus_name
+    )
+
+    service_name = class_info['service_name']
+    configs = []
+    for entrypoint in class_info['entrypoints']:
+        labels = {'service': service_name, 'entrypoint': entrypoint['method']}
+        for metric_type, kinds in (('timer', ENTRYPOINT_TIMERS), ('counter', ENTRYPOINT_COUNTERS)):
+            for kind in kinds:
+                configs.append({
+                    'statsd_prefix': statsd_prefix,
+                    'stat_name': entrypoint_stat(service_name, entrypoint['method'], kind),
+                    'metric_name': prometheus_name(kind),
+                    'metric_type': metric_type,
+                    'labels': labels,
+                    'class_name': class_info['class_name'],
+                })
+    for kind in POOL_GAUGES:
+        configs.append({
+            'statsd_prefix': statsd_prefix,
+            'stat_name': pool_stat(service_name, kind),
+            'metric_name': prometheus_name(kind, scope='pool'),
+            'metric_type': 'gauge',
+            'labels': {'service': service_name},
+            'class_name': class_info['class_name'],
+        })
+    return configs
+
+
+def select_services(classes: list, modules: tuple, class_names: list) -> list:
+    """
+    Filter scanned classes by module names and class names.
+
+    A module matches either by its full dotted path or by its trailing components,
+    so ``-m demo`` and ``-m svc.demo`` both select ``svc/demo.py``.
+    """
+    selected = []
+    for class_info in classes:
+        if modules and not any(class_info['module'] == module or class_info['module'].endswith('.' + module)
+                               for module in modules):
+            continue
+        if class_names and class_info['class_name'] not in class_names:
+            continue
+        selected.append(class_info)
+    return selected
+
+
+def worker_targets(targets, processes):
+    """
+    Expand every host:port target to the ports base..base+N-1 the ``processes`` of `namekoplus run` serve on.
+    """
+    expanded = []
+    for target in targets:
+        host, port = target.rsplit(':', 1)
+        expanded.extend('{}:{}'.format(host, int(port) + worker_id) for worker_id in range(processes))
+    return expanded
+
+
 @cli.command()
-@click.option('-m', '--module',
-              required=True,
-              help='The module name where the nameko service exists')
+@click.option('-m', '--module', 'modules',
+              multiple=True,
+              help='The module name where the nameko service exists; repeat for more modules, '
+                   'omit to use every module under --path')
 @click.option('-c', '--class', 'class_name_str',
-              required=True,
-              help='The class name of the nameko service')
-def metric_config_gen(module, class_name_str):
+              default='',
+              help='The class names of the nameko services separated by commas, '
+                   'omit to use every class with metrics')
+@click.option('-p', '--path', 'paths',
+              multiple=True,
+              type=click.Path(exists=True),
+              help='Files or packages to scan for nameko services, defaults to the current directory')
+@click.option('--no-cache',
+              is_flag=True,
+              help='Parse every file again instead of reusing the scan cache')
+@click.option('--mode',
+              default='statsd',
+              show_default=True,
+              type=click.Choice(METRIC_MODE_CHOICES, case_sensitive=False),
+              help='statsd: go through statsd-agent and statsd-exporter; '
+                   'direct: scrape the /metrics endpoint of init_prometheus_metrics')
+@click.option('--target', 'targets',
+              multiple=True,
+              default=['host.docker.internal:9464'],
+              show_default=True,
+              help='The host:port of a service /metrics endpoint to scrape in direct mode')
+@click.option('-n', '--processes',
+              default=1,
+              show_default=True,
+              type=click.IntRange(min=1),
+              help='Processes per target in direct mode, as started by `namekoplus run -n`; '
+                   'their ports follow the port of the target')
+@click.option('--observer-type',
+              default='summary',
+              show_default=True,
+              type=click.Choice(OBSERVER_TYPE_CHOICES, case_sensitive=False),
+              help='How statsd-exporter observes timers; histograms can be aggregated across replicas')
+@click.option('--buckets', 'bucket_options',
+              multiple=True,
+              help='Histogram buckets in seconds as [stat_name=]b1,b2,...; repeat for per-stat layouts')
+@click.option('--auto-buckets',
+              is_flag=True,
+              help='Derive histogram buckets from the latency already observed by Prometheus')
+@click.option('--prometheus-url',
+              default='http://localhost:9193',
+              show_default=True,
+              help='The Prometheus queried by --auto-buckets')
+def metric_config_gen(modules, class_name_str, paths, no_cache, mode, targets, processes, observer_type,
+                      bucket_options, auto_buckets, prometheus_url):
     """
     Generate metric config for nameko services.
     """
-    import sys
-    from statsd.client.timer import Timer
-    sys.path.append(os.getcwd())
-    for root, dirs, files in os.walk(os.getcwd()):
-        for _dir in dirs:
-            sys.path.append(os.path.join(root, _dir))
+    import shortuuid
+    from namekoplus.scanner import scan
 
-    # Extract information of statsd config from the class of nameko service
-    file_name = module.split('.')[-1]
-    _module = __import__(module)
+    # Extract information of statsd config from the source of nameko services without importing them
+    class_names = [class_name for class_name in class_name_str.split(',') if class_name]
+    classes = select_services(scan(paths or [os.getcwd()], use_cache=not no_cache), modules, class_names)
+    for class_name in class_names:
+        if not any(class_info['class_name'] == class_name for class_info in classes):
+            click.echo(f'No such class {class_name}', err=True)
 
     config_list = []
-    for class_name in class_name_str.split(','):
-        members = inspect.getmembers(getattr(getattr(_module, file_name), class_name), predicate=inspect.isfunction)
-        for member_tuple in members:
-            name, _obj = member_tuple
-            unwrap = inspect.getclosurevars(_obj)
-            if unwrap.nonlocals.get('self') and isinstance(unwrap.nonlocals['self'], Timer):
-                statsd_prefix = unwrap.nonlocals['self'].client._prefix
-                stat_name = unwrap.nonlocals['self'].stat
+    for class_info in classes:
+        if mode == 'direct':
+            for entrypoint in class_info['entrypoints']:
                 config_list.append({
-                    'statsd_prefix': statsd_prefix,
-                    'stat_name': stat_name,
-                    'class_name': class_name
+                    'service_name': class_info['service_name'],
+                    'stat_name': entrypoint['method'],
+                    'class_name': class_info['class_name']
                 })
+            continue
 
-    # Generate one file of statsd config yaml for statsd exporter
-    with status(f'Creating statsd_mapping.yml'):
-        metric_configs_dir = os.path.join(get_directory('chassis-agent'), 'metric-configs')
-        template_file_path = os.path.join(metric_configs_dir, 'statsd_mapping.yml.mako')
-        output_file = os.path.join('.', 'statsd_mapping.yml')
-        template_to_file(template_file=template_file_path, dest=output_file, output_encoding='utf-8',
-                         **{'config_list': config_list})
+        instrumentation = class_info.get('instrumentation')
+        if instrumentation is not None:
+            if instrumentation['statsd_prefix'] is None:
+                click.echo(f'Cannot resolve the statsd prefix of the instrumentation of {class_info["class_name"]} '
+                           f'statically', err=True)
+            config_list.extend(instrumentation_configs(class_info, instrumentation['statsd_prefix']))
+
+        for timer in class_info['timers']:
+            if timer['statsd_prefix'] is None:
+                click.echo(f'Cannot resolve the statsd prefix of {class_info["class_name"]}.{timer["method"]} '
+                           f'statically', err=True)
+            config_list.append({
+                'statsd_prefix': timer['statsd_prefix'],
+                'stat_name': timer['stat_name'],
+                'class_name': class_info['class_name']
+            })
+
+    if mode == 'statsd' and observer_type == 'histogram':
+        from namekoplus.chassis.prometheus import DEFAULT_BUCKETS
+        buckets = parse_buckets(bucket_options)
+        for config in config_list:
+            if config.get('metric_type', 'timer') != 'timer':
+                continue
+            config['observer_type'] = observer_type
+            if config['stat_name'] in buckets:
+                config['buckets'] = buckets[config['stat_name']]
+            elif auto_buckets:
+                config['buckets'] = derive_buckets(config.get('metric_name', config['stat_name']), prometheus_url,
+                                                   labels=config.get('labels'))
+            else:
+                config['buckets'] = buckets.get(None, list(DEFAULT_BUCKETS))
+
+    metric_configs_dir = os.path.join(get_directory('chassis-agent'), 'metric-configs')
+    if mode == 'statsd':
+        # Generate one file of statsd config yaml for statsd exporter
+        with status(f'Creating statsd_mapping.yml'):
+            template_file_path = os.path.join(metric_configs_dir, 'statsd_mapping.yml.mako')
+            output_file = os.path.join('.', 'statsd_mapping.yml')
+            template_to_file(template_file=template_file_path, dest=output_file, output_encoding='utf-8',
+                             **{'config_list': config_list})
+    else:
+        # Generate prometheus.yml scraping the services directly
+        with status(f'Creating prometheus.yml'):
+            template_file_path = os.path.join(metric_configs_dir, 'prometheus_conf', 'prometheus.yml.mako')
+            output_file = os.path.join('.', 'prometheus.yml')
+            template_to_file(template_file=template_file_path, dest=output_file, output_encoding='utf-8',
+                             **{'targets': worker_targets(targets, processes), 'include_statsd_exporter': False})
 
     # Generate files of json for grafana dashboard
     if not os.access('grafana_dashboards', os.F_OK):
         with status(f'Creating directory {os.path.abspath("grafana_dashboards")!r}'):
             os.makedirs('grafana_dashboards')
 
+    from namekoplus.dashboard import Queries, build_panels, grafana_targets, latency_configs, variables
+
+    queries = Queries(mode, observer_type)
+    classes_by_name = {class_info['class_name']: class_info for class_info in classes}
     with status(f'Creating files of Grafana.json into the directory of grafana_dashboards'):
-        for class_name in class_name_str.split(','):
-            grafana_list = []
-            for config in config_list:
-                if config['class_name'] == class_name:
-                    grafana_list.append(config)
-            for idx, grafana_dict in enumerate(grafana_list):
-                if idx + 1 == len(grafana_list):
-                    grafana_dict['is_last'] = 1
-                else:
-                    grafana_dict['is_last'] = 0
-            grafana_configs_dir = os.path.join(get_directory('chassis-agent'), 'metric-configs')
-            grafana_file_path = os.path.join(grafana_configs_dir, 'grafana.json.mako')
+        for class_name in dict.fromkeys(config['class_name'] for config in config_list):
+            class_info = classes_by_name[class_name]
+            # Without init_instrumentation, statsd has nothing but the custom timers of the service
+            capacity = mode == 'direct' or class_info.get('instrumentation') is not None
+            stat_configs = latency_configs([config for config in config_list if config['class_name'] == class_name])
+            for config in stat_configs:
+                config['targets'] = grafana_targets(config, mode)
+            grafana_file_path = os.path.join(metric_configs_dir, 'grafana.json.mako')
             output_file = os.path.join('grafana_dashboards', f'{class_name}_Grafana.json')
             template_to_file(template_file=grafana_file_path, dest=output_file, output_encoding='utf-8',
                              **{'service_name': class_name, 'uid': shortuuid.uuid(),
-                                'grafana_list': grafana_list})
+                                'panels': build_panels(queries, capacity=capacity, stat_configs=stat_configs),
+                                'variables': variables(queries, class_info['service_name'])})
+
+
+def service_targets(services, modules, class_name_str):
+    """
+    Return the module[:Class] targets of the services given as arguments and with -m/-c.
+    """
+    class_names = [name.strip() for name in class_name_str.split(',') if name.strip()]
+    targets = list(services)
+    for module in modules:
+        if class_names:
+            targets.extend(f'{module}:{class_name}' for class_name in class_names)
+        else:
+            targets.append(module)
+    if not targets:
+        raise click.UsageError('Give the services as module[:Class] arguments or with -m/-c')
+    return targets
+
+
+@cli.command()
+@click.argument('services', nargs=-1)
+@click.option('-m', '--module', 'modules',
+              multiple=True,
+              help='The module name where the nameko service exists; repeat for more modules')
+@click.option('-c', '--class', 'class_name_str',
+              default='',
+              help='The class names of the nameko services separated by commas, omit to run every service '
+                   'of the modules')
+@click.option('--config', 'config_file',
+              type=click.Path(exists=True, dir_okay=False),
+              help='The YAML config file shared by every process')
+@click.option('-n', '--processes',
+              type=click.IntRange(min=1),
+              help='Number of processes, defaults to the number of CPU cores')
+@click.option('--grace',
+              default=30,
+              show_default=True,
+              help='Seconds the processes get to finish their running workers on shutdown')
+def run(services, modules, class_name_str, config_file, processes, grace):
+    """
+    Run nameko services in one process per CPU core.
+
+    SERVICES are module[:Class] targets as for `nameko run`, -m/-c select services as for
+    metric-config-gen. Processes that exit are restarted, SIGTERM/Ctrl-C stops them
+    gracefully and SIGHUP restarts them one by one.
+    """
+    from namekoplus.supervisor import Supervisor
+
+    targets = service_targets(services, modules, class_name_str)
+    supervisor = Supervisor(targets, config_file=config_file, processes=processes, grace=grace)
+    click.echo(f'Running {" ".join(targets)} in {supervisor.processes} processes')
+    supervisor.run()
+
+
+@cli.command()
+@click.argument('services', nargs=-1)
+@click.option('-m', '--module', 'modules',
+              multiple=True,
+              help='The module name where the nameko service exists; repeat for more modules')
+@click.option('-c', '--class', 'class_name_str',
+              default='',
+              help='The class names of the nameko services separated by commas, omit to profile every service '
+                   'of the modules')
+@click.option('--config', 'config_file',
+              type=click.Path(exists=True, dir_okay=False),
+              help='The YAML config file of the services')
+@click.option('-d', '--duration',
+              type=float,
+              help='Seconds to profile for, omit to profile until Ctrl-C/SIGTERM')
+@click.option('-i', '--interval',
+              default=5.0,
+              show_default=True,
+              help='Milliseconds between two stack samples')
+@click.option('--memory/--no-memory',
+              default=True,
+              show_default=True,
+              help='Trace allocations with tracemalloc, which slows allocations down')
+@click.option('--traceback-depth',
+              default=32,
+              show_default=True,
+              help='Frames kept per allocation; allocations deeper below the entrypoint are not attributed')
+@click.option('-o', '--output-dir',
+              default='profiles',
+              show_default=True,
+              help='The directory the profiles are written to')
+def profile(services, modules, class_name_str, config_file, duration, interval, memory, traceback_depth,
+            output_dir):
+    """
+    Profile CPU and allocations of nameko services per entrypoint.
+
+    SERVICES are module[:Class] targets as for `nameko run`, -m/-c select services as for
+    metric-config-gen. The services run in this process until the duration is over or
+    Ctrl-C/SIGTERM; drive load meanwhile, e.g. with `namekoplus bench`. Every entrypoint
+    gets a collapsed stack file for flamegraph.pl, inferno or speedscope and an
+    allocations file, next to a summary.
+    """
+    import eventlet
+    eventlet.monkey_patch()
+
+    import errno
+    import logging.config
+    import signal
+    import sys
+
+    from nameko import config
+    from nameko.cli.utils import import_services
+    from nameko.cli.utils.config import setup_config
+    from nameko.runners import ServiceRunner
+    from namekoplus.chassis.serialization import register_compression
+    from namekoplus.chassis.transport import register_memory_transport
+    from namekoplus.profiler import Profiler
+
+    targets = service_targets(services, modules, class_name_str)
+    if config_file:
+        with open(config_file, 'rb') as config_fp:
+            setup_config(config_fp)
+    # The config may run the services on memory:// or compress their messages
+    register_memory_transport()
+    register_compression()
+    if 'LOGGING' in config:
+        logging.config.dictConfig(config['LOGGING'])
+    else:
+        logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+    if '.' not in sys.path:
+        sys.path.append('.')
+    runner = ServiceRunner()
+    for target in targets:
+        for service_cls in import_services(target):
+            runner.add_service(service_cls)
+
+    profiler = Profiler(interval=interval / 1000.0, memory=memory, traceback_depth=traceback_depth)
+
+    def stop():
+        # Shutting down is not part of the profile
+        profiler.stop()
+        runner.stop()
+
+    def shutdown(signum, frame):
+        eventlet.spawn_n(stop)
+
+    signal.signal(signal.SIGTERM, shutdown)
+    runner.start()
+    profiler.start(runner.containers)
+    if duration:
+        eventlet.spawn_after(duration, stop)
+    click.echo(f'Profiling {" ".join(targets)}{f" for {duration:g}s" if duration else ", Ctrl-C to stop"}. '
+               f'Drive load meanwhile, e.g. with `namekoplus bench rpc`', err=True)
+
+    # Like `nameko run`, wait in a greenthread so a signal interrupting the hub does not end up here
+    runnlet = eventlet.spawn(runner.wait)
+    while True:
+        try:
+            runnlet.wait()
+        except OSError as exc:
+            if exc.errno == errno.EINTR:
+                continue
+            raise
+        except KeyboardInterrupt:
+            click.echo(err=True)
+            stop()
+        else:
+            break
+
+    paths = profiler.write(output_dir)
+    click.echo(profiler.summary())
+    click.echo(f'Wrote {len(paths)} files to {output_dir}')
+
+
+@cli.command()
+@click.option('-u', '--url',
+              default=DEFAULT_MANAGEMENT_URL,
+              show_default=True,
+              help='The URL of the RabbitMQ management API, with the credentials')
+@click.option('--vhost',
+              default='/',
+              show_default=True,
+              help='The virtual host of the queues')
+@click.option('-s', '--service', 'services',
+              multiple=True,
+              help='Only show this service; repeat for more')
+@click.option('-i', '--interval',
+              default=2.0,
+              show_default=True,
+              help='Seconds between two refreshes')
+@click.option('--once',
+              is_flag=True,
+              help='Show the queues once instead of refreshing the view')
+@click.option('--json', 'json_output',
+              is_flag=True,
+              help='Print the queues once as JSON')
+def top(url, vhost, services, interval, once, json_output):
+    """
+    Show the queues of nameko services: depth, rates, consumers and drain time.
+
+    Every service gets its RPC and event handler queues, read from the management API
+    of RabbitMQ. Rows turn red when a queue has no consumers or its ready messages do
+    not drain at the current rates.
+    """
+    import time
+    from namekoplus.top import ManagementClient, ManagementError, format_snapshot, snapshot
+
+    client = ManagementClient(url, vhost=vhost)
+    source = f'{client.netloc}{client.prefix} vhost {vhost}'
+    if json_output or once:
+        try:
+            result = snapshot(client, services)
+        except ManagementError as exc:
+            raise click.ClickException(str(exc))
+        click.echo(json.dumps(result, indent=2) if json_output else format_snapshot(result, source))
+        return
+
+    try:
+        while True:
+            try:
+                view = format_snapshot(snapshot(client, services), source)
+            except ManagementError as exc:
+                # Keep polling, e.g. while the broker restarts
+                view = click.style(str(exc), fg='red')
+            click.clear()
+            click.echo(view)
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        client.close()
+
+
+def parse_json_option(ctx, param, value):
+    if value is None:
+        return None
+    try:
+        return json.loads(value)
+    except ValueError as exc:
+        raise click.BadParameter(f'Invalid JSON: {exc}')
+
+
+def bench_options(func):
+    options = [
+        click.option('-n', '--concurrency', default=10, show_default=True,
+                     help='Number of concurrent workers, each with its own connection'),
+        click.option('-d', '--duration', default=10.0, show_default=True,
+                     help='Seconds to measure for'),
+        click.option('-r', '--rate', type=float, default=None,
+                     help='Requests per second to offer; omit to run at max concurrency'),
+        click.option('-w', '--warmup', default=1.0, show_default=True,
+                     help='Seconds of traffic sent before measuring starts'),
+        click.option('--timeout', type=float, default=30.0, show_default=True,
+                     help='Seconds to wait for a single reply'),
+        click.option('--json', 'json_path',
+                     help='Write machine-readable results to this file, or - for stdout'),
+    ]
+    for option in reversed(options):
+        func = option(func)
+    return func
+
+
+def check_broker(amqp_uri):
+    """
+    Fail fast when the broker cannot be reached, instead of letting the clients retry forever.
+    """
+    parts = urlsplit(amqp_uri)
+    if parts.scheme == 'memory':
+        # The in-process broker has nothing to probe, kombu only has to know its scheme
+        from namekoplus.chassis.chassis import register_memory_transport
+        register_memory_transport()
+        return
+    probe = amqp_probe(parts.hostname or 'localhost', parts.port or 5672)
+    try:
+        probe()
+    except OSError as exc:
+        raise click.ClickException(f'Cannot reach the broker at {parts.hostname}:{parts.port or 5672}: {exc}. '
+                                   f'Try `namekoplus start -m rabbitmq`')
+
+
+def run_bench(cases, concurrency, duration, rate, warmup, json_path):
+    from namekoplus.bench import run_load, format_result, dump_results
+
+    results = []
+    for name, session in cases:
+        result = run_load(name, session, concurrency=concurrency, duration=duration, rate=rate, warmup=warmup)
+        click.echo(format_result(result), err=json_path == '-')
+        results.append(result)
+
+    if json_path:
+        dump_results(results, json_path)
+
+
+@cli.group()
+def bench():
+    """
+    Benchmark entrypoints of running nameko services.
+    """
+
+
+@bench.command('rpc')
+@click.option('-s', '--service', required=True, help='The name of the target service')
+@click.option('-m', '--method', required=True, help='The rpc method to call')
+@click.option('--args', 'call_args', default='[]', callback=parse_json_option, help='Positional arguments as JSON')
+@click.option('--kwargs', 'call_kwargs', default='{}', callback=parse_json_option, help='Keyword arguments as JSON')
+@click.option('--amqp-uri', default=DEFAULT_AMQP_URI, show_default=True, help='The AMQP URI of the broker')
+@bench_options
+def bench_rpc(service, method, call_args, call_kwargs, amqp_uri, concurrency, duration, rate, warmup, timeout,
+              json_path):
+    """
+    Benchmark an rpc entrypoint through ClusterRpcClient.
+    """
+    from namekoplus.bench import rpc_session
+
+    check_broker(amqp_uri)
+    session = rpc_session(service, method, call_args, call_kwargs, uri=amqp_uri, timeout=timeout)
+    run_bench([(f'rpc {service}.{method}', session)], concurrency, duration, rate, warmup, json_path)
+
+
+@bench.command('event')
+@click.option('-s', '--service', required=True, help='The name of the service the events originate from')
+@click.option('-e', '--event-type', required=True, help='The event type to dispatch')
+@click.option('--payload', default='null', callback=parse_json_option, help='The event payload as JSON')
+@click.option('--amqp-uri', default=DEFAULT_AMQP_URI, show_default=True, help='The AMQP URI of the broker')
+@bench_options
+def bench_event(service, event_type, payload, amqp_uri, concurrency, duration, rate, warmup, timeout, json_path):
+    """
+    Benchmark dispatching events to event_handler entrypoints.
+    """
+    from namekoplus.bench import event_session
+
+    check_broker(amqp_uri)
+    session = event_session(service, event_type, payload, uri=amqp_uri)
+    run_bench([(f'event {service}.{event_type}', session)], concurrency, duration, rate, warmup, json_path)
+
+
+@bench.command('http')
+@click.option('-u', '--url', required=True, help='The URL of the http entrypoint')
+@click.option('-X', '--method', default='GET', show_default=True, help='The HTTP method')
+@click.option('--body', default=None, help='The request body')
+@bench_options
+def bench_http(url, method, body, concurrency, duration, rate, warmup, timeout, json_path):
+    """
+    Benchmark an http entrypoint over keep-alive connections.
+    """
+    from namekoplus.bench import http_session
+
+    session = http_session(url, method.upper(), body, timeout=timeout)
+    run_bench([(f'http {method.upper()} {urlsplit(url).path}', session)], concurrency, duration, rate, warmup,
+              json_path)
+
+
+@bench.command('suite')
+@click.option('--amqp-uri', default=DEFAULT_AMQP_URI, show_default=True, help='The AMQP URI of the broker')
+@bench_options
+def bench_suite(amqp_uri, concurrency, duration, rate, warmup, timeout, json_path):
+    """
+    Run the baseline suite against the services of `namekoplus init -t all`.
+    """
+    from namekoplus.bench import DEMO_SUITE, suite_sessions
+
+    check_broker(amqp_uri)
+    run_bench(suite_sessions(DEMO_SUITE, uri=amqp_uri, timeout=timeout), concurrency, duration, rate, warmup,
+              json_path)
 
 
 if __name__ == '__main__':
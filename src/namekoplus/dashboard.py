@@ -0,0 +1,415 @@
+"""
+Capacity planning dashboards for Grafana, generated by ``metric-config-gen``.
+
+Every service gets one dashboard, laid out on Grafana's 24 column grid in rows:
+
+- Fleet: request rate, error ratio, p99 latency and worker pool utilization of every
+  service, the busiest services and the deepest queues
+- Service: headline stats of the services picked by the ``service`` and ``instance``
+  variables, then their rates, errors and latency per entrypoint, worker pool, queue
+  depth and consumer lag
+- Latency by stat: the latency percentiles of every entrypoint and custom ``@statsd.timer`` stat
+
+Queue depth comes from the per-queue metrics of RabbitMQ's Prometheus plugin, which the
+generated ``prometheus.yml`` scrapes from ``/metrics/detailed``.
+"""
+
+GRID_WIDTH = 24
+
+LATENCY_QUANTILES = (0.5, 0.9, 0.95, 0.99)
+
+# Where the color of utilization, error ratio and lag panels turns orange, then red
+UTILIZATION_THRESHOLDS = (0.7, 0.9)
+ERROR_RATIO_THRESHOLDS = (0.01, 0.05)
+LAG_THRESHOLDS = (10, 60)
+
+# Per-queue metrics of RabbitMQ's Prometheus plugin
+QUEUE_READY_METRIC = 'rabbitmq_detailed_queue_messages_ready'
+QUEUE_UNACKED_METRIC = 'rabbitmq_detailed_queue_messages_unacked'
+QUEUE_CONSUMERS_METRIC = 'rabbitmq_detailed_queue_consumers'
+
+# nameko consumes RPC calls from rpc-<service> and events from evt-<source>-<type>--<service>.<method>
+SERVICE_QUEUES = r'rpc-$service|evt-.+--$service\\..+'
+
+DATASOURCE = {'type': 'prometheus', 'uid': '${datasource}'}
+
+SERVICE_SELECTOR = 'service=~"$service", instance=~"$instance"'
+QUEUE_SELECTOR = 'queue=~"{}"'.format(SERVICE_QUEUES)
+
+
+def _matchers(*selectors):
+    selectors = [selector for selector in selectors if selector]
+    return '{' + ', '.join(selectors) + '}' if selectors else ''
+
+
+def _aggregate(operator, by, expr):
+    labels = ', '.join(label for label in by if label)
+    return '{} by ({}) ({})'.format(operator, labels, expr) if labels else '{}({})'.format(operator, expr)
+
+
+class Queries:
+    """
+    The PromQL of the capacity panels, for the metrics of a ``metric-config-gen`` mode.
+
+    In ``statsd`` mode the metrics are those of ``init_instrumentation`` after
+    statsd-exporter, in ``direct`` mode those of ``init_prometheus_metrics``.
+    """
+
+    def __init__(self, mode, observer_type='summary'):
+        from namekoplus.chassis.instrumentation import prometheus_name
+        from namekoplus.chassis.prometheus import ENTRYPOINT_DURATION_METRIC, POOL_METRICS
+
+        self.mode = mode
+        self.observer_type = observer_type
+        if mode == 'statsd':
+            self.calls_metric = prometheus_name('calls')
+            self.latency_metric = prometheus_name('handler')
+        else:
+            self.calls_metric = ENTRYPOINT_DURATION_METRIC + '_count'
+            self.latency_metric = ENTRYPOINT_DURATION_METRIC
+        self.errors_metric = prometheus_name('errors')
+        self.broker_wait_metric = prometheus_name('broker_wait')
+        self.bytes_metrics = (prometheus_name('request_bytes'), prometheus_name('response_bytes'))
+        self.pool_metrics = {kind: name for kind, (name, _) in POOL_METRICS.items()}
+
+    @property
+    def broker_wait(self):
+        # Only init_instrumentation measures the time messages spend in the broker
+        return self.mode == 'statsd'
+
+    def requests(self, selector='', by='service'):
+        return _aggregate('sum', [by], 'rate({}{}[1m])'.format(self.calls_metric, _matchers(selector)))
+
+    def errors(self, selector='', by='service'):
+        if self.mode == 'statsd':
+            metric, selector = self.errors_metric, _matchers(selector)
+        else:
+            metric, selector = self.calls_metric, _matchers(selector, 'outcome="error"')
+        return _aggregate('sum', [by], 'rate({}{}[1m])'.format(metric, selector))
+
+    def error_ratio(self, selector='', by='service'):
+        # Services without errors have no error series, count them as 0
+        requests = self.requests(selector, by)
+        return '({} or {} * 0) / ({} > 0)'.format(self.errors(selector, by), requests, requests)
+
+    def latency(self, quantile, selector='', by='service', metric=None):
+        metric = metric or self.latency_metric
+        if self.mode == 'statsd' and self.observer_type == 'summary':
+            # Quantiles of summaries cannot be aggregated, the slowest entrypoint stands for the group
+            return _aggregate('max', [by], metric + _matchers(selector, 'quantile="{:g}"'.format(quantile)))
+        buckets = _aggregate('sum', ['le', by], 'rate({}_bucket{}[1m])'.format(metric, _matchers(selector)))
+        return 'histogram_quantile({:g}, {})'.format(quantile, buckets)
+
+    def pool(self, kind, selector='', by='service', aggregation='max'):
+        return _aggregate(aggregation, [by], self.pool_metrics[kind] + _matchers(selector))
+
+    def queue_depth(self, selector=QUEUE_SELECTOR, by='queue'):
+        return _aggregate('sum', [by], '{}{} + {}{}'.format(QUEUE_READY_METRIC, _matchers(selector),
+                                                            QUEUE_UNACKED_METRIC, _matchers(selector)))
+
+    def drain_time(self):
+        # Seconds the consumers need for the backlog at their current rate
+        return 'sum({}{}) / clamp_min(sum(rate({}{}[1m])), 0.001)'.format(
+            QUEUE_READY_METRIC, _matchers(QUEUE_SELECTOR), self.calls_metric, _matchers(SERVICE_SELECTOR))
+
+
+def _thresholds(steps):
+    colors = ('orange', 'red')
+    return {
+        'mode': 'absolute',
+        'steps': [{'color': 'green', 'value': None}] + [
+            {'color': color, 'value': value} for color, value in zip(colors, steps)
+        ],
+    }
+
+
+def _targets(targets):
+    return [
+        {
+            'datasource': DATASOURCE,
+            'expr': expr,
+            'legendFormat': legend,
+            'refId': chr(ord('A') + idx),
+        }
+        for idx, (expr, legend) in enumerate(targets)
+    ]
+
+
+def timeseries(title, targets, unit='short', thresholds=None, max_value=None, description=''):
+    """
+    A time series panel of ``targets``, a list of ``(expr, legend)``.
+
+    ``thresholds`` are drawn as lines, so a panel shows how close a series is to its limit.
+    """
+    defaults = {
+        'unit': unit,
+        'min': 0,
+        'color': {'mode': 'palette-classic'},
+        'custom': {
+            'drawStyle': 'line',
+            'lineWidth': 1,
+            'fillOpacity': 10,
+            'showPoints': 'never',
+            'spanNulls': True,
+            'thresholdsStyle': {'mode': 'line' if thresholds else 'off'},
+        },
+        'thresholds': _thresholds(thresholds or ()),
+    }
+    if max_value is not None:
+        defaults['max'] = max_value
+    return {
+        'type': 'timeseries',
+        'title': title,
+        'description': description,
+        'datasource': DATASOURCE,
+        'fieldConfig': {'defaults': defaults, 'overrides': []},
+        'options': {
+            'legend': {'displayMode': 'table', 'placement': 'bottom', 'calcs': ['mean', 'max', 'lastNotNull']},
+            'tooltip': {'mode': 'multi', 'sort': 'desc'},
+        },
+        'targets': _targets(targets),
+    }
+
+
+def stat(title, expr, unit='short', thresholds=None, description=''):
+    """
+    A single stat panel colored by ``thresholds``.
+    """
+    return {
+        'type': 'stat',
+        'title': title,
+        'description': description,
+        'datasource': DATASOURCE,
+        'fieldConfig': {
+            'defaults': {
+                'unit': unit,
+                'color': {'mode': 'thresholds'},
+                'thresholds': _thresholds(thresholds or ()),
+            },
+            'overrides': [],
+        },
+        'options': {
+            'reduceOptions': {'calcs': ['lastNotNull'], 'fields': '', 'values': False},
+            'colorMode': 'background',
+            'graphMode': 'area',
+            'justifyMode': 'auto',
+            'textMode': 'value',
+        },
+        'targets': _targets([(expr, title)]),
+    }
+
+
+class Layout:
+    """
+    Place panels on the grid from left to right, wrapping them into new lines.
+    """
+
+    def __init__(self):
+        self.panels = []
+        self.x = 0
+        self.y = 0
+        self.line_height = 0
+
+    def _newline(self):
+        self.y += self.line_height
+        self.x = 0
+        self.line_height = 0
+
+    def add(self, panel, width=12, height=8):
+        if self.x + width > GRID_WIDTH:
+            self._newline()
+        panel['id'] = len(self.panels) + 1
+        panel['gridPos'] = {'h': height, 'w': width, 'x': self.x, 'y': self.y}
+        self.panels.append(panel)
+        self.x += width
+        self.line_height = max(self.line_height, height)
+
+    def row(self, title):
+        self._newline()
+        self.add({'type': 'row', 'title': title, 'collapsed': False, 'panels': []}, width=GRID_WIDTH, height=1)
+
+
+def fleet_row(layout, queries):
+    layout.row('Fleet')
+    layout.add(timeseries('Request rate by service', [(queries.requests(), '{{service}}')], unit='reqps'))
+    layout.add(timeseries('Error ratio by service', [(queries.error_ratio(), '{{service}}')], unit='percentunit',
+                          thresholds=ERROR_RATIO_THRESHOLDS))
+    layout.add(timeseries('p99 latency by service', [(queries.latency(0.99), '{{service}}')], unit='s'))
+    layout.add(timeseries('Worker pool utilization by service', [(queries.pool('utilization'), '{{service}}')],
+                          unit='percentunit', thresholds=UTILIZATION_THRESHOLDS, max_value=1))
+    layout.add(timeseries('Busiest services', [('topk(5, {})'.format(queries.pool('utilization')), '{{service}}')],
+                          unit='percentunit', thresholds=UTILIZATION_THRESHOLDS, max_value=1,
+                          description='The services whose worker pools are closest to their size'))
+    layout.add(timeseries('Deepest queues', [('topk(10, {})'.format(queries.queue_depth(selector='')), '{{queue}}')],
+                          description='Ready and unacknowledged messages of the longest queues'))
+
+
+def service_rows(layout, queries):
+    layout.row('Service $service')
+    stats = [
+        stat('Requests', queries.requests(SERVICE_SELECTOR, by=''), unit='reqps'),
+        stat('Error ratio', queries.error_ratio(SERVICE_SELECTOR, by=''), unit='percentunit',
+             thresholds=ERROR_RATIO_THRESHOLDS),
+        stat('p99 latency', queries.latency(0.99, SERVICE_SELECTOR, by=''), unit='s'),
+        stat('Worker pool utilization', queries.pool('utilization', SERVICE_SELECTOR, by=''), unit='percentunit',
+             thresholds=UTILIZATION_THRESHOLDS, description='Of the busiest instance'),
+        stat('Queue depth', queries.queue_depth(by=''), description='Ready and unacknowledged messages'),
+        stat('Consumer lag', queries.drain_time(), unit='s', thresholds=LAG_THRESHOLDS,
+             description='Seconds to consume the ready messages at the current request rate'),
+    ]
+    for panel in stats:
+        layout.add(panel, width=GRID_WIDTH // len(stats), height=4)
+
+    layout.add(timeseries('Request rate by entrypoint', [(queries.requests(SERVICE_SELECTOR, by='entrypoint'),
+                                                          '{{entrypoint}}')], unit='reqps'))
+    layout.add(timeseries('Errors by entrypoint', [(queries.errors(SERVICE_SELECTOR, by='entrypoint'),
+                                                    '{{entrypoint}}')], unit='reqps'))
+    layout.add(timeseries('Latency', [(queries.latency(quantile, SERVICE_SELECTOR, by='service'),
+                                       'p{:g}'.format(quantile * 100)) for quantile in LATENCY_QUANTILES], unit='s'))
+    layout.add(timeseries('p99 latency by entrypoint', [(queries.latency(0.99, SERVICE_SELECTOR, by='entrypoint'),
+                                                         '{{entrypoint}}')], unit='s'))
+    layout.add(timeseries('Worker pool', [
+        (queries.pool('busy', SERVICE_SELECTOR, by='service', aggregation='sum'), 'busy'),
+        (queries.pool('size', SERVICE_SELECTOR, by='service', aggregation='sum'), 'size'),
+    ], description='Workers of every instance'))
+    layout.add(timeseries('Worker pool utilization', [(queries.pool('utilization', SERVICE_SELECTOR, by='instance'),
+                                                       '{{instance}}')],
+                          unit='percentunit', thresholds=UTILIZATION_THRESHOLDS, max_value=1))
+    layout.add(timeseries('Queue depth', [
+        ('sum by (queue) ({}{})'.format(QUEUE_READY_METRIC, _matchers(QUEUE_SELECTOR)), '{{queue}} ready'),
+        ('sum by (queue) ({}{})'.format(QUEUE_UNACKED_METRIC, _matchers(QUEUE_SELECTOR)), '{{queue}} unacked'),
+        ('sum by (queue) ({}{})'.format(QUEUE_CONSUMERS_METRIC, _matchers(QUEUE_SELECTOR)), '{{queue}} consumers'),
+    ]))
+    lag_targets = [(queries.drain_time(), 'backlog / request rate')]
+    if queries.broker_wait:
+        lag_targets += [
+            (queries.latency(quantile, SERVICE_SELECTOR, by='service', metric=queries.broker_wait_metric),
+             'broker wait p{:g}'.format(quantile * 100))
+            for quantile in (0.5, 0.99)
+        ]
+    layout.add(timeseries('Consumer lag', lag_targets, unit='s', thresholds=LAG_THRESHOLDS,
+                          description='Time messages wait in the broker before a worker takes them'))
+    if queries.mode == 'statsd':
+        layout.add(timeseries('Payload throughput', [
+            ('sum(rate({}{}[1m]))'.format(metric, _matchers(SERVICE_SELECTOR)), label)
+            for metric, label in zip(queries.bytes_metrics, ('requests', 'responses'))
+        ], unit='Bps', description='Needs init_instrumentation(statsd, payload_sizes=True)'), width=GRID_WIDTH)
+
+
+def latency_configs(configs):
+    """
+    The metric configs getting a latency panel of their own: custom timers and entrypoint handlers.
+    """
+    from namekoplus.chassis.instrumentation import prometheus_name
+
+    handler_metric = prometheus_name('handler')
+    return [
+        config for config in configs
+        if config.get('metric_type', 'timer') == 'timer' and config.get('metric_name', handler_metric) == handler_metric
+    ]
+
+
+def grafana_targets(config, mode):
+    """
+    The Prometheus queries of the latency panel of one metric config of ``latency_configs``.
+    """
+    if mode == 'statsd':
+        metric = config.get('metric_name', config['stat_name'])
+        selector = _matchers(*('{}="{}"'.format(name, value) for name, value in config.get('labels', {}).items()))
+        if config.get('metric_type') == 'counter':
+            return [{'expr': 'sum(rate({}{}[1m]))'.format(metric, selector), 'legend': config['stat_name'] + ' /s'}]
+        if config.get('metric_type') == 'gauge':
+            return [{'expr': metric + selector, 'legend': config['stat_name']}]
+        if config.get('observer_type') != 'histogram':
+            return [{'expr': metric + selector, 'legend': config['stat_name'] + ' {{quantile}}'}]
+    else:
+        from namekoplus.chassis.prometheus import ENTRYPOINT_DURATION_METRIC
+        metric = ENTRYPOINT_DURATION_METRIC
+        selector = '{{service="{}", entrypoint="{}"}}'.format(config['service_name'], config['stat_name'])
+    # Summing the buckets before computing quantiles aggregates them across all replicas
+    return [
+        {
+            'expr': 'histogram_quantile({}, sum by (le) (rate({}_bucket{}[1m])))'.format(quantile, metric, selector),
+            'legend': '{} p{:g}'.format(config['stat_name'], quantile * 100),
+        }
+        for quantile in LATENCY_QUANTILES
+    ]
+
+
+def stat_rows(layout, stat_configs):
+    if not stat_configs:
+        return
+    layout.row('Latency by stat')
+    for config in stat_configs:
+        layout.add(timeseries(config['stat_name'], [(target['expr'], target['legend'])
+                                                    for target in config['targets']], unit='s'))
+
+
+def variables(queries, service_name):
+    """
+    The ``datasource``, ``service`` and ``instance`` variables, ``service`` defaulting to ``service_name``.
+    """
+    service_query = 'label_values({}, service)'.format(queries.calls_metric)
+    instance_query = 'label_values({}{{service=~"$service"}}, instance)'.format(queries.calls_metric)
+    return [
+        {
+            'type': 'datasource',
+            'name': 'datasource',
+            'label': 'Data source',
+            'query': 'prometheus',
+            'current': {'text': 'statsd', 'value': 'statsd'},
+            'hide': 0,
+            'refresh': 1,
+            'options': [],
+        },
+        {
+            'type': 'query',
+            'name': 'service',
+            'label': 'Service',
+            'datasource': DATASOURCE,
+            'definition': service_query,
+            'query': {'query': service_query, 'refId': 'service'},
+            'current': {'text': [service_name], 'value': [service_name]},
+            'includeAll': True,
+            'allValue': '.*',
+            'multi': True,
+            'refresh': 2,
+            'sort': 1,
+            'options': [],
+        },
+        {
+            'type': 'query',
+            'name': 'instance',
+            'label': 'Instance',
+            'datasource': DATASOURCE,
+            'definition': instance_query,
+            'query': {'query': instance_query, 'refId': 'instance'},
+            'current': {'text': ['All'], 'value': ['$__all']},
+            'includeAll': True,
+            'allValue': '.*',
+            'multi': True,
+            'refresh': 2,
+            'sort': 1,
+            'options': [],
+        },
+    ]
+
+
+def build_panels(queries, capacity=True, stat_configs=()):
+    """
+    Lay out the panels of a service dashboard.
+
+    :Parameters:
+        queries : Queries
+            PromQL of the metrics mode
+        capacity : bool
+            Add the fleet and service rows, which need the entrypoint and pool metrics
+        stat_configs : list
+            Metric configs of ``latency_configs``, with the ``targets`` of ``grafana_targets``
+    """
+    layout = Layout()
+    if capacity:
+        fleet_row(layout, queries)
+        service_rows(layout, queries)
+    stat_rows(layout, stat_configs)
+    return layout.panels
@@ -0,0 +1,188 @@
+"""
+Bring middleware containers up and down from a dependency graph.
+
+Components without dependencies between them are started in parallel, and a
+component only starts once every component it depends on passes its readiness probe.
+"""
+
+import socket
+import threading
+import time
+
+import click
+
+AMQP_PROTOCOL_HEADER = b'AMQP\x00\x00\x09\x01'
+
+
+class ComponentFailed(Exception):
+    pass
+
+
+def tcp_probe(host, port):
+    """
+    Ready when the port accepts TCP connections.
+    """
+    def probe():
+        with socket.create_connection((host, port), timeout=1):
+            return True
+    return probe
+
+
+def http_probe(url):
+    """
+    Ready when the URL answers with a 2xx status.
+    """
+    from urllib.request import urlopen
+
+    def probe():
+        with urlopen(url, timeout=1) as response:
+            return 200 <= response.status < 300
+    return probe
+
+
+def amqp_probe(host, port):
+    """
+    Ready when the broker answers the AMQP 0-9-1 protocol header with a method frame.
+
+    An open port alone is not enough, RabbitMQ accepts connections before it can serve them.
+    """
+    def probe():
+        with socket.create_connection((host, port), timeout=1) as sock:
+            sock.settimeout(1)
+            sock.sendall(AMQP_PROTOCOL_HEADER)
+            frame = sock.recv(8)
+            # Frame type 1 is a method frame, i.e. Connection.Start
+            return len(frame) > 0 and frame[0] == 1
+    return probe
+
+
+class Component:
+    """
+    A middleware component with a start/stop action and an optional readiness probe.
+
+    ``state`` returns ``'absent'``, ``'running'``, ``'stopped'`` or ``'outdated'`` for one
+    running with another configuration. A running component is reused once it passes its
+    probe, a stopped or outdated one is removed and started again.
+    """
+
+    def __init__(self, name, start, stop, probe=None, depends_on=(), state=None):
+        self.name = name
+        self.start = start
+        self.stop = stop
+        self.probe = probe
+        self.depends_on = tuple(depends_on)
+        self.state = state
+
+    def is_ready(self):
+        if self.probe is None:
+            return True
+        try:
+            return bool(self.probe())
+        except (OSError, ValueError):
+            # including urllib's URLError
+            return False
+
+    def wait_until_ready(self, timeout, interval=0.2):
+        deadline = time.monotonic() + timeout
+        while not self.is_ready():
+            if time.monotonic() > deadline:
+                raise ComponentFailed(f'{self.name} is not ready after {timeout}s')
+            time.sleep(interval)
+
+
+def _run_graph(components, action, reverse=False):
+    """
+    Run ``action(component)`` for every component once the components it is ordered after finished.
+
+    Returns a dict mapping component names to ``(outcome, seconds)``.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    by_name = {component.name: component for component in components}
+    if reverse:
+        order_after = {name: [] for name in by_name}
+        for component in components:
+            for dependency in component.depends_on:
+                if dependency in order_after:
+                    order_after[dependency].append(component.name)
+    else:
+        order_after = {component.name: [dep for dep in component.depends_on if dep in by_name]
+                       for component in components}
+
+    done = {name: threading.Event() for name in by_name}
+    succeeded = set()
+    results = {}
+
+    def run(name):
+        try:
+            for dependency in order_after[name]:
+                done[dependency].wait()
+                if dependency not in succeeded:
+                    results[name] = (f'skipped, {dependency} failed', 0.0)
+                    return
+
+            started_at = time.monotonic()
+            try:
+                outcome = action(by_name[name])
+            except Exception as exc:
+                results[name] = (f'FAILED: {exc}', time.monotonic() - started_at)
+                return
+            results[name] = (outcome, time.monotonic() - started_at)
+            succeeded.add(name)
+        finally:
+            done[name].set()
+
+    # Every component gets its own thread, so waiting on dependencies can never starve the pool
+    with ThreadPoolExecutor(max_workers=len(components)) as executor:
+        for name in by_name:
+            executor.submit(run, name)
+
+    return {name: results[name] for name in by_name}
+
+
+def _report(results, total):
+    width = max(len(name) for name in results)
+    for name, (outcome, seconds) in results.items():
+        click.echo(f'  {name:<{width}}  {seconds:6.1f}s  {outcome}')
+    click.echo(f'  {"total":<{width}}  {total:6.1f}s\n')
+
+
+def bring_up(components, timeout=120):
+    """
+    Start the components following their dependencies and wait for each one to be ready.
+    """
+    def start(component):
+        state = component.state() if component.state is not None else 'absent'
+        if state == 'running':
+            component.wait_until_ready(timeout)
+            return 'reused'
+        if state != 'absent':
+            component.stop()
+        component.start()
+        component.wait_until_ready(timeout)
+        return 'ready'
+
+    click.echo('Starting ' + ', '.join(component.name for component in components) + ' ...')
+    started_at = time.monotonic()
+    results = _run_graph(components, start)
+    _report(results, time.monotonic() - started_at)
+    if any(outcome not in ('ready', 'reused') for outcome, _ in results.values()):
+        raise ComponentFailed('Some components failed to start')
+
+
+def tear_down(components):
+    """
+    Stop the components, dependents before the components they depend on.
+    """
+    def stop(component):
+        if component.state is not None and component.state() == 'absent':
+            return 'absent'
+        component.stop()
+        return 'removed'
+
+    click.echo('Stopping ' + ', '.join(component.name for component in components) + ' ...')
+    started_at = time.monotonic()
+    results = _run_graph(components, stop, reverse=True)
+    _report(results, time.monotonic() - started_at)
+    if any(outcome not in ('removed', 'absent') for outcome, _ in results.values()):
+        raise ComponentFailed('Some components failed to stop')
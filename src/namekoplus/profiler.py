@@ -0,0 +1,298 @@
+"""
+Profile nameko services per entrypoint while they serve traffic.
+
+A sampler on a real OS thread reads the stack of the main thread, where eventlet
+runs every greenthread, at a fixed interval. A sample whose stack passes through
+``ServiceContainer._run_worker`` is charged to the entrypoint of that worker, one
+in the hub waiting for I/O counts as idle and the rest as outside workers, e.g.
+consumers decoding messages. Reading a stack costs microseconds, so the services
+run at close to their normal speed.
+
+With ``memory`` on, tracemalloc records where memory is allocated. Snapshots taken
+every ``snapshot_interval`` charge the memory held by workers to the entrypoint
+whose method is on the allocation traceback. tracemalloc slows allocations down
+noticeably, so profile CPU without it when latency matters.
+
+Stacks are written in the collapsed format, one ``frame;frame;frame count`` line
+per stack, which flamegraph.pl, inferno and speedscope turn into flame graphs.
+"""
+
+import inspect
+import linecache
+import os
+import sys
+import tracemalloc
+from collections import Counter, defaultdict
+
+from eventlet import patcher
+from nameko.containers import ServiceContainer
+
+# The sampler must keep running while the hub, i.e. the main thread, is busy
+_os_threading = patcher.original('threading')
+_os_thread = patcher.original('_thread')
+_os_time = patcher.original('time')
+
+OUTSIDE_WORKERS = '(outside workers)'
+IDLE = '(idle)'
+
+# Functions of eventlet's hubs blocking in poll/epoll until a socket is ready
+HUB_WAITS = frozenset(['wait', 'do_poll'])
+HUB_DIR = os.path.join('eventlet', 'hubs', '')
+
+
+def _short_path(filename):
+    """
+    ``filename`` relative to the longest matching entry of ``sys.path``, i.e. as its module is named.
+    """
+    for entry in sorted((os.path.abspath(entry) for entry in sys.path if entry), key=len, reverse=True):
+        if filename.startswith(entry + os.sep):
+            return filename[len(entry) + 1:]
+    return filename
+
+
+def _format_size(size):
+    for unit in ('B', 'KiB', 'MiB'):
+        if abs(size) < 1024:
+            return '{:.1f} {}'.format(size, unit) if unit != 'B' else '{:.0f} B'.format(size)
+        size /= 1024.0
+    return '{:.1f} GiB'.format(size)
+
+
+def entrypoint_ranges(containers):
+    """
+    Map source files to the ``(first_line, last_line, entrypoint)`` of the entrypoint methods they define.
+
+    :Parameters:
+        containers : iterable
+            The ``ServiceContainer`` of every profiled service
+    """
+    ranges = defaultdict(list)
+    for container in containers:
+        for entrypoint in container.entrypoints:
+            method = inspect.unwrap(getattr(container.service_cls, entrypoint.method_name))
+            try:
+                lines, first_line = inspect.getsourcelines(method)
+            except (OSError, TypeError):
+                continue
+            label = '{}.{}'.format(container.service_name, entrypoint.method_name)
+            ranges[method.__code__.co_filename].append((first_line, first_line + len(lines) - 1, label))
+    return dict(ranges)
+
+
+class Profiler:
+    """
+    Sample stacks and, optionally, allocations of the services running in this process.
+
+    ``start`` must be called from the main thread, after the services started.
+
+    :Parameters:
+        interval : float
+            Seconds between two stack samples
+        memory : bool
+            Whether to trace allocations with tracemalloc
+        traceback_depth : int
+            Frames tracemalloc keeps per allocation; an entrypoint method further
+            up the stack than that is not seen
+        snapshot_interval : float
+            Seconds between two tracemalloc snapshots
+    """
+
+    def __init__(self, interval=0.005, memory=True, traceback_depth=32, snapshot_interval=1.0):
+        self.interval = interval
+        self.memory = memory
+        self.traceback_depth = traceback_depth
+        self.snapshot_interval = snapshot_interval
+        self.stacks = defaultdict(Counter)
+        self.idle = 0
+        self.ticks = 0
+        self.elapsed = 0.0
+        self.held = defaultdict(Counter)
+        self.retained = defaultdict(Counter)
+        self.blocks = defaultdict(Counter)
+        self.snapshots = 0
+        self.peak_memory = 0
+        self._ranges = {}
+        self._owners = {}
+        self._labels = {}
+        self._run_worker_code = ServiceContainer._run_worker.__code__
+        self._thread = None
+        self._stopped = _os_threading.Event()
+        self._started_at = None
+
+    def start(self, containers):
+        self._ranges = entrypoint_ranges(containers)
+        self._thread_id = _os_thread.get_ident()
+        if self.memory:
+            tracemalloc.start(self.traceback_depth)
+        self._started_at = _os_time.monotonic()
+        self._thread = _os_threading.Thread(target=self._run, name='namekoplus-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None or self._stopped.is_set():
+            return
+        self._stopped.set()
+        self._thread.join()
+        self.elapsed = _os_time.monotonic() - self._started_at
+        if self.memory:
+            self.peak_memory = tracemalloc.get_traced_memory()[1]
+            self._snapshot(final=True)
+            tracemalloc.stop()
+
+    def _run(self):
+        next_sample = next_snapshot = _os_time.monotonic()
+        while not self._stopped.is_set():
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is not None:
+                self._sample(frame)
+            del frame
+
+            now = _os_time.monotonic()
+            if self.memory and now >= next_snapshot + self.snapshot_interval:
+                self._snapshot()
+                next_snapshot = now = _os_time.monotonic()
+            # Skip the samples a busy GIL made us miss rather than taking them in a burst
+            next_sample = max(next_sample + self.interval, now)
+            self._stopped.wait(next_sample - now)
+
+    def _sample(self, frame):
+        self.ticks += 1
+        leaf = frame.f_code
+        if leaf.co_name in HUB_WAITS and HUB_DIR in leaf.co_filename:
+            self.idle += 1
+            return
+
+        codes = []
+        entrypoint = OUTSIDE_WORKERS
+        while frame is not None:
+            code = frame.f_code
+            if code is self._run_worker_code:
+                worker_ctx = frame.f_locals.get('worker_ctx')
+                if worker_ctx is not None:
+                    entrypoint = '{}.{}'.format(worker_ctx.service_name, worker_ctx.entrypoint.method_name)
+                break
+            codes.append(code)
+            frame = frame.f_back
+        codes.reverse()
+        self.stacks[entrypoint][tuple(codes)] += 1
+
+    def _owner(self, traceback):
+        """
+        The entrypoint whose method is on ``traceback``, the innermost one if several are.
+        """
+        if traceback not in self._owners:
+            owner = None
+            for frame in reversed(traceback):
+                for first_line, last_line, label in self._ranges.get(frame.filename, ()):
+                    if first_line <= frame.lineno <= last_line:
+                        owner = label
+                        break
+                if owner:
+                    break
+            self._owners[traceback] = owner
+        return self._owners[traceback]
+
+    def _snapshot(self, final=False):
+        snapshot = tracemalloc.take_snapshot()
+        self.snapshots += 1
+        for statistic in snapshot.statistics('traceback'):
+            owner = self._owner(statistic.traceback)
+            if owner is None:
+                continue
+            # The most recent frame is where the memory was allocated
+            site = statistic.traceback[-1]
+            site = (site.filename, site.lineno)
+            self.held[owner][site] += statistic.size
+            self.blocks[owner][site] += statistic.count
+            if final:
+                self.retained[owner][site] += statistic.size
+
+    def _label(self, code):
+        if code not in self._labels:
+            name = getattr(code, 'co_qualname', code.co_name)
+            self._labels[code] = '{} ({}:{})'.format(name, _short_path(code.co_filename), code.co_firstlineno)
+        return self._labels[code]
+
+    @property
+    def entrypoints(self):
+        names = set(self.stacks) | set(self.held)
+        return sorted(names, key=lambda name: (name == OUTSIDE_WORKERS, -sum(self.stacks[name].values()), name))
+
+    def collapsed(self, entrypoint):
+        """
+        The stacks sampled in ``entrypoint`` as collapsed stack lines, the most frequent first.
+        """
+        lines = []
+        for codes, count in self.stacks[entrypoint].most_common():
+            stack = ';'.join(self._label(code).replace(';', ':') for code in codes) or entrypoint
+            lines.append('{} {}'.format(stack, count))
+        return '\n'.join(lines) + '\n'
+
+    def allocations(self, entrypoint):
+        """
+        The allocation sites of ``entrypoint`` by the memory its workers held on average.
+        """
+        lines = [
+            '# {}: memory held by its workers over {} tracemalloc snapshots'.format(entrypoint, self.snapshots),
+            '{:>12} {:>12} {:>10}  {}'.format('avg held', 'at the end', 'blocks', 'site'),
+        ]
+        for (filename, lineno), size in self.held[entrypoint].most_common():
+            source = linecache.getline(filename, lineno).strip()
+            lines.append('{:>12} {:>12} {:>10}  {}:{}  {}'.format(
+                _format_size(size / self.snapshots), _format_size(self.retained[entrypoint][(filename, lineno)]),
+                self.blocks[entrypoint][(filename, lineno)] // self.snapshots, _short_path(filename), lineno, source))
+        return '\n'.join(lines) + '\n'
+
+    def top_functions(self, entrypoint, limit=3):
+        """
+        The functions ``entrypoint`` spent most samples in itself, i.e. at the top of the stack.
+        """
+        leaves = Counter()
+        for codes, count in self.stacks[entrypoint].items():
+            if codes:
+                leaves[codes[-1]] += count
+        total = sum(self.stacks[entrypoint].values())
+        return ['{} {:.0%}'.format(self._label(code), count / float(total)) for code, count in leaves.most_common(limit)]
+
+    def summary(self):
+        seconds_per_tick = self.elapsed / self.ticks if self.ticks else 0
+        busy = self.ticks - self.idle
+        lines = [
+            '{} samples over {:.1f}s, the main thread was busy in {:.1%} of them'.format(
+                self.ticks, self.elapsed, busy / float(self.ticks or 1)),
+        ]
+        if self.memory:
+            lines.append('tracemalloc peak: {}'.format(_format_size(self.peak_memory)))
+        lines.append('{:<40} {:>8} {:>7} {:>8} {:>12}  {}'.format(
+            'entrypoint', 'samples', 'share', 'cpu s', 'avg held', 'top functions (self)'))
+        for entrypoint in self.entrypoints:
+            samples = sum(self.stacks[entrypoint].values())
+            held = sum(self.held[entrypoint].values()) / self.snapshots if self.snapshots else 0
+            lines.append('{:<40} {:>8} {:>7.1%} {:>8.2f} {:>12}  {}'.format(
+                entrypoint, samples, samples / float(self.ticks or 1), samples * seconds_per_tick,
+                _format_size(held) if self.memory else '-', ', '.join(self.top_functions(entrypoint))))
+        lines.append('{:<40} {:>8} {:>7.1%}'.format(IDLE, self.idle, self.idle / float(self.ticks or 1)))
+        return '\n'.join(lines) + '\n'
+
+    def write(self, output_dir):
+        """
+        Write a collapsed stack file and an allocations file per entrypoint, and the summary.
+
+        Returns the paths written.
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        paths = []
+        for entrypoint in self.entrypoints:
+            base = os.path.join(output_dir, 'outside-workers' if entrypoint == OUTSIDE_WORKERS else entrypoint)
+            if self.stacks[entrypoint]:
+                paths.append(base + '.collapsed')
+                with open(paths[-1], 'w') as collapsed_file:
+                    collapsed_file.write(self.collapsed(entrypoint))
+            if self.held[entrypoint]:
+                paths.append(base + '.allocations.txt')
+                with open(paths[-1], 'w') as allocations_file:
+                    allocations_file.write(self.allocations(entrypoint))
+        paths.append(os.path.join(output_dir, 'summary.txt'))
+        with open(paths[-1], 'w') as summary_file:
+            summary_file.write(self.summary())
+        return paths
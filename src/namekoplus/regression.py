@@ -0,0 +1,265 @@
+"""
+Benchmarks of nameko entrypoints guarded by stored baselines.
+
+The benchmarks ``namekoplus test-gen -t bench`` generates time entrypoints with
+``measure`` and hand the result to ``Baselines.check``, which fails when the median
+got slower than the stored one by more than a threshold, or when there is no stored
+one. Baselines only compare well on the machine they were recorded on, so record
+them where the benchmarks run, e.g. in CI, with ``NAMEKOPLUS_BENCH_UPDATE=1`` and
+commit the file.
+
+``running_services`` runs services in process on the in-memory transport for
+end-to-end benchmarks, which need neither RabbitMQ nor Docker.
+"""
+
+import json
+import os
+import socket
+import time
+from contextlib import contextmanager
+
+UPDATE_ENV = 'NAMEKOPLUS_BENCH_UPDATE'
+THRESHOLD_ENV = 'NAMEKOPLUS_BENCH_THRESHOLD'
+DEFAULT_THRESHOLD = 0.25
+
+
+class PerformanceRegression(AssertionError):
+    pass
+
+
+class MissingBaseline(AssertionError):
+    pass
+
+
+def measure(func, min_time=0.5, min_rounds=5, round_time=0.005):
+    """
+    Time ``func`` and return the statistics of its duration per call, in seconds.
+
+    Calls are timed in rounds of as many calls as take ``round_time``, like ``timeit``
+    does, so fast functions are not drowned by the overhead of the clock. Rounds are
+    repeated for at least ``min_time`` seconds and ``min_rounds`` times.
+    """
+    func()  # warm up, e.g. caches and connections
+    number = 1
+    while True:
+        started_at = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - started_at
+        if elapsed >= round_time:
+            break
+        number *= 2
+
+    durations = [elapsed / number]
+    deadline = time.perf_counter() + min_time
+    while len(durations) < min_rounds or time.perf_counter() < deadline:
+        started_at = time.perf_counter()
+        for _ in range(number):
+            func()
+        durations.append((time.perf_counter() - started_at) / number)
+
+    durations.sort()
+    return {
+        'median_s': durations[len(durations) // 2],
+        'min_s': durations[0],
+        'max_s': durations[-1],
+        'rounds': len(durations),
+        'calls_per_round': number,
+    }
+
+
+def _format_duration(seconds):
+    if seconds < 0.001:
+        return '{:.2f}us'.format(seconds * 1e6)
+    return '{:.3f}ms'.format(seconds * 1000)
+
+
+class Baselines:
+    """
+    Medians of benchmarks stored in a JSON file, compared with new results.
+
+    A benchmark without a baseline fails, so a missing or misplaced baselines file does not
+    pass unnoticed. With ``update``, every result is recorded as the baseline instead, the
+    first time and after an intended change.
+
+    :Parameters:
+        path : str
+            The JSON file of the baselines
+        threshold : float
+            How much slower than the baseline a median may get, 0.25 is 25%; defaults
+            to ``NAMEKOPLUS_BENCH_THRESHOLD`` or 0.25
+        update : bool
+            Whether to record every result; defaults to whether ``NAMEKOPLUS_BENCH_UPDATE`` is set
+    """
+
+    def __init__(self, path, threshold=None, update=None):
+        self.path = path
+        self.threshold = float(os.environ.get(THRESHOLD_ENV, DEFAULT_THRESHOLD)) if threshold is None else threshold
+        self.update = os.environ.get(UPDATE_ENV, '') not in ('', '0') if update is None else update
+        self._baselines = None
+
+    @property
+    def baselines(self):
+        if self._baselines is None:
+            try:
+                with open(self.path, encoding='utf-8') as f:
+                    self._baselines = json.load(f)
+            except FileNotFoundError:
+                self._baselines = {}
+        return self._baselines
+
+    def save(self):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.baselines, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+    def check(self, name, result):
+        """
+        Raise ``PerformanceRegression`` when the median of ``result`` is slower than the baseline of ``name``,
+        and ``MissingBaseline`` when there is none.
+        """
+        if self.update:
+            self.baselines[name] = dict(result, recorded_at=time.strftime('%Y-%m-%dT%H:%M:%S%z'))
+            self.save()
+            return
+
+        baseline = self.baselines.get(name)
+        if baseline is None:
+            raise MissingBaseline('{}: no baseline in {}. Set {}=1 to record one, then commit the file'.format(
+                name, self.path, UPDATE_ENV))
+
+        limit = baseline['median_s'] * (1 + self.threshold)
+        if result['median_s'] > limit:
+            raise PerformanceRegression(
+                '{}: median {} is {:.0%} slower than the baseline {}, more than the threshold of {:.0%}. '
+                'Set {}=1 to record new baselines if that is intended'.format(
+                    name, _format_duration(result['median_s']), result['median_s'] / baseline['median_s'] - 1,
+                    _format_duration(baseline['median_s']), self.threshold, UPDATE_ENV))
+
+
+def http_request(method, path, body=None, headers=None):
+    """
+    A werkzeug request to pass to ``@http`` entrypoints of a ``worker_factory`` worker.
+    """
+    from werkzeug.test import EnvironBuilder
+
+    return EnvironBuilder(method=method, path=path, data=body, headers=headers).get_request()
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class RunningServices:
+    """
+    Entry points into services run by ``running_services``, reusing their clients between calls.
+    """
+
+    def __init__(self, runner, web_address):
+        self.runner = runner
+        self.web_address = web_address
+        self._rpc = None
+        self._dispatch = None
+        self._http = None
+
+    def container(self, service_cls):
+        return next(container for container in self.runner.containers if container.service_cls is service_cls)
+
+    def call(self, service_name, method_name, args=(), kwargs=None):
+        if self._rpc is None:
+            from nameko.standalone.rpc import ClusterRpcClient
+            self._rpc = ClusterRpcClient()
+            self._rpc.start()
+        return self._rpc.client[service_name][method_name](*args, **(kwargs or {}))
+
+    def dispatch(self, service_cls, method_name, source_service, event_type, payload):
+        """
+        Dispatch an event and wait until the ``method_name`` handler of ``service_cls`` handled it.
+        """
+        from nameko.standalone.events import event_dispatcher
+        from nameko.testing.services import entrypoint_waiter
+
+        if self._dispatch is None:
+            self._dispatch = event_dispatcher()
+        with entrypoint_waiter(self.container(service_cls), method_name):
+            self._dispatch(source_service, event_type, payload)
+
+    def request(self, method, path, body=None, headers=None):
+        """
+        Send an HTTP request to the web server of the services and return the status code.
+        """
+        from http.client import HTTPConnection
+
+        if self._http is None:
+            self._http = HTTPConnection(self.web_address)
+        try:
+            self._http.request(method, path, body=body, headers=headers or {})
+            response = self._http.getresponse()
+            response.read()
+        except (OSError, ValueError):
+            self._http.close()
+            self._http = None
+            raise
+        return response.status
+
+    def close(self):
+        if self._rpc is not None:
+            self._rpc.stop()
+        if self._http is not None:
+            self._http.close()
+
+
+@contextmanager
+def running_services(service_classes, config_file=None, replace=()):
+    """
+    Run ``service_classes`` in process on the in-memory transport and yield a ``RunningServices``.
+
+    :Parameters:
+        service_classes : list
+            The service classes to run together, e.g. a caller and the services it calls
+        config_file : str
+            The YAML config of the services, if it exists; ``AMQP_URI`` and
+            ``WEB_SERVER_ADDRESS`` are replaced
+        replace : list
+            Names of dependencies replaced by mocks, e.g. clients of external systems
+    """
+    from eventlet import patcher
+    from nameko import config
+    from nameko.cli.utils.config import load_config
+    from nameko.runners import ServiceRunner
+    from nameko.testing.services import replace_dependencies
+
+    from .chassis.serialization import register_compression
+    from .chassis.transport import register_memory_transport
+
+    if not patcher.is_monkey_patched('socket'):
+        # The services would wait forever on a hub that never runs
+        raise RuntimeError('Services need eventlet monkey patching, run the benchmarks with `nameko test`')
+
+    service_config = {}
+    if config_file and os.path.exists(config_file):
+        with open(config_file, 'rb') as f:
+            service_config = load_config(f) or {}
+    web_address = '127.0.0.1:{}'.format(_free_port())
+    service_config.update({'AMQP_URI': 'memory://', 'WEB_SERVER_ADDRESS': web_address})
+    register_memory_transport()
+    register_compression()
+
+    with config.patch(service_config, clear=True):
+        runner = ServiceRunner()
+        for service_cls in service_classes:
+            runner.add_service(service_cls)
+        for container in runner.containers:
+            names = [dependency.attr_name for dependency in container.dependencies if dependency.attr_name in replace]
+            if names:
+                replace_dependencies(container, *names)
+        runner.start()
+        services = RunningServices(runner, web_address)
+        try:
+            yield services
+        finally:
+            services.close()
+            runner.stop()
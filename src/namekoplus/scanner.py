@@ -0,0 +1,245 @@
+"""
+Static discovery of nameko services, their statsd timers and their instrumentation.
+
+Source files are parsed with ``ast`` instead of being imported, so no class-body
+side effects run and the service dependencies do not need to be installed.
+Results are cached per file and only files whose content changed are parsed again.
+"""
+
+import ast
+import hashlib
+import json
+import os
+
+CACHE_DIR = '.namekoplus_cache'
+CACHE_FILE = 'scan.json'
+CACHE_VERSION = 4
+
+SKIPPED_DIRS = {'__pycache__', 'node_modules', 'venv', 'site-packages', CACHE_DIR}
+
+ENTRYPOINT_DECORATORS = {'rpc', 'event_handler', 'http', 'timer', 'consume', 'batch_event_handler', 'batch_rpc'}
+
+# Suffix of the entrypoint ``namekoplus.chassis.fanout.batch_rpc`` adds next to the method
+BATCH_RPC_SUFFIX = '__batch'
+
+# Factories returning a statsd client, mapped to the positional index of their prefix argument
+STATSD_FACTORIES = {
+    'init_statsd': 0,
+    'init_batched_statsd': 0,
+    'StatsClient': 2,
+    'AggregatingStatsClient': 2,
+}
+
+# Dependency providers sending the stats of ``namekoplus.chassis.instrumentation``
+INSTRUMENTATION_FACTORIES = {'init_instrumentation', 'EntrypointInstrumentation'}
+
+
+def _call_name(node):
+    if isinstance(node, ast.Call):
+        node = node.func
+    if isinstance(node, ast.Name):
+        return node.id
+    if isinstance(node, ast.Attribute):
+        return node.attr
+    return None
+
+
+def _constant(node):
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return node.value
+    return None
+
+
+def _statsd_prefix(call):
+    prefix = None
+    for keyword in call.keywords:
+        if keyword.arg == 'prefix':
+            prefix = _constant(keyword.value)
+    position = STATSD_FACTORIES[_call_name(call)]
+    if prefix is None and len(call.args) > position:
+        prefix = _constant(call.args[position])
+    return prefix
+
+
+def _statsd_clients(body):
+    """
+    Return ``{name: prefix}`` for statsd clients assigned in a module or class body.
+    """
+    clients = {}
+    for node in body:
+        if not isinstance(node, ast.Assign) or not isinstance(node.value, ast.Call):
+            continue
+        if _call_name(node.value) not in STATSD_FACTORIES:
+            continue
+
+        prefix = _statsd_prefix(node.value)
+        for target in node.targets:
+            if isinstance(target, ast.Name):
+                clients[target.id] = prefix
+    return clients
+
+
+def _instrumentation_prefix(call, clients):
+    statsd = call.args[0] if call.args else None
+    for keyword in call.keywords:
+        if keyword.arg == 'statsd':
+            statsd = keyword.value
+    if isinstance(statsd, ast.Name):
+        return clients.get(statsd.id)
+    if isinstance(statsd, ast.Call) and _call_name(statsd) in STATSD_FACTORIES:
+        return _statsd_prefix(statsd)
+    return None
+
+
+def _scan_class(class_node, module_clients):
+    clients = dict(module_clients)
+    clients.update(_statsd_clients(class_node.body))
+
+    service_name = None
+    instrumentation = None
+    timers = []
+    entrypoints = []
+    for node in class_node.body:
+        if isinstance(node, ast.Assign) and any(
+                isinstance(target, ast.Name) and target.id == 'name' for target in node.targets):
+            service_name = _constant(node.value)
+            continue
+        if isinstance(node, ast.Assign) and _call_name(node.value) in INSTRUMENTATION_FACTORIES:
+            instrumentation = {'statsd_prefix': _instrumentation_prefix(node.value, clients)}
+            continue
+        if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            continue
+
+        for decorator in node.decorator_list:
+            func = decorator.func if isinstance(decorator, ast.Call) else decorator
+            if isinstance(func, ast.Attribute) and func.attr == 'timer' \
+                    and isinstance(func.value, ast.Name) and func.value.id in clients \
+                    and isinstance(decorator, ast.Call) and decorator.args:
+                stat_name = _constant(decorator.args[0])
+                if stat_name is not None:
+                    timers.append({
+                        'method': node.name,
+                        'stat_name': stat_name,
+                        'statsd_prefix': clients[func.value.id],
+                    })
+            elif _call_name(func) in ENTRYPOINT_DECORATORS and not (
+                    isinstance(func, ast.Attribute) and isinstance(func.value, ast.Name)
+                    and func.value.id in clients):
+                if _call_name(func) == 'batch_rpc':
+                    # The @rpc of the method is found on its own, batch_rpc adds <method>__batch
+                    entrypoints.append({
+                        'method': node.name + BATCH_RPC_SUFFIX,
+                        'type': 'batch_rpc',
+                        'args': [],
+                        'required_params': ['calls'],
+                    })
+                    continue
+                required = node.args.args[1:len(node.args.args) - len(node.args.defaults)]
+                entrypoints.append({
+                    'method': node.name,
+                    'type': _call_name(func),
+                    # Constant arguments of the decorator, e.g. the source service and event type
+                    'args': [_constant(arg) for arg in decorator.args] if isinstance(decorator, ast.Call) else [],
+                    # Parameters after self without a default
+                    'required_params': [arg.arg for arg in required],
+                })
+
+    return {
+        'class_name': class_node.name,
+        'service_name': service_name,
+        'timers': timers,
+        'entrypoints': entrypoints,
+        'instrumentation': instrumentation,
+    }
+
+
+def scan_source(source, filename='<unknown>'):
+    """
+    Return the classes defined in ``source`` with their service name, statsd timers, entrypoints
+    and instrumentation.
+    """
+    tree = ast.parse(source, filename=filename)
+    module_clients = _statsd_clients(tree.body)
+    return [_scan_class(node, module_clients) for node in tree.body if isinstance(node, ast.ClassDef)]
+
+
+def iter_python_files(paths):
+    for path in paths:
+        if os.path.isfile(path):
+            yield path
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs[:] = sorted(_dir for _dir in dirs if _dir not in SKIPPED_DIRS and not _dir.startswith('.'))
+            for file_ in sorted(files):
+                if file_.endswith('.py'):
+                    yield os.path.join(root, file_)
+
+
+def module_name(file_path, root):
+    relative = os.path.relpath(os.path.abspath(file_path), os.path.abspath(root))
+    parts = os.path.splitext(relative)[0].split(os.sep)
+    if parts[-1] == '__init__':
+        parts = parts[:-1]
+    return '.'.join(parts)
+
+
+def load_cache(cache_path):
+    try:
+        with open(cache_path, encoding='utf-8') as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if cache.get('version') != CACHE_VERSION:
+        return {}
+    return cache.get('files', {})
+
+
+def save_cache(cache_path, files):
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    tmp_path = cache_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'version': CACHE_VERSION, 'files': files}, f)
+    os.replace(tmp_path, cache_path)
+
+
+def scan(paths, root=None, use_cache=True):
+    """
+    Scan every python file under ``paths`` and return a list of discovered classes.
+
+    Each class is a dict with ``module``, ``file``, ``class_name``, ``service_name``,
+    ``timers``, ``entrypoints`` and ``instrumentation`` keys. Files are only parsed again when their size,
+    mtime and then content hash show that they changed since the last scan.
+    """
+    root = root or os.getcwd()
+    cache_path = os.path.join(root, CACHE_DIR, CACHE_FILE)
+    cached_files = load_cache(cache_path) if use_cache else {}
+    scanned_files = {}
+
+    classes = []
+    for file_path in iter_python_files(paths):
+        key = os.path.abspath(file_path)
+        stat = os.stat(file_path)
+        entry = cached_files.get(key)
+
+        if entry is None or entry['mtime_ns'] != stat.st_mtime_ns or entry['size'] != stat.st_size:
+            with open(file_path, 'rb') as f:
+                source = f.read()
+            digest = hashlib.sha1(source).hexdigest()
+            if entry is None or entry['sha1'] != digest:
+                try:
+                    result = scan_source(source, filename=file_path)
+                except (SyntaxError, ValueError):
+                    result = []
+                entry = {'sha1': digest, 'result': result}
+            entry = dict(entry, mtime_ns=stat.st_mtime_ns, size=stat.st_size)
+
+        scanned_files[key] = entry
+        for class_info in entry['result']:
+            classes.append(dict(class_info, module=module_name(file_path, root), file=file_path))
+
+    if use_cache:
+        files = {key: entry for key, entry in cached_files.items() if os.access(key, os.F_OK)}
+        files.update(scanned_files)
+        if files != cached_files:
+            save_cache(cache_path, files)
+    return classes
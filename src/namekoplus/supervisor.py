@@ -0,0 +1,166 @@
+"""
+Run nameko services in several processes.
+
+nameko runs on eventlet in a single process, i.e. on a single core. The supervisor
+starts one ``nameko run`` process per core with the same services and config. The
+processes consume from the same queues, so the broker spreads the work over them.
+
+Every process gets ``NAMEKOPLUS_WORKER_ID`` (0..N-1) and ``NAMEKOPLUS_WORKER_COUNT``
+in its environment, which ``init_prometheus_metrics`` uses to serve its metrics on its
+own port with a ``worker`` label and ``init_batched_statsd`` to tag its stats with
+``worker``.
+"""
+
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import click
+
+WORKER_ID_ENV = 'NAMEKOPLUS_WORKER_ID'
+WORKER_COUNT_ENV = 'NAMEKOPLUS_WORKER_COUNT'
+
+
+class WorkerProcess:
+
+    def __init__(self, worker_id, command, env):
+        self.worker_id = worker_id
+        self.command = command
+        self.env = env
+        self.process = None
+        self.started_at = None
+        self.restart_at = None
+        self.backoff = 0
+
+    @property
+    def pid(self):
+        return self.process.pid if self.process else None
+
+    def start(self):
+        # A session of its own keeps a Ctrl-C in the terminal from reaching the workers
+        # directly, the supervisor forwards it as a graceful SIGTERM
+        self.process = subprocess.Popen(self.command, env=self.env, start_new_session=True)
+        self.started_at = time.monotonic()
+        self.restart_at = None
+
+    def poll(self):
+        return None if self.process is None else self.process.poll()
+
+    def signal(self, signum):
+        if self.process is not None and self.process.poll() is None:
+            self.process.send_signal(signum)
+
+    def wait(self, timeout):
+        try:
+            return self.process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            return None
+
+
+class Supervisor:
+    """
+    Start ``processes`` workers running ``services``, restart the ones that exit and
+    stop them all gracefully on SIGTERM or SIGINT.
+
+    A worker that exits within ``stable_after`` seconds of its start is restarted with an
+    exponential backoff of up to ``max_backoff`` seconds. SIGHUP restarts the workers one
+    after the other, so the others keep serving.
+    """
+
+    def __init__(self, services, config_file=None, processes=None, grace=30, max_backoff=30, stable_after=30):
+        self.processes = processes or os.cpu_count() or 1
+        self.grace = grace
+        self.max_backoff = max_backoff
+        self.stable_after = stable_after
+
+        command = [sys.executable, '-m', 'nameko', 'run']
+        if config_file:
+            command += ['--config', config_file]
+        command += list(services)
+
+        self.workers = []
+        for worker_id in range(self.processes):
+            env = dict(os.environ, **{WORKER_ID_ENV: str(worker_id), WORKER_COUNT_ENV: str(self.processes)})
+            self.workers.append(WorkerProcess(worker_id, command, env))
+
+        self.stopping = False
+        self.reload = False
+
+    def _on_stop(self, signum, frame):
+        self.stopping = True
+
+    def _on_reload(self, signum, frame):
+        self.reload = True
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self._on_stop)
+        signal.signal(signal.SIGINT, self._on_stop)
+        if hasattr(signal, 'SIGHUP'):
+            signal.signal(signal.SIGHUP, self._on_reload)
+
+        for worker in self.workers:
+            worker.start()
+            click.echo(f'Started worker {worker.worker_id} (pid {worker.pid})')
+
+        while not self.stopping:
+            if self.reload:
+                self.reload = False
+                self.rolling_restart()
+            self.supervise()
+            time.sleep(0.2)
+
+        self.shutdown()
+
+    def supervise(self):
+        now = time.monotonic()
+        for worker in self.workers:
+            if worker.restart_at is not None:
+                if now >= worker.restart_at:
+                    worker.start()
+                    click.echo(f'Restarted worker {worker.worker_id} (pid {worker.pid})')
+                continue
+
+            returncode = worker.poll()
+            if returncode is None:
+                continue
+            if now - worker.started_at < self.stable_after:
+                worker.backoff = min(self.max_backoff, worker.backoff * 2 or 1)
+            else:
+                worker.backoff = 0
+            worker.restart_at = now + worker.backoff
+            click.echo(f'Worker {worker.worker_id} exited with code {returncode}, '
+                       f'restarting in {worker.backoff}s', err=True)
+
+    def _stop_worker(self, worker):
+        worker.signal(signal.SIGTERM)
+        if worker.wait(self.grace) is None:
+            click.echo(f'Worker {worker.worker_id} did not stop within {self.grace}s, killing it', err=True)
+            worker.signal(signal.SIGKILL)
+            worker.wait(None)
+
+    def rolling_restart(self):
+        click.echo('Restarting workers one by one')
+        for worker in self.workers:
+            if self.stopping:
+                return
+            self._stop_worker(worker)
+            worker.start()
+            click.echo(f'Restarted worker {worker.worker_id} (pid {worker.pid})')
+
+    def shutdown(self):
+        click.echo(f'Stopping {len(self.workers)} workers, waiting up to {self.grace}s for running workers to finish')
+        # Drain all workers at once, each one finishes the work it already has
+        for worker in self.workers:
+            worker.restart_at = None
+            worker.signal(signal.SIGTERM)
+        deadline = time.monotonic() + self.grace
+        for worker in self.workers:
+            if worker.process is None:
+                continue
+            if worker.wait(max(0, deadline - time.monotonic())) is None:
+                click.echo(f'Worker {worker.worker_id} did not stop within {self.grace}s, killing it', err=True)
+                worker.signal(signal.SIGKILL)
+                worker.wait(None)
+        click.echo('All workers stopped')
@@ -5,25 +5,24 @@ from nameko.rpc import rpc, ServiceRpc
 from nameko.timer import timer
 from nameko.web.handlers import http
 from werkzeug.wrappers import Response
-from nameko_tracer import Tracer
-from namekoplus import init_statsd, init_sentry
+from namekoplus import init_batched_statsd, init_statsd_flusher, init_instrumentation, init_sentry, init_tracer
 
 
 class HttpDemoService:
 
     name = "http_demo_service"
 
-    tracer = Tracer()
+    tracer = init_tracer()
     sentry = init_sentry()
-    statsd = init_statsd('statsd_prefix', 'statsd_host', 'statsd_port')
+    statsd = init_batched_statsd('statsd_prefix', 'statsd_host', 'statsd_port')
+    statsd_flusher = init_statsd_flusher(statsd)
+    instrumentation = init_instrumentation(statsd)
 
     @http("GET", "/broken")
-    @statsd.timer('broken')
     def broken(self, request):
         raise ConnectionRefusedError()
 
     @http('GET', '/books/<string:uuid>')
-    @statsd.timer('demo_get')
     def demo_get(self, request, uuid):
         data = {'id': uuid, 'title': 'The unbearable lightness of being',
                 'author': 'Milan Kundera'}
@@ -31,7 +30,6 @@ class HttpDemoService:
                         mimetype='application/json')
 
     @http('POST', '/books')
-    @statsd.timer('demo_post')
     def demo_post(self, request):
         return Response(json.dumps({'book': request.data.decode()}),
                         mimetype='application/json')
@@ -40,12 +38,13 @@ class RpcResponderDemoService:
 
     name = "rpc_responder_demo_service"
 
-    tracer = Tracer()
+    tracer = init_tracer()
     sentry = init_sentry()
-    statsd = init_statsd('statsd_prefix', 'statsd_host', 'statsd_port')
+    statsd = init_batched_statsd('statsd_prefix', 'statsd_host', 'statsd_port')
+    statsd_flusher = init_statsd_flusher(statsd)
+    instrumentation = init_instrumentation(statsd)
 
     @rpc
-    @statsd.timer('hello')
     def hello(self, name):
         return "Hello, {}!".format(name)
 
@@ -57,10 +56,11 @@ class RpcCallerDemoService:
     remote = ServiceRpc("rpc_responder_demo_service")
 
     sentry = init_sentry()
-    statsd = init_statsd('statsd_prefix', 'statsd_host', 'statsd_port')
+    statsd = init_batched_statsd('statsd_prefix', 'statsd_host', 'statsd_port')
+    statsd_flusher = init_statsd_flusher(statsd)
+    instrumentation = init_instrumentation(statsd)
 
     @rpc
-    @statsd.timer('remote_hello')
     def remote_hello(self, value="John Doe"):
         res = u"{}".format(value)
         return self.remote.hello(res)
@@ -70,14 +70,15 @@ class EventPublisherService:
 
     name = "publisher_service"
 
-    tracer = Tracer()
+    tracer = init_tracer()
     sentry = init_sentry()
-    statsd = init_statsd('statsd_prefix', 'statsd_host', 'statsd_port')
+    statsd = init_batched_statsd('statsd_prefix', 'statsd_host', 'statsd_port')
+    statsd_flusher = init_statsd_flusher(statsd)
+    instrumentation = init_instrumentation(statsd)
 
     dispatch = EventDispatcher()
 
     @rpc
-    @statsd.timer('publish')
     def publish(self, event_type, payload):
         self.dispatch(event_type, payload)
 
@@ -86,12 +87,13 @@ class AnEventListenerService:
 
     name = "an_event_listener_service"
 
-    tracer = Tracer()
+    tracer = init_tracer()
     sentry = init_sentry()
-    statsd = init_statsd('statsd_prefix', 'statsd_host', 'statsd_port')
+    statsd = init_batched_statsd('statsd_prefix', 'statsd_host', 'statsd_port')
+    statsd_flusher = init_statsd_flusher(statsd)
+    instrumentation = init_instrumentation(statsd)
 
     @event_handler("publisher_service", "an_event")
-    @statsd.timer('consume_an_event')
     def consume_an_event(self, payload):
         print("service {} received:".format(self.name), payload)
 
@@ -100,12 +102,13 @@ class AnotherEventListenerService:
 
     name = "another_event_listener_service"
 
-    tracer = Tracer()
+    tracer = init_tracer()
     sentry = init_sentry()
-    statsd = init_statsd('statsd_prefix', 'statsd_host', 'statsd_port')
+    statsd = init_batched_statsd('statsd_prefix', 'statsd_host', 'statsd_port')
+    statsd_flusher = init_statsd_flusher(statsd)
+    instrumentation = init_instrumentation(statsd)
 
     @event_handler("publisher_service", "another_event")
-    @statsd.timer('consume_another_event')
     def consume_another_event(self, payload):
         print("service {} received:".format(self.name), payload)
 
@@ -114,17 +117,17 @@ class ListenBothEventsService:
 
     name = "listen_both_events_service"
 
-    tracer = Tracer()
+    tracer = init_tracer()
     sentry = init_sentry()
-    statsd = init_statsd('statsd_prefix', 'statsd_host', 'statsd_port')
+    statsd = init_batched_statsd('statsd_prefix', 'statsd_host', 'statsd_port')
+    statsd_flusher = init_statsd_flusher(statsd)
+    instrumentation = init_instrumentation(statsd)
 
     @event_handler("publisher_service", "an_event")
-    @statsd.timer('consume_an_event')
     def consume_an_event(self, payload):
         print("service {} received:".format(self.name), payload)
 
     @event_handler("publisher_service", "another_event")
-    @statsd.timer('consume_another_event')
     def consume_another_event(self, payload):
         print("service {} received:".format(self.name), payload)
 
@@ -133,12 +136,13 @@ class Timer:
 
     name = 'timer'
 
-    tracer = Tracer()
+    tracer = init_tracer()
     sentry = init_sentry()
-    statsd = init_statsd('statsd_prefix', 'statsd_host', 'statsd_port')
+    statsd = init_batched_statsd('statsd_prefix', 'statsd_host', 'statsd_port')
+    statsd_flusher = init_statsd_flusher(statsd)
+    instrumentation = init_instrumentation(statsd)
 
     @timer(interval=1)
-    @statsd.timer('ping')
     def ping(self):
         # method executed every second
         print("pong")
@@ -1,21 +1,21 @@
 from nameko.events import EventDispatcher, event_handler
 from nameko.rpc import rpc
-from nameko_tracer import Tracer
-from namekoplus import init_statsd, init_sentry
+from namekoplus import init_batched_statsd, init_statsd_flusher, init_instrumentation, init_sentry, init_tracer
 
 
 class EventPublisherService:
 
     name = "publisher_service"
 
-    tracer = Tracer()
+    tracer = init_tracer()
     sentry = init_sentry()
-    statsd = init_statsd('statsd_prefix', 'statsd_host', 'statsd_port')
+    statsd = init_batched_statsd('statsd_prefix', 'statsd_host', 'statsd_port')
+    statsd_flusher = init_statsd_flusher(statsd)
+    instrumentation = init_instrumentation(statsd)
 
     dispatch = EventDispatcher()
 
     @rpc
-    @statsd.timer('publish')
     def publish(self, event_type, payload):
         self.dispatch(event_type, payload)
 
@@ -24,12 +24,13 @@ class AnEventListenerService:
 
     name = "an_event_listener_service"
 
-    tracer = Tracer()
+    tracer = init_tracer()
     sentry = init_sentry()
-    statsd = init_statsd('statsd_prefix', 'statsd_host', 'statsd_port')
+    statsd = init_batched_statsd('statsd_prefix', 'statsd_host', 'statsd_port')
+    statsd_flusher = init_statsd_flusher(statsd)
+    instrumentation = init_instrumentation(statsd)
 
     @event_handler("publisher_service", "an_event")
-    @statsd.timer('consume_an_event')
     def consume_an_event(self, payload):
         print("service {} received:".format(self.name), payload)
 
@@ -38,12 +39,13 @@ class AnotherEventListenerService:
 
     name = "another_event_listener_service"
 
-    tracer = Tracer()
+    tracer = init_tracer()
     sentry = init_sentry()
-    statsd = init_statsd('statsd_prefix', 'statsd_host', 'statsd_port')
+    statsd = init_batched_statsd('statsd_prefix', 'statsd_host', 'statsd_port')
+    statsd_flusher = init_statsd_flusher(statsd)
+    instrumentation = init_instrumentation(statsd)
 
     @event_handler("publisher_service", "another_event")
-    @statsd.timer('consume_another_event')
     def consume_another_event(self, payload):
         print("service {} received:".format(self.name), payload)
 
@@ -52,16 +54,16 @@ class ListenBothEventsService:
 
     name = "listen_both_events_service"
 
-    tracer = Tracer()
+    tracer = init_tracer()
     sentry = init_sentry()
-    statsd = init_statsd('statsd_prefix', 'statsd_host', 'statsd_port')
+    statsd = init_batched_statsd('statsd_prefix', 'statsd_host', 'statsd_port')
+    statsd_flusher = init_statsd_flusher(statsd)
+    instrumentation = init_instrumentation(statsd)
 
     @event_handler("publisher_service", "an_event")
-    @statsd.timer('consume_an_event')
     def consume_an_event(self, payload):
         print("service {} received:".format(self.name), payload)
 
     @event_handler("publisher_service", "another_event")
-    @statsd.timer('consume_another_event')
     def consume_another_event(self, payload):
         print("service {} received:".format(self.name), payload)
@@ -1,25 +1,24 @@
 import json
 from nameko.web.handlers import http
-from nameko_tracer import Tracer
 from werkzeug.wrappers import Response
-from namekoplus import init_statsd, init_sentry
+from namekoplus import init_batched_statsd, init_statsd_flusher, init_instrumentation, init_sentry, init_tracer
 
 
 class HttpDemoService:
 
     name = "http_demo_service"
 
-    tracer = Tracer()
+    tracer = init_tracer()
     sentry = init_sentry()
-    statsd = init_statsd('statsd_prefix', 'statsd_host', 'statsd_port')
+    statsd = init_batched_statsd('statsd_prefix', 'statsd_host', 'statsd_port')
+    statsd_flusher = init_statsd_flusher(statsd)
+    instrumentation = init_instrumentation(statsd)
 
     @http("GET", "/broken")
-    @statsd.timer('broken')
     def broken(self, request):
         raise ConnectionRefusedError()
 
     @http('GET', '/books/<string:uuid>')
-    @statsd.timer('demo_get')
     def demo_get(self, request, uuid):
         data = {'id': uuid, 'title': 'The unbearable lightness of being',
                 'author': 'Milan Kundera'}
@@ -27,7 +26,6 @@ class HttpDemoService:
                         mimetype='application/json')
 
     @http('POST', '/books')
-    @statsd.timer('demo_post')
     def demo_post(self, request):
         return Response(json.dumps({'book': request.data.decode()}),
                         mimetype='application/json')
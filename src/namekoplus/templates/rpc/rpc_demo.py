@@ -1,17 +1,17 @@
 from nameko.rpc import rpc, ServiceRpc
-from nameko_tracer import Tracer
-from namekoplus import init_statsd, init_sentry
+from namekoplus import init_batched_statsd, init_statsd_flusher, init_instrumentation, init_sentry, init_tracer
 
 
 class RpcResponderDemoService:
     name = "rpc_responder_demo_service"
 
-    tracer = Tracer()
+    tracer = init_tracer()
     sentry = init_sentry()
-    statsd = init_statsd('statsd_prefix', 'statsd_host', 'statsd_port')
+    statsd = init_batched_statsd('statsd_prefix', 'statsd_host', 'statsd_port')
+    statsd_flusher = init_statsd_flusher(statsd)
+    instrumentation = init_instrumentation(statsd)
 
     @rpc
-    @statsd.timer('hello')
     def hello(self, name):
         return "Hello, {}!".format(name)
 
@@ -22,10 +22,11 @@ class RpcCallerDemoService:
     remote = ServiceRpc("rpc_responder_demo_service")
 
     sentry = init_sentry()
-    statsd = init_statsd('statsd_prefix', 'statsd_host', 'statsd_port')
+    statsd = init_batched_statsd('statsd_prefix', 'statsd_host', 'statsd_port')
+    statsd_flusher = init_statsd_flusher(statsd)
+    instrumentation = init_instrumentation(statsd)
 
     @rpc
-    @statsd.timer('remote_hello')
     def remote_hello(self, value="John Doe"):
         res = u"{}".format(value)
         return self.remote.hello(res)
@@ -1,18 +1,18 @@
 from nameko.timer import timer
-from nameko_tracer import Tracer
-from namekoplus import init_statsd, init_sentry
+from namekoplus import init_batched_statsd, init_statsd_flusher, init_instrumentation, init_sentry, init_tracer
 
 
 class Timer:
 
     name = 'timer'
 
-    tracer = Tracer()
+    tracer = init_tracer()
     sentry = init_sentry()
-    statsd = init_statsd('statsd_prefix', 'statsd_host', 'statsd_port')
+    statsd = init_batched_statsd('statsd_prefix', 'statsd_host', 'statsd_port')
+    statsd_flusher = init_statsd_flusher(statsd)
+    instrumentation = init_instrumentation(statsd)
 
     @timer(interval=1)
-    @statsd.timer('ping')
     def ping(self):
         # method executed every second
         print("pong")
\ No newline at end of file
@@ -0,0 +1,93 @@
+"""
+Benchmarks of the entrypoints of ${module}, generated by `namekoplus test-gen -t bench`.
+
+The micro benchmarks call the entrypoint methods of a worker_factory worker, whose dependencies
+are mocks, so they time the service logic alone. The end-to-end benchmarks run the services in
+process on the in-memory transport and go through serialization, the worker pool and the web
+server, without RabbitMQ.
+
+Every median is compared with the one in bench_baselines.json and the benchmark fails when it
+got slower by more than 25%, or NAMEKOPLUS_BENCH_THRESHOLD, or has no baseline. Run with
+NAMEKOPLUS_BENCH_UPDATE=1 to record the baselines, the first time and after an intended change,
+on the machine the benchmarks run on in CI, and commit the file.
+
+Run them with `nameko test ${file_name}`, which applies the eventlet monkey patching.
+"""
+
+import os
+
+import pytest
+from nameko.testing.services import worker_factory
+
+from namekoplus.regression import Baselines, http_request, measure, running_services
+from ${import_path} import (
+% for class_name in class_names:
+    ${class_name},
+% endfor
+)
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+baselines = Baselines(os.path.join(HERE, 'bench_baselines.json'))
+
+# Run together in the end-to-end benchmarks, so calls between them are served
+SERVICES = [
+% for class_name in class_names:
+    ${class_name},
+% endfor
+]
+
+# The config of the end-to-end benchmarks, with AMQP_URI and WEB_SERVER_ADDRESS replaced
+CONFIG_FILE = os.path.join(HERE, 'config.yml')
+
+# Dependencies replaced by mocks in the end-to-end benchmarks, e.g. clients of external systems
+REPLACED_DEPENDENCIES = []
+
+# Example arguments, payloads and requests per entrypoint, derived from its signature and decorator:
+# rpc arguments are the parameter names, event payloads are empty and paths have the route variables
+# filled in. A benchmark is only as representative as its call, so set them to what production sends
+# before recording the baselines
+CALLS = {
+% for case in cases:
+    '${case['key']}': ${case['call']},
+% endfor
+}
+
+
+@pytest.fixture(scope='module')
+def services():
+    with running_services(SERVICES, config_file=CONFIG_FILE, replace=REPLACED_DEPENDENCIES) as running:
+        yield running
+% for case in cases:
+
+
+def test_${case['name']}_micro():
+    service = worker_factory(${case['class_name']})
+    call = CALLS['${case['key']}']
+    % if case['type'] == 'rpc':
+    result = measure(lambda: service.${case['method']}(*call['args'], **call['kwargs']))
+    % elif case['type'] == 'event_handler':
+    result = measure(lambda: service.${case['method']}(call['payload']))
+    % else:
+    result = measure(lambda: service.${case['method']}(
+        http_request(call['method'], call['path'], call['body']), **call['kwargs']))
+    % endif
+    baselines.check('micro ${case['key']}', result)
+
+
+def test_${case['name']}_e2e(services):
+    call = CALLS['${case['key']}']
+    % if case['type'] == 'rpc':
+    result = measure(lambda: services.call(
+        ${case['class_name']}.name, '${case['method']}', call['args'], call['kwargs']))
+    % elif case['type'] == 'event_handler':
+    if call['source_service'] is None or call['event_type'] is None:
+        # A dispatch to an unknown event would wait forever for the handler
+        pytest.skip('Set the source_service and event_type of ${case['key']} in CALLS')
+    result = measure(lambda: services.dispatch(
+        ${case['class_name']}, '${case['method']}', call['source_service'], call['event_type'], call['payload']))
+    % else:
+    result = measure(lambda: services.request(call['method'], call['path'], call['body']))
+    % endif
+    baselines.check('e2e ${case['key']}', result)
+% endfor
@@ -0,0 +1,18 @@
+# Services run on eventlet, so patch before anything imports socket or threading
+import eventlet
+eventlet.monkey_patch()  # noqa: E402
+
+import pytest  # noqa: E402
+from nameko import config  # noqa: E402
+
+from namekoplus import register_memory_transport  # noqa: E402
+
+
+@pytest.fixture
+def memory_broker():
+    """
+    Run the services of a test on the in-memory transport instead of RabbitMQ.
+    """
+    register_memory_transport()
+    with config.patch({'AMQP_URI': 'memory://'}, clear=True):
+        yield
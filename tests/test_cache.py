@@ -0,0 +1,198 @@
+import eventlet
+import pytest
+from nameko.rpc import rpc
+from nameko.testing.services import entrypoint_hook
+
+from namekoplus.chassis.cache import CachedClient, CallContextData, ResponseCache, cached_rpc, make_key
+
+
+@pytest.fixture
+def cache():
+    return ResponseCache('test', maxsize=2, ttl=None)
+
+
+def test_hits_and_misses(cache):
+    calls = []
+
+    def compute(value):
+        calls.append(value)
+        return value * 2
+
+    assert cache.get_or_call('a', compute, 1) == 2
+    assert cache.get_or_call('a', compute, 1) == 2
+    assert calls == [1]
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_lru_eviction(cache):
+    cache.get_or_call('a', lambda: 1)
+    cache.get_or_call('b', lambda: 2)
+    cache.get_or_call('a', lambda: 1)
+    cache.get_or_call('c', lambda: 3)
+
+    assert cache.evictions == 1
+    assert cache.get_or_call('b', lambda: 'recomputed') == 'recomputed'
+    assert len(cache) == 2
+
+
+def test_ttl_expiry():
+    cache = ResponseCache('test', ttl=0.05)
+
+    cache.get_or_call('a', lambda: 'first')
+    assert cache.get_or_call('a', lambda: 'second') == 'first'
+    eventlet.sleep(0.1)
+    assert cache.get_or_call('a', lambda: 'second') == 'second'
+
+
+def test_errors_are_not_cached(cache):
+    def fail():
+        raise ValueError('boom')
+
+    with pytest.raises(ValueError):
+        cache.get_or_call('a', fail)
+    assert cache.get_or_call('a', lambda: 'ok') == 'ok'
+
+
+def test_callers_get_copies(cache):
+    first = cache.get_or_call('a', lambda: {'items': [1]})
+    first['items'].append(2)
+    second = cache.get_or_call('a', lambda: None)
+    second['items'].append(3)
+
+    assert cache.get_or_call('a', lambda: None) == {'items': [1]}
+
+
+def test_copies_can_be_turned_off():
+    cache = ResponseCache('test', copy=False)
+    value = cache.get_or_call('a', lambda: [1])
+    assert cache.get_or_call('a', lambda: None) is value
+
+
+def test_concurrent_misses_are_coalesced(cache):
+    calls = []
+
+    def compute():
+        calls.append(1)
+        eventlet.sleep(0.01)
+        return 'value'
+
+    pool = eventlet.GreenPool()
+    results = list(pool.imap(lambda _: cache.get_or_call('a', compute), range(5)))
+
+    assert results == ['value'] * 5
+    assert len(calls) == 1
+    assert (cache.hits, cache.misses) == (4, 1)
+
+
+def test_waiters_get_the_error_of_the_call_in_flight(cache):
+    def fail():
+        eventlet.sleep(0.01)
+        raise ValueError('boom')
+
+    def call(_):
+        try:
+            return cache.get_or_call('a', fail)
+        except ValueError as exc:
+            return exc
+
+    results = list(eventlet.GreenPool().imap(call, range(3)))
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+def test_make_key_ignores_dict_order():
+    assert make_key((1,), {'a': 1, 'b': 2}) == make_key((1,), {'b': 2, 'a': 1})
+
+
+class BookService:
+    name = 'books'
+
+    context_data = CallContextData()
+
+    calls = []
+
+    @rpc
+    @cached_rpc(ttl=None)
+    def get_book(self, book_id):
+        self.calls.append(book_id)
+        return {'id': book_id}
+
+    @rpc
+    def get_book_in_thread(self, book_id):
+        return eventlet.spawn(self.get_book, book_id).wait()
+
+
+def test_cached_rpc_keys_on_context_data(memory_broker, container_factory):
+    container = container_factory(BookService)
+    container.start()
+
+    with entrypoint_hook(container, 'get_book', context_data={'language': 'en'}) as get_book:
+        assert get_book(1) == {'id': 1}
+        get_book(1)
+    with entrypoint_hook(container, 'get_book', context_data={'language': 'fr'}) as get_book:
+        get_book(1)
+    with entrypoint_hook(container, 'get_book', context_data={'language': 'fr', 'call_id_stack': ['x']}) as get_book:
+        get_book(1)
+
+    assert BookService.calls == [1, 1]
+
+
+def test_cached_rpc_keys_on_the_context_data_in_spawned_greenthreads(memory_broker, container_factory):
+    BookService.calls = []
+    container = container_factory(BookService)
+    container.start()
+
+    with entrypoint_hook(container, 'get_book_in_thread', context_data={'language': 'de'}) as get_book_in_thread:
+        get_book_in_thread(2)
+    with entrypoint_hook(container, 'get_book', context_data={'language': 'de'}) as get_book:
+        get_book(2)
+    with entrypoint_hook(container, 'get_book', context_data={'language': 'en'}) as get_book:
+        get_book(2)
+
+    assert BookService.calls == [2, 2]
+
+
+class UncontextualService:
+    name = 'uncontextual'
+
+    @rpc
+    @cached_rpc()
+    def get_book(self, book_id):
+        return {'id': book_id}
+
+    @rpc
+    @cached_rpc(context_keys=())
+    def get_author(self, author_id):
+        return {'id': author_id}
+
+
+def test_cached_rpc_needs_the_context_data_dependency_to_key_on_it():
+    service = UncontextualService()
+
+    with pytest.raises(TypeError, match='UncontextualService has no CallContextData dependency'):
+        service.get_book(1)
+    assert service.get_author(1) == {'id': 1}
+
+
+class FakeServiceRpc:
+    def __init__(self):
+        self.calls = []
+
+    def __getattr__(self, name):
+        def call(*args, **kwargs):
+            self.calls.append((name, args))
+            return {'name': name, 'args': list(args)}
+        call.call_async = None
+        return call
+
+
+def test_cached_client_keys_on_methods_and_context():
+    client, cache = FakeServiceRpc(), ResponseCache('test')
+
+    english = CachedClient(client, cache, {'get_book'}, context=['en'])
+    english.get_book(1)
+    english.get_book(1)
+    CachedClient(client, cache, {'get_book'}, context=['fr']).get_book(1)
+    english.create_book(1)
+    english.create_book(1)
+
+    assert client.calls == [('get_book', (1,)), ('get_book', (1,)), ('create_book', (1,)), ('create_book', (1,))]
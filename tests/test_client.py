@@ -0,0 +1,116 @@
+import asyncio
+
+import eventlet
+import pytest
+from nameko.exceptions import RemoteError, RpcTimeout
+from nameko.rpc import rpc
+
+from namekoplus.chassis.client import PoolExhausted, PooledRpcClient, RpcClientPool
+
+
+class EchoService:
+    name = 'echo'
+
+    @rpc
+    def echo(self, value):
+        return value
+
+    @rpc
+    def slow(self, seconds):
+        eventlet.sleep(seconds)
+        return seconds
+
+    @rpc
+    def fail(self):
+        raise ValueError('boom')
+
+
+class FakeStatsd:
+    def __init__(self):
+        self.gauges = {}
+        self.counters = {}
+
+    def gauge(self, stat, value):
+        self.gauges[stat] = value
+
+    def timing(self, stat, value):
+        pass
+
+    def incr(self, stat, count=1):
+        self.counters[stat] = self.counters.get(stat, 0) + count
+
+
+@pytest.fixture
+def echo_service(memory_broker, container_factory):
+    container = container_factory(EchoService)
+    container.start()
+    return container
+
+
+@pytest.fixture
+def pool(echo_service):
+    pool = RpcClientPool(size=2, timeout=5, acquire_timeout=1, statsd=FakeStatsd())
+    yield pool
+    pool.close()
+
+
+def test_pooled_client_keeps_its_reply_connection(echo_service):
+    client = PooledRpcClient(timeout=5)
+    proxy = client.start()
+    try:
+        assert proxy.echo.echo('a') == 'a'
+        connection = client.reply_listener.connection
+        assert proxy.echo.echo('b') == 'b'
+        assert client.reply_listener.connection is connection
+    finally:
+        client.stop()
+
+
+def test_reuses_clients(pool):
+    assert pool.echo.echo('Jane') == 'Jane'
+    assert pool.call('echo', 'echo', args=('John',)) == 'John'
+    assert pool['echo'].echo(value=1) == 1
+
+    assert pool.stats() == {'size': 2, 'in_use': 0, 'idle': 1, 'waiting': 0, 'utilization': 0.0}
+
+
+def test_bounds_the_calls_in_flight(pool):
+    calls = [eventlet.spawn(pool.echo.slow, 0.2) for _ in range(2)]
+    eventlet.sleep(0.05)
+    assert pool.stats()['in_use'] == 2
+    assert pool.statsd.gauges['rpc_pool.default.utilization'] == 1.0
+
+    pool.acquire_timeout = 0.05
+    with pytest.raises(PoolExhausted):
+        pool.echo.echo('late')
+
+    assert [call.wait() for call in calls] == [0.2, 0.2]
+    assert pool.stats()['idle'] == 2
+
+
+def test_keeps_clients_after_failed_calls(pool):
+    with pytest.raises(RemoteError) as exc_info:
+        pool.echo.fail()
+    assert exc_info.value.exc_type == 'ValueError'
+
+    with pytest.raises(RpcTimeout):
+        pool.call('echo', 'slow', args=(1,), timeout=0.05)
+    assert pool.statsd.counters['rpc_pool.default.timeouts'] == 1
+
+    assert pool.stats()['idle'] == 1
+    # The late reply of the timed out call is ignored
+    eventlet.sleep(1)
+    assert pool.echo.echo('after') == 'after'
+
+
+def test_acall(pool):
+    assert asyncio.run(pool.acall('echo', 'echo', args=('async',))) == 'async'
+
+
+def test_closed_pool_refuses_calls(pool):
+    pool.echo.echo('a')
+    pool.close()
+
+    assert pool.stats()['idle'] == 0
+    with pytest.raises(RuntimeError):
+        pool.echo.echo('b')
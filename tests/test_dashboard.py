@@ -0,0 +1,112 @@
+import pytest
+
+from namekoplus.dashboard import (
+    GRID_WIDTH, Layout, Queries, SERVICE_SELECTOR, build_panels, grafana_targets, latency_configs, timeseries,
+    variables
+)
+
+
+def titles(panels):
+    return [panel['title'] for panel in panels]
+
+
+def panel(panels, title, panel_type='timeseries'):
+    return next(panel for panel in panels if panel['title'] == title and panel['type'] == panel_type)
+
+
+def test_layout_wraps_panels_into_lines():
+    layout = Layout()
+    layout.row('Row')
+    for height in (4, 8, 4):
+        layout.add(timeseries('panel', []), width=10, height=height)
+
+    positions = [panel['gridPos'] for panel in layout.panels]
+    assert positions == [
+        {'h': 1, 'w': GRID_WIDTH, 'x': 0, 'y': 0},
+        {'h': 4, 'w': 10, 'x': 0, 'y': 1},
+        {'h': 8, 'w': 10, 'x': 10, 'y': 1},
+        # The line is as high as its highest panel
+        {'h': 4, 'w': 10, 'x': 0, 'y': 9},
+    ]
+    assert [panel['id'] for panel in layout.panels] == [1, 2, 3, 4]
+
+
+@pytest.mark.parametrize('mode', ['statsd', 'direct'])
+def test_panels_fit_the_grid_without_overlapping(mode):
+    panels = build_panels(Queries(mode))
+
+    cells = set()
+    for panel in panels:
+        position = panel['gridPos']
+        assert position['x'] + position['w'] <= GRID_WIDTH
+        panel_cells = {(x, y) for x in range(position['x'], position['x'] + position['w'])
+                       for y in range(position['y'], position['y'] + position['h'])}
+        assert not cells & panel_cells, panel['title']
+        cells |= panel_cells
+    assert len({panel['id'] for panel in panels}) == len(panels)
+
+
+def test_statsd_panels():
+    panels = build_panels(Queries('statsd'))
+
+    assert [panel['title'] for panel in panels if panel['type'] == 'row'] == ['Fleet', 'Service $service']
+    assert 'Payload throughput' in titles(panels)
+    lag = panel(panels, 'Consumer lag')
+    assert [target['legendFormat'] for target in lag['targets']] == [
+        'backlog / request rate', 'broker wait p50', 'broker wait p99']
+    assert 'namekoplus_entrypoint_broker_wait' in lag['targets'][1]['expr']
+    assert panel(panels, 'Error ratio by service')['targets'][0]['expr'].startswith(
+        '(sum by (service) (rate(namekoplus_entrypoint_errors[1m]))')
+
+
+def test_direct_panels():
+    panels = build_panels(Queries('direct'))
+
+    assert 'Payload throughput' not in titles(panels)
+    assert len(panel(panels, 'Consumer lag')['targets']) == 1
+    assert 'outcome="error"' in panel(panels, 'Errors by entrypoint')['targets'][0]['expr']
+
+
+def test_latency_of_summaries_and_histograms():
+    summary = Queries('statsd').latency(0.99, SERVICE_SELECTOR, by='entrypoint')
+    assert summary == ('max by (entrypoint) (namekoplus_entrypoint_handler'
+                       '{service=~"$service", instance=~"$instance", quantile="0.99"})')
+
+    histogram = Queries('statsd', observer_type='histogram').latency(0.5, by='')
+    assert histogram == 'histogram_quantile(0.5, sum by (le) (rate(namekoplus_entrypoint_handler_bucket[1m])))'
+
+
+def test_stat_rows():
+    configs = latency_configs([
+        {'stat_name': 'custom_timer', 'metric_type': 'timer'},
+        {'stat_name': 'handler', 'metric_name': 'namekoplus_entrypoint_handler'},
+        {'stat_name': 'calls', 'metric_name': 'namekoplus_entrypoint_calls'},
+        {'stat_name': 'counter', 'metric_type': 'counter'},
+    ])
+    assert [config['stat_name'] for config in configs] == ['custom_timer', 'handler']
+
+    configs = [dict(config, targets=[{'expr': 'expr', 'legend': 'p99'}]) for config in configs]
+    panels = build_panels(Queries('statsd'), capacity=False, stat_configs=configs)
+    assert titles(panels) == ['Latency by stat', 'custom_timer', 'handler']
+    assert panels[1]['targets'][0]['expr'] == 'expr'
+
+
+def test_service_variable_defaults_to_the_service():
+    service, instance = variables(Queries('direct'), 'greeting_service')[1:]
+
+    assert service['current']['value'] == ['greeting_service']
+    assert service['query']['query'] == 'label_values(namekoplus_entrypoint_duration_seconds_count, service)'
+    assert instance['query']['query'] == (
+        'label_values(namekoplus_entrypoint_duration_seconds_count{service=~"$service"}, instance)')
+
+
+def test_grafana_targets():
+    summary = grafana_targets({'stat_name': 'handler', 'metric_name': 'namekoplus_entrypoint_handler',
+                               'labels': {'service': 'books', 'entrypoint': 'get'}}, 'statsd')
+    assert summary == [{'expr': 'namekoplus_entrypoint_handler{service="books", entrypoint="get"}',
+                        'legend': 'handler {{quantile}}'}]
+
+    histogram = grafana_targets({'stat_name': 'get', 'service_name': 'books'}, 'direct')
+    assert [target['legend'] for target in histogram] == ['get p50', 'get p90', 'get p95', 'get p99']
+    assert histogram[-1]['expr'] == ('histogram_quantile(0.99, sum by (le) (rate(namekoplus_entrypoint_duration_seconds'
+                                     '_bucket{service="books", entrypoint="get"}[1m])))')
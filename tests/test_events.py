@@ -0,0 +1,251 @@
+import pytest
+from nameko.events import event_handler
+from nameko.rpc import rpc
+from nameko.testing.services import entrypoint_hook, entrypoint_waiter
+
+from namekoplus.chassis.events import (
+    BATCH_SIZE_HEADER, BatchEventHandler, BatchFailure, BatchingEventDispatcher, ConfirmTimeout, _Confirms
+)
+
+
+class PublisherService:
+    name = 'publisher'
+
+    dispatch = BatchingEventDispatcher(max_batch=100, flush_interval=60)
+
+    @rpc
+    def publish(self, event_type, payloads):
+        for payload in payloads:
+            self.dispatch(event_type, payload)
+
+
+class ConsumerService:
+    name = 'consumer'
+
+    received = []
+
+    @event_handler('publisher', 'created')
+    def on_created(self, payload):
+        self.received.append(payload)
+
+
+@pytest.fixture
+def publisher(memory_broker, container_factory):
+    container = container_factory(PublisherService)
+    container.start()
+    return container
+
+
+@pytest.fixture
+def consumer(memory_broker, container_factory):
+    ConsumerService.received = []
+    container = container_factory(ConsumerService)
+    container.start()
+    return container
+
+
+def dispatcher(container):
+    return next(dependency for dependency in container.dependencies if isinstance(dependency, BatchingEventDispatcher))
+
+
+def buffered(dispatcher):
+    return [(event_type, data) for event_type, events in dispatcher.buffer.items() for data, _ in events]
+
+
+def test_events_are_published_when_the_worker_ends(publisher, consumer):
+    with entrypoint_waiter(consumer, 'on_created', callback=lambda *args: len(ConsumerService.received) == 3):
+        with entrypoint_hook(publisher, 'publish') as publish:
+            publish('created', [1, 2, 3])
+
+    assert ConsumerService.received == [1, 2, 3]
+    assert dispatcher(publisher).buffered == 0
+
+
+def test_packed_events_carry_their_count():
+    dispatch = BatchingEventDispatcher(pack=True)
+    dispatch.buffer['created'] = [(1, {'call_id_stack': ['a']}), (2, {'call_id_stack': ['b']})]
+
+    assert dispatch._take() == [('created', [1, 2], {'call_id_stack': ['a'], BATCH_SIZE_HEADER: 2})]
+
+
+def test_failed_flush_puts_undelivered_events_back_in_front(publisher, monkeypatch):
+    dispatch = dispatcher(publisher)
+    dispatch._connect()
+    publish = dispatch.producer.publish
+    published = []
+
+    def fail_on_the_third(payload, **kwargs):
+        if len(published) == 2:
+            raise ConfirmTimeout('not confirmed')
+        published.append(payload)
+        publish(payload, **kwargs)
+
+    monkeypatch.setattr(dispatch.producer, 'publish', fail_on_the_third)
+    for payload in (1, 2, 3, 4):
+        dispatch.buffer.setdefault('created', []).append((payload, {}))
+        dispatch.buffered += 1
+
+    with pytest.raises(ConfirmTimeout):
+        dispatch.flush()
+    dispatch.buffer['created'].append((5, {}))
+    dispatch.buffered += 1
+
+    assert published == [1, 2]
+    assert buffered(dispatch) == [('created', 3), ('created', 4), ('created', 5)]
+    assert dispatch.buffered == 3
+    assert dispatch.oldest is not None
+
+
+def test_failed_flush_of_packed_events_unpacks_them(publisher):
+    dispatch = dispatcher(publisher)
+    dispatch.pack = True
+    dispatch._put_back([('created', [1, 2], {BATCH_SIZE_HEADER: 2, 'call_id_stack': ['a']})], front=True)
+
+    assert buffered(dispatch) == [('created', 1), ('created', 2)]
+    assert dispatch.buffer['created'][0][1] == {'call_id_stack': ['a']}
+
+
+class UnconfirmedChannel:
+    def __init__(self):
+        self.events = {'basic_ack': set(), 'basic_nack': set()}
+
+    def confirm_select(self):
+        pass
+
+
+def test_unconfirmed_events_go_back_on_confirm_timeout(publisher):
+    dispatch = dispatcher(publisher)
+    dispatch.confirm_timeout = 0
+    dispatch._connect()
+    # The broker never confirms them
+    dispatch._confirms = _Confirms(UnconfirmedChannel())
+    for payload in (1, 2):
+        dispatch.buffer.setdefault('created', []).append((payload, {}))
+        dispatch.buffered += 1
+
+    with pytest.raises(ConfirmTimeout):
+        dispatch.flush()
+
+    assert buffered(dispatch) == [('created', 1), ('created', 2)]
+
+
+class Message:
+    def __init__(self, name, packed=0):
+        self.name = name
+        self.headers = {BATCH_SIZE_HEADER: packed} if packed else {}
+
+    def __repr__(self):
+        return self.name
+
+
+class FakeConsumer:
+    def __init__(self):
+        self.acked = []
+        self.requeued = []
+
+    def ack_message(self, message):
+        self.acked.append(message.name)
+
+    def requeue_message(self, message):
+        self.requeued.append(message.name)
+
+
+class FakeContainer:
+    service_name = 'consumer'
+
+    def __init__(self):
+        self.workers = []
+
+    def spawn_managed_thread(self, fn, identifier=None):
+        fn()
+
+    def spawn_worker(self, entrypoint, args, kwargs, context_data=None, handle_result=None):
+        self.workers.append((args[0], handle_result))
+
+
+@pytest.fixture
+def handler():
+    handler = BatchEventHandler('publisher', 'created', max_batch=3, max_wait=60, requeue_on_error=True)
+    handler.container = FakeContainer()
+    handler.consumer = FakeConsumer()
+    handler.method_name = 'on_created'
+    return handler
+
+
+def finish(handler, exc=None):
+    payloads, handle_result = handler.container.workers.pop(0)
+    handle_result(None, None, None if exc is None else (type(exc), exc, None))
+    return payloads
+
+
+def test_batch_is_handed_to_a_worker_when_full(handler):
+    handler.handle_message(1, Message('a'))
+    handler.handle_message(2, Message('b'))
+    assert handler.container.workers == []
+
+    handler.handle_message(3, Message('c'))
+    assert finish(handler) == [1, 2, 3]
+    assert handler.consumer.acked == ['a', 'b', 'c']
+
+
+def test_partial_batch_is_flushed_after_max_wait(handler):
+    handler.handle_message(1, Message('a'))
+    handler._dispatch()
+
+    assert finish(handler) == [1]
+
+
+def test_packed_payloads_count_towards_max_batch(handler):
+    handler.handle_message([1, 2], Message('a', packed=2))
+    handler.handle_message([3, 4, 5, 6], Message('b', packed=4))
+
+    assert finish(handler) == [1, 2, 3]
+    # b still has payloads waiting for the next batch
+    assert handler.consumer.acked == ['a']
+    assert handler.pending_payloads == 3
+
+    handler.handle_message(7, Message('c'))
+    assert finish(handler) == [4, 5, 6]
+    assert handler.consumer.acked == ['a', 'b']
+    handler._dispatch()
+    assert finish(handler) == [7]
+
+
+def test_message_split_across_batches_is_requeued_when_one_fails(handler):
+    handler.handle_message([1, 2, 3, 4], Message('a', packed=4))
+    handler._dispatch()
+
+    finish(handler, exc=ValueError())
+    finish(handler)
+    assert handler.consumer.requeued == ['a']
+    assert handler.consumer.acked == []
+
+
+def test_batch_failure_requeues_only_the_failed_messages(handler):
+    for payload, name in ((1, 'a'), (2, 'b'), (3, 'c')):
+        handler.handle_message(payload, Message(name))
+
+    finish(handler, exc=BatchFailure([1]))
+    assert handler.consumer.requeued == ['b']
+    assert handler.consumer.acked == ['a', 'c']
+
+
+def test_failed_batch_is_acked_without_requeue_on_error(handler):
+    handler.requeue_on_error = False
+    handler.handle_message([1, 2, 3], Message('a', packed=3))
+
+    finish(handler, exc=ValueError())
+    assert handler.consumer.acked == ['a']
+
+
+def test_stop_requeues_pending_messages(handler):
+    handler.consumer.stop = lambda: None
+    handler.handle_message([1, 2, 3, 4], Message('a', packed=4))
+    handler.handle_message(5, Message('b'))
+    handler.stop()
+
+    assert handler.consumer.requeued == ['b']
+    # a is requeued once the worker handling part of it ends
+    finish(handler)
+    assert handler.consumer.requeued == ['b', 'a']
+    assert handler.consumer.acked == []
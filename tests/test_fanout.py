@@ -0,0 +1,142 @@
+import eventlet
+import pytest
+from nameko.exceptions import RemoteError, serialize
+from nameko.rpc import rpc
+
+from namekoplus.chassis.fanout import DeadlineExceeded, FanoutClient, batch_rpc
+
+
+class FakeCall:
+    def __init__(self, client, method_name, args):
+        self.client = client
+        self.correlation_id = '{}-{}'.format(method_name, args)
+        self.method_name = method_name
+        self.args = args
+        client.listener.pending[self.correlation_id] = self
+
+    def result(self):
+        self.client.in_flight += 1
+        self.client.max_in_flight = max(self.client.max_in_flight, self.client.in_flight)
+        try:
+            eventlet.sleep(self.client.delays.get(self.args[0], 0) if self.method_name == 'double' else 0)
+        finally:
+            self.client.in_flight -= 1
+        if self.method_name == 'fail':
+            raise ValueError(self.args[0])
+        if self.method_name == 'double__batch':
+            return [{'result': args[0] * 2, 'error': None} if args[0] >= 0 else
+                    {'result': None, 'error': serialize(ValueError(args[0]))}
+                    for args, kwargs in self.args[0]]
+        return self.args[0] * 2
+
+
+class FakeMethod:
+    def __init__(self, client, name):
+        self.client = client
+        self.name = name
+
+    def call_async(self, *args, **kwargs):
+        self.client.calls.append((self.name, args))
+        return FakeCall(self.client, self.name, args)
+
+
+class FakeServiceRpc:
+    def __init__(self, listener, delays=None):
+        self.listener = listener
+        self.delays = delays or {}
+        self.calls = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def __getattr__(self, name):
+        return FakeMethod(self, name)
+
+
+class FakeReplyListener:
+    def __init__(self):
+        self.pending = {}
+
+
+@pytest.fixture
+def listener():
+    return FakeReplyListener()
+
+
+def fanout(listener, delays=None, concurrency=10, timeout=None):
+    return FanoutClient(FakeServiceRpc(listener, delays), listener, concurrency, timeout)
+
+
+def test_map_keeps_the_order_of_items(listener):
+    client = fanout(listener, delays={1: 0.02, 2: 0.01})
+    result = client.map('double', [1, 2, 3])
+
+    assert result.ok
+    assert list(result) == [2, 4, 6]
+
+
+def test_gather_collects_errors_per_call(listener):
+    client = fanout(listener)
+    result = client.gather([('double', (1,), {}), ('fail', ('boom',), None), ('double', (3,), {})])
+
+    assert not result.ok
+    assert result.results == [2, None, 6]
+    assert isinstance(result.errors[1], ValueError)
+    with pytest.raises(ValueError):
+        result.raise_for_errors()
+
+
+def test_concurrency_bounds_calls_in_flight(listener):
+    client = fanout(listener, delays={item: 0.01 for item in range(10)}, concurrency=3)
+    client.map('double', range(10))
+
+    assert client._client.max_in_flight == 3
+
+
+def test_deadline_is_shared_by_all_calls(listener):
+    client = fanout(listener, delays={1: 0.01, 2: 0.5, 3: 0.5}, concurrency=1)
+    started_at = eventlet.hubs.get_hub().clock()
+    result = client.map('double', [1, 2, 3], timeout=0.1)
+    elapsed = eventlet.hubs.get_hub().clock() - started_at
+
+    assert result.results[0] == 2
+    assert isinstance(result.errors[1], DeadlineExceeded)
+    # The third call is not even sent once the deadline passed
+    assert isinstance(result.errors[2], DeadlineExceeded)
+    assert [args for _, args in client._client.calls] == [(1,), (2,)]
+    assert elapsed < 0.3
+
+
+def test_deadline_forgets_pending_replies(listener):
+    client = fanout(listener, delays={1: 0.5})
+    client.map('double', [1], timeout=0.05)
+
+    assert listener.pending == {}
+
+
+def test_map_in_batches(listener):
+    client = fanout(listener)
+    result = client.map('double', [1, -2, 3], batch_size=2)
+
+    assert [name for name, _ in client._client.calls] == ['double__batch', 'double__batch']
+    assert result.results == [2, None, 6]
+    assert isinstance(result.errors[1], RemoteError)
+
+
+class Service:
+    name = 'service'
+
+    @batch_rpc
+    @rpc
+    def double(self, value, factor=2):
+        if value < 0:
+            raise ValueError(value)
+        return value * factor
+
+
+def test_batch_rpc_adds_a_batch_method():
+    responses = Service().double__batch([[[1], {}], [[-1], {}], [[2], {'factor': 3}]])
+
+    assert Service().double(2) == 4
+    assert responses[0] == {'result': 2, 'error': None}
+    assert responses[1]['result'] is None and responses[1]['error']['exc_type'] == 'ValueError'
+    assert responses[2] == {'result': 6, 'error': None}
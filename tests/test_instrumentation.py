@@ -0,0 +1,70 @@
+import time
+from functools import partial
+from types import SimpleNamespace
+
+import pytest
+
+from namekoplus.chassis.instrumentation import EntrypointInstrumentation
+
+
+class FakeStatsd:
+    def __init__(self):
+        self.timings = {}
+        self.counters = {}
+
+    def timing(self, stat, value):
+        self.timings[stat] = value
+
+    def incr(self, stat, count=1):
+        self.counters[stat] = self.counters.get(stat, 0) + count
+
+
+class FakeMessage:
+    def __init__(self, body=b'{"args": []}', headers=None, properties=None):
+        self.body = body
+        self.headers = headers or {}
+        self.properties = properties or {}
+
+
+def handle_result(message, worker_ctx, result, exc_info):
+    pass
+
+
+class FakeWorkerContext:
+    service_name = 'service'
+    entrypoint = SimpleNamespace(method_name='method')
+    args = ()
+
+
+@pytest.fixture
+def worker_ctx():
+    return FakeWorkerContext()
+
+
+def spawned(instrumentation, worker_ctx, message):
+    instrumentation._spawned(worker_ctx, 0.002, partial(handle_result, message))
+
+
+def test_skips_broker_wait_without_a_timestamp(worker_ctx):
+    statsd = FakeStatsd()
+    spawned(EntrypointInstrumentation(statsd), worker_ctx, FakeMessage())
+
+    assert statsd.timings['entrypoint.service.method.pool_wait'] == pytest.approx(2.0)
+    assert 'entrypoint.service.method.broker_wait' not in statsd.timings
+
+
+def test_times_broker_wait_from_the_timestamp(worker_ctx):
+    statsd = FakeStatsd()
+    spawned(EntrypointInstrumentation(statsd), worker_ctx,
+            FakeMessage(headers={'timestamp_in_ms': (time.time() - 0.5) * 1000}))
+
+    assert statsd.timings['entrypoint.service.method.broker_wait'] == pytest.approx(500, abs=100)
+
+
+def test_payload_sizes_are_opt_in(worker_ctx):
+    statsd = FakeStatsd()
+    spawned(EntrypointInstrumentation(statsd), worker_ctx, FakeMessage())
+    assert not statsd.counters
+
+    spawned(EntrypointInstrumentation(statsd, payload_sizes=True), worker_ctx, FakeMessage(body=b'12345'))
+    assert statsd.counters == {'entrypoint.service.method.request_bytes': 5}
@@ -0,0 +1,135 @@
+import io
+import logging
+
+import eventlet
+import pytest
+from eventlet import patcher
+
+from namekoplus.chassis.logs import QueueingHandler, RateLimitFilter, SamplingFilter
+
+_os_time = patcher.original('time')
+
+
+def record(name='service', level=logging.INFO, msg='message'):
+    return logging.LogRecord(name, level, __file__, 1, msg, (), None)
+
+
+def test_sampling_filter_keeps_the_configured_fraction(monkeypatch):
+    monkeypatch.setattr('random.random', lambda: 0.5)
+    sampling = SamplingFilter({'nameko': 0.1, 'nameko.rpc': 0.9})
+
+    assert not sampling.filter(record('nameko.events'))
+    assert sampling.filter(record('nameko.rpc.consumer'))
+    assert sampling.filter(record('service'))
+    assert sampling.sampled_out == 1
+
+
+def test_sampling_filter_keeps_records_above_max_level():
+    sampling = SamplingFilter({'': 0.0})
+
+    assert not sampling.filter(record(level=logging.INFO))
+    assert sampling.filter(record(level=logging.WARNING))
+
+
+def test_rate_limit_filter_allows_a_burst_per_second(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr('time.monotonic', lambda: now[0])
+    limits = RateLimitFilter({'noisy': 2})
+
+    assert [limits.filter(record('noisy.child')) for _ in range(3)] == [True, True, False]
+    assert limits.filter(record('quiet'))
+    assert limits.filter(record('noisy', level=logging.ERROR))
+    now[0] += 0.5
+    assert limits.filter(record('noisy'))
+    assert limits.limited == 1
+
+
+class SlowStream(io.StringIO):
+    """
+    A stream whose writes block the writer thread, like a full stdout pipe.
+    """
+
+    def __init__(self, delay):
+        super().__init__()
+        self.delay = delay
+
+    def write(self, text):
+        _os_time.sleep(self.delay)
+        return super().write(text)
+
+
+@pytest.fixture
+def handlers():
+    handlers = []
+    yield handlers
+    for handler in handlers:
+        handler.close()
+
+
+def queueing_handler(handlers, stream, **kwargs):
+    handler = QueueingHandler(stream, **kwargs)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    handlers.append(handler)
+    return handler
+
+
+def test_records_are_written_in_batches(handlers):
+    stream = io.StringIO()
+    handler = queueing_handler(handlers, stream, batch_size=2)
+    for idx in range(5):
+        handler.emit(record(msg=str(idx)))
+    handler.flush()
+
+    assert stream.getvalue() == '0\n1\n2\n3\n4\n'
+    assert handler.written == 5
+
+
+def test_drop_policy_counts_dropped_records(handlers):
+    handler = queueing_handler(handlers, SlowStream(0.2), max_queue=2, batch_size=1, flush_interval=60)
+    handler.emit(record())
+    _os_time.sleep(0.05)  # the writer is stuck writing the first record
+    for _ in range(4):
+        handler.emit(record())
+
+    assert handler.dropped == 2
+
+
+def ticks_while(fn):
+    ticks = []
+
+    def tick():
+        while True:
+            ticks.append(1)
+            eventlet.sleep(0.01)
+
+    ticker = eventlet.spawn(tick)
+    eventlet.sleep(0)
+    try:
+        fn()
+    finally:
+        ticker.kill()
+    return len(ticks)
+
+
+def test_flush_lets_other_greenthreads_run(handlers):
+    handler = queueing_handler(handlers, SlowStream(0.2), flush_interval=60)
+    handler.emit(record())
+
+    assert ticks_while(handler.flush) > 5
+    assert handler.written == 1
+
+
+def test_block_policy_lets_other_greenthreads_run(handlers):
+    handler = queueing_handler(handlers, SlowStream(0.2), max_queue=1, batch_size=1, policy='block',
+                               flush_interval=60)
+    handler.emit(record())
+    _os_time.sleep(0.05)
+    handler.emit(record())
+
+    assert ticks_while(lambda: handler.emit(record())) > 5
+    assert handler.dropped == 0
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        QueueingHandler(io.StringIO(), policy='wait')
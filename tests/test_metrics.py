@@ -0,0 +1,134 @@
+import socket
+import threading
+
+import pytest
+
+from namekoplus.chassis.chassis import init_batched_statsd
+from namekoplus.chassis.metrics import AggregatingStatsClient
+from namekoplus.supervisor import WORKER_ID_ENV
+
+
+@pytest.fixture
+def sink():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(('127.0.0.1', 0))
+    sock.settimeout(0.5)
+    yield sock
+    sock.close()
+
+
+@pytest.fixture
+def client(sink):
+    client = AggregatingStatsClient('127.0.0.1', sink.getsockname()[1], prefix='svc', flush_interval=60,
+                                    max_pending=100000)
+    yield client
+    client.close()
+
+
+def received(sink):
+    lines = []
+    while True:
+        try:
+            lines.extend(sink.recv(65535).decode().split('\n'))
+        except socket.timeout:
+            return lines
+
+
+def test_counters_are_summed_and_gauges_keep_the_latest_value(client, sink):
+    client.incr('calls')
+    client.incr('calls', 2)
+    client.gauge('workers', 3)
+    client.gauge('workers', 5)
+    client.gauge('queue', 2, delta=True)
+    client.gauge('queue', -1, delta=True)
+    client.flush()
+
+    assert sorted(received(sink)) == ['svc.calls:3|c', 'svc.queue:+1|g', 'svc.workers:5|g']
+
+
+def test_negative_gauges_are_reset_to_zero_first(client, sink):
+    client.gauge('balance', -4)
+    client.flush()
+
+    assert received(sink) == ['svc.balance:0|g', 'svc.balance:-4|g']
+
+
+def test_timers_keep_a_bounded_sample_with_its_rate(sink):
+    client = AggregatingStatsClient('127.0.0.1', sink.getsockname()[1], flush_interval=60, max_samples=10)
+    try:
+        for value in range(40):
+            client.timing('handler', value)
+        client.flush()
+    finally:
+        client.close()
+
+    lines = received(sink)
+    assert len(lines) == 10
+    assert all(line.startswith('handler:') and line.endswith('|ms|@0.25') for line in lines)
+
+
+def test_metrics_are_packed_into_datagrams_up_to_the_max_size(sink):
+    client = AggregatingStatsClient('127.0.0.1', sink.getsockname()[1], flush_interval=60, maxudpsize=64)
+    try:
+        for idx in range(20):
+            client.incr('counter.{}'.format(idx))
+        client.flush()
+        datagrams = []
+        while True:
+            try:
+                datagrams.append(sink.recv(65535))
+            except socket.timeout:
+                break
+    finally:
+        client.close()
+
+    assert 1 < len(datagrams) < 20
+    assert all(len(datagram) < 64 for datagram in datagrams)
+    assert sum(datagram.count(b'\n') + 1 for datagram in datagrams) == 20
+
+
+def test_reaching_max_pending_flushes(sink):
+    client = AggregatingStatsClient('127.0.0.1', sink.getsockname()[1], flush_interval=60, max_pending=3)
+    try:
+        client.incr('calls')
+        client.incr('calls')
+        client.incr('calls')
+        assert received(sink) == ['calls:3|c']
+    finally:
+        client.close()
+
+
+def test_pending_updates_are_counted_exactly_from_many_threads(client):
+    def update():
+        for _ in range(2000):
+            client.incr('calls')
+
+    threads = [threading.Thread(target=update) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert client._pending == 16000
+    assert client._counters['calls'] == 16000
+
+
+def test_processes_of_namekoplus_run_tag_their_stats(sink, monkeypatch):
+    monkeypatch.setenv(WORKER_ID_ENV, '2')
+    client = init_batched_statsd(prefix='svc', host='127.0.0.1', port=sink.getsockname()[1], flush_interval=60)
+    try:
+        client.incr('calls')
+        client.timing('handler', 5)
+        client.flush()
+        assert sorted(received(sink)) == ['svc.calls:1|c|#worker:2', 'svc.handler:5.000000|ms|#worker:2']
+    finally:
+        client.close()
+
+    monkeypatch.delenv(WORKER_ID_ENV)
+    client = init_batched_statsd(prefix='svc', host='127.0.0.1', port=sink.getsockname()[1], flush_interval=60)
+    try:
+        client.incr('calls')
+        client.flush()
+        assert received(sink) == ['svc.calls:1|c']
+    finally:
+        client.close()
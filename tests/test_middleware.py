@@ -0,0 +1,189 @@
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from types import SimpleNamespace
+
+import pytest
+
+from namekoplus import command
+from namekoplus.middleware import (
+    Component, ComponentFailed, _run_graph, bring_up, http_probe, tcp_probe, tear_down
+)
+
+
+class Recorder:
+
+    def __init__(self, failing=()):
+        self.failing = failing
+        self.events = []
+        self._lock = threading.Lock()
+
+    def __call__(self, component):
+        self.record('start', component.name)
+        time.sleep(0.05)
+        if component.name in self.failing:
+            raise RuntimeError('boom')
+        self.record('end', component.name)
+        return 'done'
+
+    def record(self, event, name):
+        with self._lock:
+            self.events.append((event, name))
+
+    def index(self, event, name):
+        return self.events.index((event, name))
+
+
+def graph():
+    # network <- broker <- service, network <- metrics
+    return [
+        Component('service', start=None, stop=None, depends_on=['broker']),
+        Component('broker', start=None, stop=None, depends_on=['network']),
+        Component('network', start=None, stop=None),
+        Component('metrics', start=None, stop=None, depends_on=['network', 'unmanaged']),
+    ]
+
+
+def test_run_graph_runs_components_after_their_dependencies():
+    action = Recorder()
+    results = _run_graph(graph(), action)
+
+    assert [name for name in results] == ['service', 'broker', 'network', 'metrics']
+    assert all(outcome == 'done' for outcome, _ in results.values())
+    assert action.index('end', 'network') < action.index('start', 'broker')
+    assert action.index('end', 'broker') < action.index('start', 'service')
+    # Independent components run in parallel
+    assert action.index('start', 'metrics') < action.index('end', 'broker')
+
+
+def test_run_graph_in_reverse_runs_dependents_first():
+    action = Recorder()
+    _run_graph(graph(), action, reverse=True)
+
+    assert action.index('end', 'service') < action.index('start', 'broker')
+    assert action.index('end', 'broker') < action.index('start', 'network')
+    assert action.index('end', 'metrics') < action.index('start', 'network')
+
+
+def test_run_graph_skips_the_dependents_of_failed_components():
+    results = _run_graph(graph(), Recorder(failing=['broker']))
+
+    assert results['network'][0] == 'done'
+    assert results['broker'][0] == 'FAILED: boom'
+    assert results['service'] == ('skipped, broker failed', 0.0)
+    assert results['metrics'][0] == 'done'
+
+
+def fake_component(name, state, events, depends_on=()):
+    return Component(name, start=lambda: events.append(('start', name)), stop=lambda: events.append(('stop', name)),
+                     depends_on=depends_on, state=lambda: state)
+
+
+def test_bring_up_reuses_running_and_replaces_outdated_components():
+    events = []
+    bring_up([
+        fake_component('running', 'running', events),
+        fake_component('outdated', 'outdated', events),
+        fake_component('absent', 'absent', events),
+    ])
+
+    assert sorted(events) == [('start', 'absent'), ('start', 'outdated'), ('stop', 'outdated')]
+
+
+def test_bring_up_and_tear_down_fail_with_their_components():
+    def fail():
+        raise RuntimeError('boom')
+
+    with pytest.raises(ComponentFailed):
+        bring_up([Component('broken', start=fail, stop=None)])
+    with pytest.raises(ComponentFailed):
+        tear_down([Component('broken', start=None, stop=fail)])
+
+
+@pytest.fixture
+def listening():
+    server = socket.socket()
+    server.bind(('127.0.0.1', 0))
+    server.listen()
+    yield server
+    server.close()
+
+
+def closed_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def test_tcp_probe(listening):
+    assert Component('up', None, None, probe=tcp_probe('127.0.0.1', listening.getsockname()[1])).is_ready()
+    assert not Component('down', None, None, probe=tcp_probe('127.0.0.1', closed_port())).is_ready()
+
+
+def test_waiting_for_a_component_times_out():
+    component = Component('down', None, None, probe=tcp_probe('127.0.0.1', closed_port()))
+
+    started_at = time.monotonic()
+    with pytest.raises(ComponentFailed, match='down is not ready after 0.3s'):
+        component.wait_until_ready(0.3, interval=0.05)
+    assert time.monotonic() - started_at < 2
+
+
+class StatusHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        self.send_response(int(self.path.strip('/')))
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def http_server():
+    server = HTTPServer(('127.0.0.1', 0), StatusHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    yield 'http://127.0.0.1:{}'.format(server.server_port)
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+
+def test_http_probe(http_server):
+    assert Component('up', None, None, probe=http_probe(http_server + '/200')).is_ready()
+    assert not Component('failing', None, None, probe=http_probe(http_server + '/503')).is_ready()
+
+
+def test_http_probe_times_out_on_a_silent_server(listening):
+    # The port accepts connections but never answers
+    probe = http_probe('http://127.0.0.1:{}/-/ready'.format(listening.getsockname()[1]))
+
+    started_at = time.monotonic()
+    assert not Component('silent', None, None, probe=probe).is_ready()
+    assert time.monotonic() - started_at < 3
+
+
+class FakeDocker:
+
+    def __init__(self, mounted):
+        container = SimpleNamespace(
+            state=SimpleNamespace(running=True),
+            mounts=[SimpleNamespace(source=mounted, destination=command.PROMETHEUS_CONF_MOUNT)],
+        )
+        self.container = SimpleNamespace(exists=lambda name: True, inspect=lambda name: container)
+
+
+def test_prometheus_started_for_another_mode_is_outdated(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'prometheus.yml').write_text('scrape_configs: []\n')
+    statsd_conf, direct_conf = command.prometheus_conf_file(direct=False), command.prometheus_conf_file(direct=True)
+    assert direct_conf == str(tmp_path / 'prometheus.yml') != statsd_conf
+
+    monkeypatch.setattr(command, 'docker_client', lambda: FakeDocker(statsd_conf))
+    assert command.prometheus_state(direct=False)() == 'running'
+    assert command.prometheus_state(direct=True)() == 'outdated'
+
+    monkeypatch.setattr(command, 'docker_client', lambda: FakeDocker(direct_conf))
+    assert command.prometheus_state(direct=True)() == 'running'
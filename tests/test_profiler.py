@@ -0,0 +1,86 @@
+import inspect
+import time
+
+import pytest
+from nameko.rpc import rpc
+from nameko.standalone.rpc import ServiceRpcClient
+
+from namekoplus.profiler import IDLE, Profiler, entrypoint_ranges
+
+RETAINED = []
+
+
+def busy(seconds):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        sum(range(100))
+
+
+class ProfiledService:
+    name = 'profiled'
+
+    @rpc
+    def compute(self, seconds):
+        busy(seconds)
+        return seconds
+
+    @rpc
+    def allocate(self, count):
+        RETAINED.append([str(idx) * 10 for idx in range(count)])
+        return count
+
+
+@pytest.fixture
+def container(memory_broker, container_factory):
+    container = container_factory(ProfiledService)
+    container.start()
+    return container
+
+
+def source_range(method, label):
+    lines, first_line = inspect.getsourcelines(method)
+    return first_line, first_line + len(lines) - 1, label
+
+
+def test_entrypoint_ranges(container):
+    ranges = entrypoint_ranges([container])
+
+    assert sorted(ranges[__file__]) == [
+        source_range(ProfiledService.compute, 'profiled.compute'),
+        source_range(ProfiledService.allocate, 'profiled.allocate'),
+    ]
+
+
+def test_charges_samples_and_memory_to_entrypoints(container, tmp_path):
+    profiler = Profiler(interval=0.001, snapshot_interval=0.05)
+    profiler.start([container])
+    try:
+        with ServiceRpcClient('profiled') as client:
+            for _ in range(3):
+                client.compute(0.05)
+            client.allocate(10000)
+    finally:
+        profiler.stop()
+    del RETAINED[:]
+
+    # A busy worker only lets the sampler take the GIL every switch interval
+    assert sum(profiler.stacks['profiled.compute'].values()) >= 5
+    assert any('busy (' in line for line in profiler.collapsed('profiled.compute').splitlines())
+    assert profiler.top_functions('profiled.compute')[0].startswith('busy (')
+    assert sum(profiler.retained['profiled.allocate'].values()) > 100000
+    assert 'profiled.compute' in profiler.entrypoints
+
+    paths = profiler.write(str(tmp_path))
+    names = {path[len(str(tmp_path)) + 1:] for path in paths}
+    assert {'profiled.compute.collapsed', 'profiled.allocate.allocations.txt', 'summary.txt'} <= names
+    summary = (tmp_path / 'summary.txt').read_text()
+    assert 'profiled.compute' in summary and IDLE in summary
+
+
+def test_collapsed_stacks_count_every_sample():
+    profiler = Profiler(memory=False)
+    code = busy.__code__
+    profiler.stacks['service.method'][(code,)] += 3
+
+    assert profiler.collapsed('service.method') == 'busy (tests/test_profiler.py:{}) 3\n'.format(
+        code.co_firstlineno)
@@ -0,0 +1,67 @@
+import pytest
+
+from namekoplus.chassis.prometheus import MetricsRegistry, worker_address, WORKER_ID_ENV
+
+
+@pytest.fixture
+def registry():
+    return MetricsRegistry()
+
+
+def test_histogram_buckets_are_cumulative(registry):
+    histogram = registry.histogram('latency_seconds', 'Latency.', ('service',), buckets=(0.1, 1.0))
+    histogram.observe(0.05, 'svc')
+    histogram.observe(0.5, 'svc')
+    histogram.observe(5.0, 'svc')
+
+    lines = registry.render().splitlines()
+    assert lines[:2] == ['# HELP latency_seconds Latency.', '# TYPE latency_seconds histogram']
+    assert 'latency_seconds_bucket{service="svc",le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{service="svc",le="1.0"} 2' in lines
+    assert 'latency_seconds_bucket{service="svc",le="+Inf"} 3' in lines
+    assert 'latency_seconds_sum{service="svc"} 5.55' in lines
+    assert 'latency_seconds_count{service="svc"} 3' in lines
+
+
+def test_counter_and_gauge(registry):
+    registry.counter('calls_total', 'Calls.', ('entrypoint',)).inc('hello', amount=2)
+    registry.gauge('pool_busy', 'Busy.').set(3)
+
+    lines = registry.render().splitlines()
+    assert 'calls_total{entrypoint="hello"} 2' in lines
+    assert 'pool_busy 3' in lines
+
+
+def test_label_values_are_escaped(registry):
+    registry.counter('calls_total', 'Calls.', ('entrypoint',)).inc('say "hi"\n')
+    assert 'calls_total{entrypoint="say \\"hi\\"\\n"} 1' in registry.render().splitlines()
+
+
+def test_same_metric_is_shared(registry):
+    first = registry.histogram('latency_seconds', 'Latency.', ('service',), buckets=(1.0, 0.1))
+    assert registry.histogram('latency_seconds', 'Latency.', ('service',), buckets=(0.1, 1.0)) is first
+
+
+def test_other_type_raises(registry):
+    registry.counter('calls_total', 'Calls.')
+    with pytest.raises(ValueError):
+        registry.gauge('calls_total', 'Calls.')
+
+
+def test_other_labelnames_raise(registry):
+    registry.counter('calls_total', 'Calls.', ('service',))
+    with pytest.raises(ValueError):
+        registry.counter('calls_total', 'Calls.', ('service', 'worker'))
+
+
+def test_other_buckets_raise(registry):
+    registry.histogram('latency_seconds', 'Latency.', buckets=(0.1, 1.0))
+    with pytest.raises(ValueError):
+        registry.histogram('latency_seconds', 'Latency.', buckets=(0.1, 1.0, 10.0))
+
+
+def test_worker_address(monkeypatch):
+    monkeypatch.delenv(WORKER_ID_ENV, raising=False)
+    assert worker_address('0.0.0.0:9464') == '0.0.0.0:9464'
+    monkeypatch.setenv(WORKER_ID_ENV, '3')
+    assert worker_address('0.0.0.0:9464') == '0.0.0.0:9467'
@@ -0,0 +1,97 @@
+import json
+import os
+import textwrap
+
+import pytest
+
+from namekoplus.command import bench_call, generate_benchmarks
+from namekoplus.regression import Baselines, MissingBaseline, PerformanceRegression
+
+RESULT = {'median_s': 0.001, 'min_s': 0.0009, 'max_s': 0.002, 'rounds': 5, 'calls_per_round': 16}
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'bench_baselines.json')
+
+
+def test_fails_without_a_baseline(path):
+    with pytest.raises(MissingBaseline, match='NAMEKOPLUS_BENCH_UPDATE=1'):
+        Baselines(path, update=False).check('micro Service.method', RESULT)
+    assert not os.path.exists(path)
+
+
+def test_update_records_baselines(path):
+    Baselines(path, update=True).check('micro Service.method', RESULT)
+
+    with open(path) as f:
+        assert json.load(f)['micro Service.method']['median_s'] == 0.001
+    Baselines(path, update=False).check('micro Service.method', RESULT)
+
+
+def test_update_comes_from_the_environment(path, monkeypatch):
+    monkeypatch.setenv('NAMEKOPLUS_BENCH_UPDATE', '1')
+    assert Baselines(path).update
+    monkeypatch.setenv('NAMEKOPLUS_BENCH_UPDATE', '0')
+    assert not Baselines(path).update
+
+
+def test_fails_when_slower_than_the_threshold(path):
+    Baselines(path, update=True).check('e2e Service.method', RESULT)
+    baselines = Baselines(path, threshold=0.25, update=False)
+
+    baselines.check('e2e Service.method', dict(RESULT, median_s=0.00124))
+    with pytest.raises(PerformanceRegression, match='slower than the baseline'):
+        baselines.check('e2e Service.method', dict(RESULT, median_s=0.0013))
+
+
+def test_event_handlers_without_literal_events_get_no_placeholder_event():
+    call = bench_call({'method': 'on_created', 'type': 'event_handler', 'args': [None, 'created']})
+    assert call == {'source_service': None, 'event_type': 'created', 'payload': {}}
+
+
+def test_generated_benchmarks_skip_unknown_events(tmp_path):
+    (tmp_path / 'listener.py').write_text(textwrap.dedent('''
+        from nameko.events import event_handler
+
+        SOURCE = 'orders'
+
+
+        class ListenerService:
+            name = 'listener'
+
+            @event_handler(SOURCE, 'created')
+            def on_created(self, payload):
+                pass
+
+            @event_handler('orders', 'paid')
+            def on_paid(self, payload):
+                pass
+    '''))
+    generate_benchmarks(str(tmp_path))
+
+    source = (tmp_path / 'test_bench_listener.py').read_text()
+    compile(source, 'test_bench_listener.py', 'exec')
+    assert "'ListenerService.on_created': {'source_service': None, 'event_type': 'created'" in source
+    assert "'ListenerService.on_paid': {'source_service': 'orders', 'event_type': 'paid'" in source
+    assert source.count('pytest.skip(') == 2
+    assert 'TODO' not in source
+
+
+def test_generated_benchmark_names_are_identifiers(tmp_path):
+    (tmp_path / 'greeting.py').write_text(textwrap.dedent('''
+        from nameko.rpc import rpc
+
+
+        class GreetingService:
+            name = 'greeting-service'
+
+            @rpc
+            def hello(self, name):
+                return name
+    '''))
+    generate_benchmarks(str(tmp_path))
+
+    source = (tmp_path / 'test_bench_greeting.py').read_text()
+    compile(source, 'test_bench_greeting.py', 'exec')
+    assert 'def test_greeting_service_hello_micro():' in source
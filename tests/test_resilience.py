@@ -0,0 +1,179 @@
+import eventlet
+import pytest
+from eventlet.event import Event
+from nameko.events import event_handler
+from nameko.exceptions import ContainerBeingKilled, RemoteError
+from nameko.rpc import Rpc, rpc
+from nameko.standalone.events import event_dispatcher
+from nameko.standalone.rpc import ServiceRpcClient
+from nameko.testing.services import entrypoint_waiter
+from nameko.testing.utils import get_extension
+
+from namekoplus.chassis.resilience import AdaptiveConcurrency, AdaptiveLimiter, Overloaded, RetryBudget
+
+
+def test_limiter_admits_up_to_its_limit():
+    limiter = AdaptiveLimiter(initial=2, max_limit=10)
+
+    assert limiter.acquire()
+    assert limiter.acquire()
+    assert not limiter.acquire()
+    assert limiter.in_flight == 2
+
+
+def test_limiter_grows_additively_while_in_use():
+    limiter = AdaptiveLimiter(initial=4, max_limit=10, target_latency=1.0)
+    for _ in range(4):
+        limiter.acquire()
+
+    limiter.release(0.1)
+
+    assert limiter.limit == pytest.approx(4.25)
+
+
+def test_limiter_does_not_grow_while_mostly_idle():
+    limiter = AdaptiveLimiter(initial=10, max_limit=20, target_latency=1.0)
+    limiter.acquire()
+    limiter.release(0.1)
+
+    assert limiter.limit == 10
+
+
+def test_limiter_cut_is_proportional_to_the_latency_over_target():
+    limiter = AdaptiveLimiter(initial=10, max_limit=10, target_latency=0.1, backoff=0.9)
+    limiter.acquire()
+    limiter.release(0.125)
+    assert limiter.limit == pytest.approx(8)
+
+    limiter = AdaptiveLimiter(initial=10, max_limit=10, target_latency=0.1, backoff=0.9)
+    limiter.acquire()
+    limiter.release(1.0)
+    assert limiter.limit == pytest.approx(5)
+
+
+def test_limiter_cuts_once_per_slow_latency():
+    limiter = AdaptiveLimiter(initial=10, max_limit=10, target_latency=0.1)
+    for _ in range(3):
+        limiter.acquire()
+    for _ in range(3):
+        limiter.release(1.0)
+
+    assert limiter.limit == pytest.approx(5)
+
+
+def test_limiter_stays_within_bounds():
+    limiter = AdaptiveLimiter(initial=2, min_limit=2, max_limit=4, target_latency=0.001)
+    limiter.acquire()
+    limiter.release(1.0, overloaded=True)
+    assert limiter.limit == 2
+
+    limiter = AdaptiveLimiter(initial=4, max_limit=4, target_latency=1.0)
+    for _ in range(4):
+        limiter.acquire()
+    limiter.release(0.1)
+    assert limiter.limit == 4
+
+
+def test_limiter_threshold_follows_the_baseline():
+    limiter = AdaptiveLimiter(initial=10, max_limit=10, tolerance=2.0)
+    assert limiter.threshold is None
+
+    limiter.acquire()
+    limiter.release(0.05)
+    assert limiter.threshold == pytest.approx(0.1)
+
+
+def test_retry_budget():
+    budget = RetryBudget(ratio=0.5, min_per_second=0, capacity=2)
+
+    assert budget.withdraw()
+    assert budget.withdraw()
+    assert not budget.withdraw()
+    budget.deposit()
+    budget.deposit()
+    assert budget.withdraw()
+
+
+class SlowService:
+    name = 'slow'
+
+    limiter = AdaptiveConcurrency(max_limit=1)
+
+    calls = []
+    release = None
+
+    @rpc
+    def work(self):
+        self.calls.append('work')
+        self.release.wait()
+
+    @event_handler('orders', 'created', requeue_on_error=True)
+    def on_created(self, payload):
+        self.calls.append('on_created')
+        self.release.wait()
+
+
+@pytest.fixture
+def container(memory_broker, container_factory):
+    SlowService.calls = []
+    SlowService.release = Event()
+    container = container_factory(SlowService)
+    container.start()
+    return container
+
+
+@pytest.fixture
+def slow_rpc(memory_broker):
+    with ServiceRpcClient('slow') as client:
+        yield client
+
+
+def test_calls_over_the_limit_are_shed_before_a_worker_spawns(container, slow_rpc):
+    first = slow_rpc.work.call_async()
+    eventlet.sleep(0.05)
+
+    with pytest.raises(RemoteError) as exc_info:
+        slow_rpc.work()
+    assert exc_info.value.exc_type == 'Overloaded'
+    assert SlowService.calls == ['work']
+    assert len(container._worker_threads) == 1
+
+    SlowService.release.send()
+    first.result()
+    slow_rpc.work()
+    assert SlowService.calls == ['work', 'work']
+
+
+def test_requeueing_event_handlers_are_not_shed(container):
+    dispatch = event_dispatcher()
+    with entrypoint_waiter(container, 'on_created', timeout=5):
+        dispatch('orders', 'created', {})
+        dispatch('orders', 'created', {})
+        eventlet.sleep(0.05)
+        assert SlowService.calls == ['on_created', 'on_created']
+        SlowService.release.send()
+
+
+def test_slot_is_released_when_handle_result_raises(container):
+    SlowService.release.send()
+    entrypoint = get_extension(container, Rpc, method_name='work')
+    limiter = get_extension(container, AdaptiveConcurrency).limiter('work')
+
+    def handle_result(worker_ctx, result, exc_info):
+        raise RuntimeError('reply failed')
+
+    container.spawn_worker(entrypoint, (), {}, handle_result=handle_result)
+    with pytest.raises(RuntimeError):
+        container.wait()
+    assert limiter.in_flight == 0
+
+
+def test_slot_is_released_when_the_worker_cannot_spawn(container):
+    entrypoint = get_extension(container, Rpc, method_name='work')
+    limiter = get_extension(container, AdaptiveConcurrency).limiter('work')
+
+    container._being_killed = True
+    with pytest.raises(ContainerBeingKilled):
+        container.spawn_worker(entrypoint, (), {}, handle_result=lambda *args: None)
+    container._being_killed = False
+    assert limiter.in_flight == 0
@@ -0,0 +1,136 @@
+import json
+import os
+
+import pytest
+
+from namekoplus import scanner
+from namekoplus.scanner import CACHE_DIR, CACHE_FILE, scan, scan_source
+
+SERVICE_SOURCE = '''
+from nameko.events import event_handler
+from nameko.rpc import rpc
+from namekoplus import init_batched_statsd, init_instrumentation
+from namekoplus.chassis.events import batch_event_handler
+from namekoplus.chassis.fanout import batch_rpc
+
+statsd = init_batched_statsd('greeting')
+
+
+class GreetingService:
+    name = 'greeting_service'
+
+    instrumentation = init_instrumentation(statsd)
+
+    @rpc
+    @statsd.timer('hello')
+    def hello(self, name, greeting='Hello'):
+        return greeting + name
+
+    @batch_rpc
+    @rpc
+    def lookup(self, key):
+        return key
+
+    @event_handler('orders', 'order_created')
+    def on_order(self, payload):
+        pass
+
+    @batch_event_handler('orders', 'order_paid', max_batch=50)
+    def on_paid(self, payloads):
+        pass
+
+
+class Helper:
+    pass
+'''
+
+
+def test_scan_source():
+    greeting, helper = scan_source(SERVICE_SOURCE)
+
+    assert greeting['class_name'] == 'GreetingService'
+    assert greeting['service_name'] == 'greeting_service'
+    assert greeting['instrumentation'] == {'statsd_prefix': 'greeting'}
+    assert greeting['timers'] == [{'method': 'hello', 'stat_name': 'hello', 'statsd_prefix': 'greeting'}]
+    entrypoints = {entrypoint['method']: entrypoint for entrypoint in greeting['entrypoints']}
+    assert entrypoints['hello'] == {'method': 'hello', 'type': 'rpc', 'args': [], 'required_params': ['name']}
+    assert entrypoints['on_order']['args'] == ['orders', 'order_created']
+
+    assert helper['service_name'] is None
+    assert helper['entrypoints'] == []
+
+
+def test_scan_source_finds_batch_entrypoints():
+    greeting = scan_source(SERVICE_SOURCE)[0]
+    types = [(entrypoint['method'], entrypoint['type']) for entrypoint in greeting['entrypoints']]
+
+    assert ('lookup', 'rpc') in types
+    assert ('lookup__batch', 'batch_rpc') in types
+    assert ('on_paid', 'batch_event_handler') in types
+
+
+@pytest.fixture
+def project(tmp_path):
+    (tmp_path / 'services').mkdir()
+    (tmp_path / 'services' / 'greeting.py').write_text(SERVICE_SOURCE)
+    (tmp_path / 'services' / 'broken.py').write_text('def (')
+    (tmp_path / '__pycache__').mkdir()
+    (tmp_path / '__pycache__' / 'ignored.py').write_text(SERVICE_SOURCE)
+    return tmp_path
+
+
+@pytest.fixture
+def parsed(monkeypatch):
+    calls = []
+    scan_source = scanner.scan_source
+
+    def counting_scan_source(source, filename='<unknown>'):
+        calls.append(os.path.basename(filename))
+        return scan_source(source, filename)
+
+    monkeypatch.setattr(scanner, 'scan_source', counting_scan_source)
+    return calls
+
+
+def test_scan(project, parsed):
+    classes = scan([str(project)], root=str(project))
+
+    assert [(info['module'], info['class_name']) for info in classes] == [
+        ('services.greeting', 'GreetingService'), ('services.greeting', 'Helper')]
+    assert sorted(parsed) == ['broken.py', 'greeting.py']
+
+
+def test_scan_serves_unchanged_files_from_the_cache(project, parsed):
+    first = scan([str(project)], root=str(project))
+    del parsed[:]
+
+    assert scan([str(project)], root=str(project)) == first
+    assert parsed == []
+
+
+def test_scan_parses_changed_files_again(project, parsed):
+    scan([str(project)], root=str(project))
+    del parsed[:]
+    (project / 'services' / 'greeting.py').write_text(SERVICE_SOURCE.replace('greeting_service', 'welcome'))
+
+    classes = scan([str(project)], root=str(project))
+
+    assert parsed == ['greeting.py']
+    assert classes[0]['service_name'] == 'welcome'
+
+
+def test_scan_ignores_a_cache_of_another_version(project, parsed):
+    scan([str(project)], root=str(project))
+    cache_path = project / CACHE_DIR / CACHE_FILE
+    cache = json.loads(cache_path.read_text())
+    cache_path.write_text(json.dumps(dict(cache, version=cache['version'] - 1)))
+    del parsed[:]
+
+    scan([str(project)], root=str(project))
+
+    assert sorted(parsed) == ['broken.py', 'greeting.py']
+
+
+def test_scan_without_cache(project):
+    scan([str(project)], root=str(project), use_cache=False)
+    assert not (project / CACHE_DIR).exists()
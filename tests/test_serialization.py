@@ -0,0 +1,84 @@
+from datetime import datetime
+from decimal import Decimal
+
+import kombu.serialization
+import pytest
+from kombu.utils.json import dumps as json_dumps, loads as json_loads
+from nameko import config, serialization
+from nameko.amqp.publish import Publisher
+
+from namekoplus.chassis.serialization import (
+    CompressingPublisher, msgpack_dumps, msgpack_loads, orjson_dumps, orjson_loads
+)
+
+PAYLOAD = {
+    'args': ['Jane', 2 ** 70],
+    'kwargs': {'price': Decimal('9.99'), 'created_at': datetime(2023, 1, 2, 3, 4, 5), 'raw': b'\x00\x01'},
+}
+
+SERIALIZERS = {
+    'orjson': {
+        'encoder': 'namekoplus.chassis.serialization.orjson_dumps',
+        'decoder': 'namekoplus.chassis.serialization.orjson_loads',
+        'content_type': 'application/x-orjson',
+        'content_encoding': 'utf-8',
+    },
+}
+
+
+def test_orjson_round_trips_kombu_envelopes():
+    assert orjson_loads(orjson_dumps(PAYLOAD)) == PAYLOAD
+
+
+def test_orjson_is_read_by_the_json_serializer():
+    assert json_loads(orjson_dumps(PAYLOAD)) == PAYLOAD
+    assert orjson_loads(json_dumps(PAYLOAD)) == PAYLOAD
+    assert orjson_loads(memoryview(orjson_dumps({'plain': [1, 2.5, None]}))) == {'plain': [1, 2.5, None]}
+
+
+def test_msgpack_round_trips_kombu_envelopes():
+    # msgpack has no integers beyond 64 bits
+    payload = dict(PAYLOAD, args=['Jane', 2 ** 63])
+    assert msgpack_loads(msgpack_dumps(payload)) == payload
+    assert msgpack_loads(msgpack_dumps({1: 'a'})) == {1: 'a'}
+
+
+@pytest.fixture
+def orjson_registered():
+    with config.patch({'SERIALIZERS': SERIALIZERS, 'serializer': 'json', 'ACCEPT': ['json', 'orjson']}):
+        serialization.setup()
+        yield
+    kombu.serialization.registry.unregister('orjson')
+
+
+def test_orjson_leaves_the_json_decoder_alone(orjson_registered):
+    registry = kombu.serialization.registry
+    assert registry.type_to_name['application/json'] == 'json'
+
+    content_type, content_encoding, body = kombu.serialization.dumps(PAYLOAD, serializer='orjson')
+    assert content_type == 'application/x-orjson'
+    assert kombu.serialization.loads(body, content_type, content_encoding) == PAYLOAD
+
+
+@pytest.fixture
+def published(monkeypatch):
+    published = []
+    monkeypatch.setattr(Publisher, 'publish', lambda self, payload, **kwargs: published.append((payload, kwargs)))
+    return published
+
+
+@pytest.mark.parametrize('size, compression', [(10, None), (20000, 'zlib')])
+def test_compresses_large_messages(published, size, compression):
+    publisher = CompressingPublisher('memory://', serializer='json')
+    with config.patch({'COMPRESSION': 'zlib', 'COMPRESSION_THRESHOLD': 16384}):
+        publisher.publish({'data': 'x' * size})
+
+    body, kwargs = published[0]
+    assert kwargs.get('compression') == compression
+    assert kwargs['content_type'] == 'application/json'
+    assert json_loads(body) == {'data': 'x' * size}
+
+
+def test_publishes_unchanged_without_compression(published):
+    CompressingPublisher('memory://').publish({'data': 'x' * 20000})
+    assert published == [({'data': 'x' * 20000}, {})]
@@ -0,0 +1,102 @@
+import os
+import subprocess
+import sys
+import textwrap
+import time
+
+import pytest
+
+import namekoplus
+
+# As in benchmarks/bench_cli_startup.py, the modules only some commands need
+HEAVY_MODULES = ('python_on_whales', 'mako', 'shortuuid', 'nameko', 'kombu', 'eventlet', 'http.client')
+
+# Seconds importing the CLI and running its commands may take on top of a bare interpreter,
+# as in benchmarks/bench_cli_startup.py
+IMPORT_BUDGET = 0.3
+BUDGETS = {
+    '--help': 0.25,
+    'init': 0.3,
+}
+
+SRC_DIR = os.path.dirname(os.path.dirname(namekoplus.__file__))
+
+# Runs a command in-process and reports the modules it loaded
+CHECK_IMPORTS = '''
+import sys
+from namekoplus.command import cli
+try:
+    cli.main(sys.argv[1:], prog_name='namekoplus')
+except SystemExit:
+    pass
+print('heavy:' + ','.join(name for name in {heavy!r} if name in sys.modules))
+'''.format(heavy=HEAVY_MODULES)
+
+
+@pytest.fixture
+def plugin_path(tmp_path):
+    """
+    A directory with an installed plugin adding a `deploy` command.
+    """
+    (tmp_path / 'deploy_plugin.py').write_text(textwrap.dedent('''
+        import click
+
+
+        @click.command()
+        def deploy():
+            """Deploy the services."""
+    '''))
+    dist_info = tmp_path / 'deploy_plugin-1.0.dist-info'
+    dist_info.mkdir()
+    (dist_info / 'METADATA').write_text('Metadata-Version: 2.1\nName: deploy-plugin\nVersion: 1.0\n')
+    (dist_info / 'entry_points.txt').write_text('[namekoplus.commands]\ndeploy = deploy_plugin:deploy\n')
+    return str(tmp_path)
+
+
+def run(args, *paths):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [SRC_DIR, *paths, os.environ.get('PYTHONPATH')])))
+    return subprocess.run([sys.executable] + args, env=env, capture_output=True, text=True, check=True).stdout
+
+
+def fastest(args, *paths, runs=3, setup=None):
+    best, output = None, None
+    for _ in range(runs):
+        extra = setup() if setup else []
+        started_at = time.perf_counter()
+        output = run(args + extra, *paths)
+        elapsed = time.perf_counter() - started_at
+        best = elapsed if best is None else min(best, elapsed)
+    return best, output
+
+
+def heavy_imports(args, *paths):
+    return run(['-c', CHECK_IMPORTS] + args, *paths).rsplit('heavy:', 1)[-1].strip()
+
+
+def test_importing_the_cli_is_fast_and_loads_no_heavy_modules():
+    baseline, _ = fastest(['-c', 'pass'])
+    code = 'import sys, namekoplus.command\nprint(",".join(name for name in {!r} if name in sys.modules))'
+    elapsed, loaded = fastest(['-c', code.format(HEAVY_MODULES)])
+
+    assert loaded.strip() == ''
+    assert elapsed - baseline < IMPORT_BUDGET
+
+
+def test_help_lists_plugins_within_its_budget(plugin_path):
+    baseline, _ = fastest(['-c', 'pass'])
+    elapsed, output = fastest(['-m', 'namekoplus.command', '--help'], plugin_path)
+
+    assert 'deploy' in output and 'Deploy the services.' in output
+    assert heavy_imports(['--help'], plugin_path) == ''
+    assert elapsed - baseline < BUDGETS['--help']
+
+
+def test_init_within_its_budget(tmp_path):
+    directories = iter(str(tmp_path / 'service{}'.format(idx)) for idx in range(10))
+
+    baseline, _ = fastest(['-c', 'pass'])
+    elapsed, _ = fastest(['-m', 'namekoplus.command', 'init', '-t', 'all'], setup=lambda: ['-d', next(directories)])
+
+    assert os.listdir(str(tmp_path / 'service0'))
+    assert heavy_imports(['init', '-t', 'all', '-d', next(directories)]) == ''
+    assert elapsed - baseline < BUDGETS['init']
@@ -0,0 +1,146 @@
+import signal
+import sys
+import textwrap
+import time
+
+import eventlet
+import pytest
+
+from namekoplus.command import worker_targets
+from namekoplus.supervisor import Supervisor, WORKER_ID_ENV
+
+# Logs its start and a graceful stop, SIGTERM lets it finish its work for a moment first
+CHILD = textwrap.dedent('''
+    import os, signal, sys, time
+
+    def log(event):
+        with open(sys.argv[1], 'a') as f:
+            f.write('{} {} {}\\n'.format(event, os.environ['{worker_id_env}'], os.getpid()))
+
+    def stop(signum, frame):
+        time.sleep(0.1)
+        log('stopped')
+        sys.exit(0)
+
+    if sys.argv[2] == 'graceful':
+        signal.signal(signal.SIGTERM, stop)
+    else:
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    log('started')
+    while True:
+        time.sleep(0.05)
+''').replace('{worker_id_env}', WORKER_ID_ENV)
+
+
+@pytest.fixture(autouse=True)
+def restore_signal_handlers():
+    signums = [signal.SIGTERM, signal.SIGINT, signal.SIGHUP]
+    handlers = [signal.getsignal(signum) for signum in signums]
+    yield
+    for signum, handler in zip(signums, handlers):
+        signal.signal(signum, handler)
+
+
+@pytest.fixture
+def events(tmp_path):
+    return tmp_path / 'events.log'
+
+
+def supervisor(tmp_path, events, processes=2, behaviour='graceful', **kwargs):
+    script = tmp_path / 'child.py'
+    script.write_text(CHILD)
+    supervisor = Supervisor(['service'], processes=processes, **kwargs)
+    for worker in supervisor.workers:
+        worker.command = [sys.executable, str(script), str(events), behaviour]
+    return supervisor
+
+
+def logged(events, event):
+    if not events.exists():
+        return []
+    return [line.split()[1:] for line in events.read_text().splitlines() if line.startswith(event + ' ')]
+
+
+def wait_for(events, event, count, timeout=10):
+    deadline = time.monotonic() + timeout
+    while len(logged(events, event)) < count:
+        assert time.monotonic() < deadline, 'timed out waiting for {} {} events'.format(count, event)
+        eventlet.sleep(0.02)
+
+
+def send_after(events, event, count, signum):
+    def send():
+        wait_for(events, event, count)
+        signal.raise_signal(signum)
+    return eventlet.spawn(send)
+
+
+def test_restarts_crashing_workers_with_backoff(tmp_path, events):
+    crashing = supervisor(tmp_path, events, processes=1, max_backoff=4, stable_after=30)
+    worker = crashing.workers[0]
+    worker.command = [sys.executable, '-c', 'raise SystemExit(3)']
+
+    backoffs = []
+    for _ in range(4):
+        worker.start()
+        worker.wait(10)
+        crashing.supervise()
+        backoffs.append(worker.backoff)
+        assert worker.restart_at is not None
+    assert backoffs == [1, 2, 4, 4]
+
+    # A worker that ran for longer than stable_after is restarted at once
+    worker.start()
+    worker.started_at -= 60
+    worker.wait(10)
+    crashing.supervise()
+    assert worker.backoff == 0
+
+    crashing.supervise()
+    assert worker.restart_at is None
+    worker.wait(10)
+
+
+def test_restarts_workers_one_by_one_on_sighup(tmp_path, events, capsys):
+    rolling = supervisor(tmp_path, events, grace=10)
+    reload = send_after(events, 'started', 2, signal.SIGHUP)
+    stop = send_after(events, 'started', 4, signal.SIGTERM)
+
+    rolling.run()
+    reload.wait()
+    stop.wait()
+
+    started, stopped = logged(events, 'started'), logged(events, 'stopped')
+    assert sorted(worker_id for worker_id, pid in started) == ['0', '0', '1', '1']
+    # Every process, the replaced ones included, stopped gracefully
+    assert sorted(pid for worker_id, pid in started) == sorted(pid for worker_id, pid in stopped)
+    output = capsys.readouterr().out
+    assert output.index('Restarting workers one by one') < output.index('Restarted worker 0') \
+        < output.index('Restarted worker 1')
+
+
+def test_shutdown_lets_workers_finish(tmp_path, events):
+    graceful = supervisor(tmp_path, events, grace=10)
+    stop = send_after(events, 'started', 2, signal.SIGTERM)
+
+    graceful.run()
+    stop.wait()
+
+    assert len(logged(events, 'stopped')) == 2
+    assert [worker.poll() for worker in graceful.workers] == [0, 0]
+
+
+def test_shutdown_kills_workers_after_the_grace_period(tmp_path, events, capsys):
+    stubborn = supervisor(tmp_path, events, behaviour='stubborn', grace=0.3)
+    stop = send_after(events, 'started', 2, signal.SIGTERM)
+
+    stubborn.run()
+    stop.wait()
+
+    assert [worker.poll() for worker in stubborn.workers] == [-signal.SIGKILL, -signal.SIGKILL]
+    assert 'did not stop within 0.3s, killing it' in capsys.readouterr().err
+
+
+def test_direct_scrape_targets_cover_every_process():
+    assert worker_targets(['host.docker.internal:9464'], 1) == ['host.docker.internal:9464']
+    assert worker_targets(['a:9464', 'b:9000'], 3) == ['a:9464', 'a:9465', 'a:9466', 'b:9000', 'b:9001', 'b:9002']
@@ -0,0 +1,89 @@
+import json
+import signal
+
+import pytest
+from nameko.rpc import rpc
+from nameko.testing.services import entrypoint_hook
+
+from namekoplus.chassis.tracing import SAMPLED_CONTEXT_KEY, SampledTracer, dump_traces
+
+
+class TracedService:
+    name = 'traced'
+
+    tracer = SampledTracer(sample_rate=0.0, slow_threshold=10, ring_size=3, include_args=True)
+
+    @rpc(sensitive_arguments=['password'])
+    def login(self, user, password):
+        return user
+
+    @rpc
+    def fail(self):
+        raise ValueError('boom')
+
+
+@pytest.fixture
+def container(memory_broker, container_factory):
+    container = container_factory(TracedService)
+    container.start()
+    return container
+
+
+def tracer(container):
+    return next(dependency for dependency in container.dependencies if isinstance(dependency, SampledTracer))
+
+
+def call(container, method_name, *args, context_data=None):
+    with entrypoint_hook(container, method_name, context_data=context_data) as entrypoint:
+        return entrypoint(*args)
+
+
+def kept(caplog):
+    return [json.loads(record.getMessage()) for record in caplog.records if record.name == 'namekoplus.chassis.tracing']
+
+
+def test_ring_buffer_keeps_the_most_recent_calls(container, caplog):
+    for user in ('a', 'b', 'c', 'd'):
+        call(container, 'login', user, 'secret')
+
+    recent = list(tracer(container).recent)
+    assert len(recent) == 3
+    assert {record['entrypoint'] for record in recent} == {'login'}
+    assert all(record['status'] == 'ok' for record in recent)
+    # None of them was sampled, failed or slow
+    assert kept(caplog) == []
+
+
+def test_errors_are_always_kept(container, caplog):
+    with caplog.at_level('INFO'), pytest.raises(ValueError):
+        call(container, 'fail')
+
+    record, = kept(caplog)
+    assert record['kept'] == 'error'
+    assert record['error'] == 'ValueError: boom'
+
+
+def test_sampling_decision_comes_with_the_call(container, caplog):
+    with caplog.at_level('INFO'):
+        call(container, 'login', 'a', 'secret', context_data={SAMPLED_CONTEXT_KEY: '1'})
+
+    record, = kept(caplog)
+    assert record['kept'] == 'sampled'
+    assert record['args']['user'] == 'a'
+    assert record['args']['password'] == '********'
+
+
+def test_dump_traces(container, tmp_path):
+    call(container, 'login', 'a', 'secret')
+    path = tmp_path / 'traces.jsonl'
+
+    assert dump_traces(str(path)) >= 1
+    records = [json.loads(line) for line in path.read_text().splitlines()]
+    assert records[-1]['service'] == 'traced'
+
+
+def test_no_signal_handler_by_default(memory_broker, container_factory):
+    handler = signal.getsignal(signal.SIGUSR2)
+    container_factory(TracedService).start()
+
+    assert signal.getsignal(signal.SIGUSR2) is handler
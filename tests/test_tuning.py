@@ -0,0 +1,118 @@
+import pytest
+from nameko.rpc import Rpc, rpc
+from nameko.testing.utils import get_extension
+
+from namekoplus.chassis.tuning import WorkloadTuner
+
+
+class FakePool:
+    def __init__(self, size):
+        self.size = size
+
+    def resize(self, size):
+        self.size = size
+
+
+class FakeContainer:
+    service_name = 'service'
+
+    def __init__(self, max_workers):
+        self.max_workers = max_workers
+        self._worker_pool = FakePool(max_workers)
+
+
+@pytest.fixture
+def tuner():
+    tuner = WorkloadTuner(min_workers=2, max_workers=40, step=0.25, prefetch_ratio=2.0)
+    tuner.container = FakeContainer(max_workers=10)
+    return tuner
+
+
+def window(tuner, latency=0.01, wait=0.0, utilization=0.5):
+    tuner.window.latencies, tuner.window.completed = latency * 10, 10
+    tuner.window.waits, tuner.window.spawned = wait * 10, 10
+    tuner.window.busy, tuner.window.samples = utilization * 20, 20
+
+
+def test_grows_when_calls_wait_for_workers(tuner):
+    window(tuner, wait=0.05)
+    target, reason = tuner.tune()
+
+    assert target == 12
+    assert tuner.container.max_workers == tuner.container._worker_pool.size == 12
+    assert tuner.pending_prefetch == 24
+    assert 'waited' in reason
+
+
+def test_grows_when_busy(tuner):
+    window(tuner, utilization=0.9)
+    assert tuner.tune()[0] == 12
+
+
+def test_shrinks_when_latency_climbs(tuner):
+    window(tuner, latency=0.01)
+    tuner.tune()
+    window(tuner, latency=0.05, wait=0.05)
+
+    target, reason = tuner.tune()
+    assert target == 8
+    assert 'baseline' in reason
+
+
+def test_shrinks_slowly_when_idle(tuner):
+    window(tuner, utilization=0.1)
+    assert tuner.tune()[0] == 9
+
+
+def test_stays_within_bounds(tuner):
+    tuner.container = FakeContainer(max_workers=2)
+    window(tuner, utilization=0.0)
+    assert tuner.tune() == (2, None)
+
+    tuner.container = FakeContainer(max_workers=40)
+    window(tuner, wait=1.0)
+    assert tuner.tune()[0] == 40
+
+
+class FakeWorkerContext:
+    pass
+
+
+def test_counts_busy_workers_until_their_thread_exits(tuner):
+    first, second = FakeWorkerContext(), FakeWorkerContext()
+    tuner.worker_setup(first)
+    tuner.worker_setup(second)
+    tuner.worker_teardown(first)
+    assert tuner.busy == 2
+    assert tuner.window.completed == 1
+
+    tuner._exited(first)
+    tuner._exited(second)
+    assert tuner.busy == 0
+    assert len(tuner.started) == 0
+
+
+class TunedService:
+    name = 'tuned'
+
+    tuner = WorkloadTuner(interval=60)
+
+    @rpc
+    def work(self):
+        pass
+
+
+def test_workers_whose_teardown_is_skipped_are_not_busy(memory_broker, container_factory):
+    container = container_factory(TunedService)
+    container.start()
+    entrypoint = get_extension(container, Rpc, method_name='work')
+    tuner = get_extension(container, WorkloadTuner)
+
+    def handle_result(worker_ctx, result, exc_info):
+        raise RuntimeError('reply failed')
+
+    container.spawn_worker(entrypoint, (), {}, handle_result=handle_result)
+    with pytest.raises(RuntimeError):
+        container.wait()
+    assert tuner.busy == 0
+    assert len(tuner.started) == 0